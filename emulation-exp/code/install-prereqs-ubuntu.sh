@@ -13,7 +13,7 @@ apt install -y git \
                wget \
                python3-pip
 
-pip3 install tqdm
+pip3 install numpy
 
 NGINX_VERSION=1.17.5
 CMAKE_VERSION=3.18
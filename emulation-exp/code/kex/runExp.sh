@@ -8,4 +8,4 @@ ROOT="$(dirname $(pwd))"
 NGINX_APP=${ROOT}/tmp/nginx/sbin/nginx
 NGINX_CONF_DIR=${ROOT}/tmp/nginx/conf
 
-sudo python3 ${ROOT}/kex/experiment_mn.py ${NGINX_APP} ${NGINX_CONF_DIR}/nginx.conf
\ No newline at end of file
+sudo python3 ${ROOT}/kex/experiment_mn.py ${NGINX_APP} ${NGINX_CONF_DIR}/nginx.conf "$@"
\ No newline at end of file
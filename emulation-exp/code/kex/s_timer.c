@@ -7,18 +7,260 @@
  * https://www.openssl.org/source/license.html
  */
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
 
 #include <openssl/ssl.h>
 #include <openssl/err.h>
 
 #include <time.h>
+#include <sys/socket.h>
+#include <sys/time.h>
+#include <errno.h>
+#include <poll.h>
 
 #define NS_IN_MS 1000000.0
 #define MS_IN_S 1000
+#define CMD_MAX 256
+#define TICKET_TIMEOUT_MS 10000
+#define MAX_ATTEMPTS 10
+/* Request sent as 0-RTT early data */
+#define EARLY_DATA "GET / HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+/* Handshake milestones reported in worker mode, in milliseconds since the
+ * start of the handshake, or -1 if the message was never seen */
+enum phase
+{
+    PHASE_TCP_CONNECT,        /* TCP connection established */
+    PHASE_CLIENT_HELLO,       /* ClientHello sent */
+    PHASE_SERVER_HELLO,       /* ServerHello received */
+    PHASE_CERTIFICATE,        /* server Certificate received */
+    PHASE_CERTIFICATE_VERIFY, /* server CertificateVerify received */
+    PHASE_FINISHED,           /* client Finished sent */
+    NUM_PHASES
+};
+
+struct phase_times
+{
+    struct timespec start;
+    double ms[NUM_PHASES];
+};
+
+/* Handshake types: a batch asks for a mix of the first NUM_MIX_TYPES, every
+ * reported handshake is tagged with the type the server agreed to */
+enum handshake_type
+{
+    TYPE_FULL,           /* certificate-authenticated handshake */
+    TYPE_RESUMED,        /* PSK resumption from the latest session ticket */
+    TYPE_EARLY,          /* resumption with the request sent as 0-RTT early data */
+    TYPE_EARLY_REJECTED, /* resumed, but the early data was not accepted */
+    TYPE_FALLBACK,       /* a ticket was offered, the server did a full handshake */
+    NUM_TYPES
+};
+#define NUM_MIX_TYPES (TYPE_EARLY + 1)
+
+static const char* type_names[NUM_TYPES] = { "full", "resumed", "early", "early_rejected", "fallback" };
+
+/* Latest session ticket of the loaded SSL_CTX, kept by new_session_cb */
+static SSL_SESSION* latest_ticket;
+static unsigned long tickets_received;
+
+static double elapsed_ms(const struct timespec* start)
+{
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC_RAW, &now);
+    return ((now.tv_sec - start->tv_sec) * MS_IN_S) + ((now.tv_nsec - start->tv_nsec) / NS_IN_MS);
+}
+
+/* Wait until fd is readable (or writable), giving up timeout_ms after
+ * start; a timeout_ms of 0 waits for as long as it takes. Returns 0 on
+ * timeout. */
+static int wait_socket(int fd, int want_write, const struct timespec* start, double timeout_ms)
+{
+    struct pollfd pfd = {.fd = fd, .events = want_write ? POLLOUT : POLLIN};
+    int ret;
+
+    do
+    {
+        int wait_ms = -1;
+        if (timeout_ms > 0)
+        {
+            double left_ms = timeout_ms - elapsed_ms(start);
+            if (left_ms <= 0)
+            {
+                return 0;
+            }
+            wait_ms = (int)left_ms + 1;
+        }
+        ret = poll(&pfd, 1, wait_ms);
+    } while (ret < 0 && errno == EINTR);
+    /* On a poll error the next SSL call reports what went wrong */
+    return ret != 0;
+}
+
+/* Wait for the socket after a non-blocking SSL call returned ret. Returns 0
+ * and sets the error class if the handshake failed or ran out of time. */
+static int wait_ssl(SSL* ssl, int ret, const struct timespec* start, double timeout_ms, const char** error)
+{
+    int err = SSL_get_error(ssl, ret);
+    if (err != SSL_ERROR_WANT_READ && err != SSL_ERROR_WANT_WRITE)
+    {
+        ERR_print_errors_fp(stderr);
+        *error = err == SSL_ERROR_SSL ? "SSLError" : "ConnectionError";
+        return 0;
+    }
+    if (!wait_socket(SSL_get_fd(ssl), err == SSL_ERROR_WANT_WRITE, start, timeout_ms))
+    {
+        *error = "TimeoutError";
+        return 0;
+    }
+    return 1;
+}
+
+static void mark_phase(struct phase_times* times, enum phase phase)
+{
+    /* Keep the first occurrence, e.g. the ClientHello before a HelloRetryRequest */
+    if (times && times->ms[phase] < 0)
+    {
+        times->ms[phase] = elapsed_ms(&times->start);
+    }
+}
+
+/* OpenSSL message callback, called for every handshake message sent or
+ * received (after decryption for the encrypted TLS 1.3 flight) */
+static void phase_msg_cb(int write_p, int version, int content_type, const void* buf,
+                         size_t len, SSL* ssl, void* arg)
+{
+    const unsigned char* msg = buf;
+    struct phase_times* times = arg;
+    (void)version;
+    (void)ssl;
+
+    if (content_type != SSL3_RT_HANDSHAKE || len < 1)
+    {
+        return;
+    }
+
+    switch (msg[0])
+    {
+    case SSL3_MT_CLIENT_HELLO:
+        if (write_p)
+        {
+            mark_phase(times, PHASE_CLIENT_HELLO);
+        }
+        break;
+    case SSL3_MT_SERVER_HELLO:
+        if (!write_p)
+        {
+            mark_phase(times, PHASE_SERVER_HELLO);
+        }
+        break;
+    case SSL3_MT_CERTIFICATE:
+        if (!write_p)
+        {
+            mark_phase(times, PHASE_CERTIFICATE);
+        }
+        break;
+    case SSL3_MT_CERTIFICATE_VERIFY:
+        if (!write_p)
+        {
+            mark_phase(times, PHASE_CERTIFICATE_VERIFY);
+        }
+        break;
+    case SSL3_MT_FINISHED:
+        if (write_p)
+        {
+            mark_phase(times, PHASE_FINISHED);
+        }
+        break;
+    default:
+        break;
+    }
+}
+
+static int new_session_cb(SSL* ssl, SSL_SESSION* session)
+{
+    (void)ssl;
+    SSL_SESSION_free(latest_ticket);
+    latest_ticket = session;
+    tickets_received++;
+    /* Keep the reference */
+    return 1;
+}
+
+/* TLS 1.3 tickets arrive after the handshake, so they are read after the
+ * timed part. Returns 1 once new_session_cb stored a new ticket. */
+static int fetch_ticket(SSL* ssl)
+{
+    char buf[4096];
+    struct timespec start;
+    struct timeval poll_timeout = {.tv_sec = 0, .tv_usec = 100000};
+    unsigned long seen = tickets_received;
+    int fd = SSL_get_fd(ssl);
+
+    clock_gettime(CLOCK_MONOTONIC_RAW, &start);
+    (void)setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, (char*)&poll_timeout, sizeof(poll_timeout));
+    /* Return from SSL_read after every record instead of waiting for application data */
+    SSL_clear_mode(ssl, SSL_MODE_AUTO_RETRY);
+    while (tickets_received == seen && elapsed_ms(&start) < TICKET_TIMEOUT_MS)
+    {
+        int ret = SSL_read(ssl, buf, sizeof(buf));
+        if (ret <= 0 && SSL_get_error(ssl, ret) != SSL_ERROR_WANT_READ)
+        {
+            break;
+        }
+    }
+    ERR_clear_error();
+    return tickets_received != seen;
+}
+
+static enum handshake_type handshake_outcome(SSL* ssl, int offered_ticket, int early_data)
+{
+    if (!offered_ticket)
+    {
+        return TYPE_FULL;
+    }
+    if (!SSL_session_reused(ssl))
+    {
+        return TYPE_FALLBACK;
+    }
+    if (!early_data)
+    {
+        return TYPE_RESUMED;
+    }
+    return SSL_get_early_data_status(ssl) == SSL_EARLY_DATA_ACCEPTED ? TYPE_EARLY : TYPE_EARLY_REJECTED;
+}
+
+/* Type of the next handshake of a batch, chosen so that every prefix of the
+ * batch follows the mix as closely as possible */
+static enum handshake_type next_type(const unsigned* mix, const size_t* done, size_t measurements)
+{
+    unsigned total = 0;
+    enum handshake_type next = TYPE_FULL;
+    double max_deficit = -1;
+
+    for (int t = 0; t < NUM_MIX_TYPES; t++)
+    {
+        total += mix[t];
+    }
+    for (int t = 0; t < NUM_MIX_TYPES; t++)
+    {
+        double deficit = (double)mix[t] * (measurements + 1) / total - done[t];
+        if (mix[t] > 0 && deficit > max_deficit)
+        {
+            max_deficit = deficit;
+            next = t;
+        }
+    }
+    return next;
+}
 
 const char* host = "10.0.0.1:4433";
 
-SSL* do_tls_handshake(SSL_CTX* ssl_ctx)
+/* Connect and run the TLS handshake, giving up timeout_ms after start (0:
+ * never). On failure returns NULL and sets error to the failure's class. */
+SSL* do_tls_handshake(SSL_CTX* ssl_ctx, struct phase_times* times, SSL_SESSION* session,
+                      int early_data, const struct timespec* start, double timeout_ms, const char** error)
 {
     BIO* conn;
     SSL* ssl;
@@ -27,24 +269,70 @@ SSL* do_tls_handshake(SSL_CTX* ssl_ctx)
     conn = BIO_new(BIO_s_connect());
     if (!conn)
     {
+        *error = "OSError";
         return 0;
     }
 
     BIO_set_conn_hostname(conn, host);
     BIO_set_conn_mode(conn, BIO_SOCK_NODELAY);
+    /* Non-blocking, so that a handshake lost in retransmissions can be abandoned */
+    BIO_set_nbio(conn, 1);
+
+    /* Connect first so that the TCP handshake can be timed on its own */
+    while (BIO_do_connect(conn) <= 0)
+    {
+        if (!BIO_should_retry(conn))
+        {
+            ERR_print_errors_fp(stderr);
+            BIO_free_all(conn);
+            *error = "ConnectError";
+            return 0;
+        }
+        if (!wait_socket(BIO_get_fd(conn, 0), 1, start, timeout_ms))
+        {
+            ERR_clear_error();
+            BIO_free_all(conn);
+            *error = "TimeoutError";
+            return 0;
+        }
+    }
+    mark_phase(times, PHASE_TCP_CONNECT);
 
     ssl = SSL_new(ssl_ctx);
 
     SSL_set_bio(ssl, conn, conn);
+    SSL_set_msg_callback(ssl, phase_msg_cb);
+    SSL_set_msg_callback_arg(ssl, times);
+    if (session)
+    {
+        SSL_set_session(ssl, session);
+    }
+
+    /* With 0-RTT the request leaves together with the ClientHello */
+    if (early_data && session && SSL_SESSION_get_max_early_data(session) > 0)
+    {
+        size_t written;
+        while ((ret = SSL_write_early_data(ssl, EARLY_DATA, strlen(EARLY_DATA), &written)) <= 0)
+        {
+            if (!wait_ssl(ssl, ret, start, timeout_ms, error))
+            {
+                SSL_free(ssl);
+                return 0;
+            }
+        }
+    }
 
     /* ok, lets connect */
-    ret = SSL_connect(ssl);
-    if (ret <= 0)
+    while ((ret = SSL_connect(ssl)) <= 0)
     {
-        ERR_print_errors_fp(stderr);
-        SSL_free(ssl);
-        return 0;
+        if (!wait_ssl(ssl, ret, start, timeout_ms, error))
+        {
+            SSL_free(ssl);
+            return 0;
+        }
     }
+    /* Blocking again for fetch_ticket */
+    BIO_socket_nbio(SSL_get_fd(ssl), 0);
 
 #if defined(SOL_SOCKET) && defined(SO_LINGER)
     {
@@ -60,30 +348,16 @@ SSL* do_tls_handshake(SSL_CTX* ssl_ctx)
     return ssl;
 }
 
-int main(int argc, char* argv[])
+SSL_CTX* new_ssl_ctx(const char* kex_alg)
 {
-    int ret = -1;
-    SSL_CTX* ssl_ctx = 0;
-    if(argc != 3)
-    {
-        fprintf(stderr, "Wrong number of arguments.\n");
-        goto end;
-    }
-    const char* kex_alg = argv[1];
-    const size_t measurements_to_make = strtol(argv[2], 0, 10);
-    size_t measurements = 0;
-
+    int ret;
     const char* ciphersuites = "TLS_AES_256_GCM_SHA384";
     const SSL_METHOD* ssl_meth = TLS_client_method();
-    SSL* ssl = NULL;
-
-    struct timespec start, finish;
-    double* handshake_times_ms = malloc(measurements_to_make * sizeof(*handshake_times_ms));
 
-    ssl_ctx = SSL_CTX_new(ssl_meth);
+    SSL_CTX* ssl_ctx = SSL_CTX_new(ssl_meth);
     if (!ssl_ctx)
     {
-        goto ossl_error;
+        return 0;
     }
 
     SSL_CTX_set_mode(ssl_ctx, SSL_MODE_AUTO_RETRY);
@@ -92,60 +366,325 @@ int main(int argc, char* argv[])
     ret = SSL_CTX_set_min_proto_version(ssl_ctx, TLS1_3_VERSION);
     if (ret != 1)
     {
-        goto ossl_error;
+        goto err;
     }
 
     ret = SSL_CTX_set_max_proto_version(ssl_ctx, TLS1_3_VERSION);
     if (ret != 1)
     {
-        goto ossl_error;
+        goto err;
     }
 
     SSL_CTX_set_options(ssl_ctx, SSL_OP_NO_COMPRESSION);
 
+    /* Session tickets go to new_session_cb for resumed handshakes */
+    SSL_CTX_set_session_cache_mode(ssl_ctx, SSL_SESS_CACHE_CLIENT | SSL_SESS_CACHE_NO_INTERNAL_STORE);
+    SSL_CTX_sess_set_new_cb(ssl_ctx, new_session_cb);
+
     ret = SSL_CTX_set_ciphersuites(ssl_ctx, ciphersuites);
     if (ret != 1)
     {
-        goto ossl_error;
+        goto err;
     }
     ret = SSL_CTX_set1_groups_list(ssl_ctx, kex_alg);
     if (ret != 1)
     {
-        goto ossl_error;
+        goto err;
     }
 
     ret = SSL_CTX_load_verify_locations(ssl_ctx, "../tmp/nginx/conf/CA.crt", 0);
     if(ret != 1)
     {
-        goto ossl_error;
+        goto err;
     }
     SSL_CTX_set_verify(ssl_ctx, SSL_VERIFY_PEER, NULL);
+    return ssl_ctx;
 
-    while(measurements < measurements_to_make)
+err:
+    SSL_CTX_free(ssl_ctx);
+    return 0;
+}
+
+/* Returns 1 and sets handshake_time_ms on success, 0 if the
+ * handshake should be retried and -1 on an unrecoverable error.
+ * A failed attempt also sets handshake_time_ms, to the time until it
+ * failed, and error (if not NULL) to its class. timeout_ms bounds the
+ * attempt, 0 means no bound.
+ * times may be NULL; otherwise it receives the phase timestamps.
+ * TYPE_RESUMED and TYPE_EARLY offer latest_ticket, outcome (if not NULL)
+ * receives the type of handshake the server agreed to, and with
+ * want_ticket the next session ticket is read after the timed part. */
+int measure_handshake(SSL_CTX* ssl_ctx, double* handshake_time_ms, struct phase_times* times,
+                      enum handshake_type type, int want_ticket, enum handshake_type* outcome,
+                      double timeout_ms, const char** error)
+{
+    struct timespec start, finish;
+    const char* failure = "OSError";
+    SSL* ssl;
+    SSL_SESSION* session = type == TYPE_FULL ? 0 : latest_ticket;
+
+    clock_gettime(CLOCK_MONOTONIC_RAW, &start);
+    if (times)
+    {
+        times->start = start;
+        for (int i = 0; i < NUM_PHASES; i++)
+        {
+            times->ms[i] = -1;
+        }
+    }
+    ssl = do_tls_handshake(ssl_ctx, times, session, type == TYPE_EARLY, &start, timeout_ms, &failure);
+    clock_gettime(CLOCK_MONOTONIC_RAW, &finish);
+    *handshake_time_ms = ((finish.tv_sec - start.tv_sec) * MS_IN_S) + ((finish.tv_nsec - start.tv_nsec) / NS_IN_MS);
+    if (!ssl)
+    {
+        /* Retry since at high packet loss rates,
+         * the connect() syscall fails sometimes
+         * and handshakes run into the timeout.
+         * The caller reports every failed attempt */
+        if (error)
+        {
+            *error = failure;
+        }
+        return 0;
+    }
+    if (outcome)
+    {
+        *outcome = handshake_outcome(ssl, session != 0, type == TYPE_EARLY);
+    }
+    if (want_ticket && !fetch_ticket(ssl))
+    {
+        fprintf(stderr, "No session ticket within %d ms\n", TICKET_TIMEOUT_MS);
+    }
+
+    SSL_set_shutdown(ssl, SSL_SENT_SHUTDOWN | SSL_RECEIVED_SHUTDOWN);
+    if (BIO_closesocket(SSL_get_fd(ssl)) == -1)
+    {
+        SSL_free(ssl);
+        return -1;
+    }
+
+    SSL_free(ssl);
+    return 1;
+}
+
+/* Worker mode: keep the process (and one SSL_CTX per algorithm) alive,
+ * read "<kex_alg> <count> [mix=<full>,<resumed>,<early>] [timeout=<ms>]
+ * [budget=<ms>] [attempts=<n>]" commands from stdin and stream one
+ * "<index>,<ms>,<phase ms>...,<handshake type>" line per handshake (see
+ * enum phase and type_names). Every failed attempt is reported as
+ * "FAIL <index>,<ms>,<error class>,<attempt>" before it is retried. The
+ * batch is followed by "END retries=<n> budget_exhausted=<0|1> gave_up=<0|1>"
+ * once it is complete, n counting the attempts that were retried. The optional mix
+ * weighs the handshake types of the batch, e.g. mix=70,20,10; the default is
+ * full handshakes only. timeout bounds every attempt, and budget the whole
+ * batch, which ends early once the budget is spent. A handshake gets at most
+ * attempts tries (MAX_ATTEMPTS by default, 0 for no limit), after which the
+ * batch ends early too. A batch that cannot be completed ends with
+ * "ERR <reason>". */
+int run_worker(void)
+{
+    char line[CMD_MAX];
+    char kex_alg[CMD_MAX];
+    char loaded_alg[CMD_MAX] = { 0 };
+    size_t measurements_to_make;
+    double handshake_time_ms;
+    struct phase_times times;
+    SSL_CTX* ssl_ctx = 0;
+    enum handshake_type outcome;
+    const char* error = 0;
+    int ret;
+
+    while (fgets(line, sizeof(line), stdin))
     {
-        clock_gettime(CLOCK_MONOTONIC_RAW, &start);
-        ssl = do_tls_handshake(ssl_ctx);
-        clock_gettime(CLOCK_MONOTONIC_RAW, &finish);
-        if (!ssl)
+        unsigned mix[NUM_MIX_TYPES] = { 1, 0, 0 };
+        size_t done[NUM_MIX_TYPES] = { 0 };
+        double timeout_ms = 0;
+        double budget_ms = 0;
+        size_t max_attempts = MAX_ATTEMPTS;
+        int consumed = 0;
+        int bad = sscanf(line, "%255s %zu%n", kex_alg, &measurements_to_make, &consumed) != 2;
+        for (char* option = strtok(line + consumed, " \n"); option && !bad; option = strtok(0, " \n"))
         {
-            /* Retry since at high packet loss rates,
-             * the connect() syscall fails sometimes.
-             * Non-retryable errors are caught by manual
-             * inspection of logs, which has sufficed
-             * for our purposes */
+            if (strncmp(option, "mix=", 4) == 0)
+            {
+                bad = sscanf(option + 4, "%u,%u,%u", &mix[TYPE_FULL], &mix[TYPE_RESUMED], &mix[TYPE_EARLY]) != 3;
+            }
+            else if (strncmp(option, "timeout=", 8) == 0)
+            {
+                bad = sscanf(option + 8, "%lf", &timeout_ms) != 1 || timeout_ms < 0;
+            }
+            else if (strncmp(option, "budget=", 7) == 0)
+            {
+                bad = sscanf(option + 7, "%lf", &budget_ms) != 1 || budget_ms < 0;
+            }
+            else if (strncmp(option, "attempts=", 9) == 0)
+            {
+                bad = sscanf(option + 9, "%zu", &max_attempts) != 1;
+            }
+            else
+            {
+                bad = 1;
+            }
+        }
+        if (bad || mix[TYPE_FULL] + mix[TYPE_RESUMED] + mix[TYPE_EARLY] == 0)
+        {
+            printf("ERR bad command\n");
+            fflush(stdout);
             continue;
         }
 
-        SSL_set_shutdown(ssl, SSL_SENT_SHUTDOWN | SSL_RECEIVED_SHUTDOWN);
-        ret = BIO_closesocket(SSL_get_fd(ssl));
-        if(ret == -1)
+        if (!ssl_ctx || strcmp(kex_alg, loaded_alg) != 0)
         {
-            goto ossl_error;
+            SSL_CTX_free(ssl_ctx);
+            SSL_SESSION_free(latest_ticket);
+            latest_ticket = 0;
+            loaded_alg[0] = '\0';
+            ssl_ctx = new_ssl_ctx(kex_alg);
+            if (!ssl_ctx)
+            {
+                ERR_print_errors_fp(stderr);
+                printf("ERR cannot configure %s\n", kex_alg);
+                fflush(stdout);
+                continue;
+            }
+            snprintf(loaded_alg, sizeof(loaded_alg), "%s", kex_alg);
         }
 
-        SSL_free(ssl);
+        /* Every handshake fetches a fresh ticket once resumptions are asked for */
+        int resuming = mix[TYPE_RESUMED] + mix[TYPE_EARLY] > 0;
+        int no_ticket = 0;
+        size_t measurements = 0;
+        size_t retries = 0;
+        size_t attempt = 1;
+        int exhausted = 0;
+        int gave_up = 0;
+        struct timespec batch_start;
+        clock_gettime(CLOCK_MONOTONIC_RAW, &batch_start);
+        while (measurements < measurements_to_make)
+        {
+            if (max_attempts > 0 && attempt > max_attempts)
+            {
+                gave_up = 1;
+                break;
+            }
+            /* An attempt gets at most what is left of the budget */
+            double deadline_ms = timeout_ms;
+            if (budget_ms > 0)
+            {
+                double left_ms = budget_ms - elapsed_ms(&batch_start);
+                if (left_ms <= 0)
+                {
+                    exhausted = 1;
+                    break;
+                }
+                if (deadline_ms == 0 || left_ms < deadline_ms)
+                {
+                    deadline_ms = left_ms;
+                }
+            }
+            enum handshake_type type = next_type(mix, done, measurements);
+            if (type != TYPE_FULL && !latest_ticket)
+            {
+                /* The first resumption of an algorithm needs the ticket of an untimed full handshake */
+                ret = measure_handshake(ssl_ctx, &handshake_time_ms, 0, TYPE_FULL, 1, 0, deadline_ms, &error);
+                if (ret < 0 || (ret == 1 && !latest_ticket))
+                {
+                    no_ticket = ret == 1;
+                    break;
+                }
+                if (ret == 0)
+                {
+                    /* A failed ticket fetch counts as an attempt at the handshake it is for */
+                    printf("FAIL %zu,%f,%s,%zu\n", measurements, handshake_time_ms, error, attempt);
+                    fflush(stdout);
+                    retries++;
+                    attempt++;
+                }
+                continue;
+            }
+            ret = measure_handshake(ssl_ctx, &handshake_time_ms, &times, type, resuming, &outcome,
+                                    deadline_ms, &error);
+            if (ret < 0)
+            {
+                break;
+            }
+            if (ret == 0)
+            {
+                printf("FAIL %zu,%f,%s,%zu\n", measurements, handshake_time_ms, error, attempt);
+                fflush(stdout);
+                retries++;
+                attempt++;
+                continue;
+            }
+            printf("%zu,%f", measurements, handshake_time_ms);
+            for (int i = 0; i < NUM_PHASES; i++)
+            {
+                printf(",%f", times.ms[i]);
+            }
+            printf(",%s\n", type_names[outcome]);
+            fflush(stdout);
+            done[type]++;
+            measurements++;
+            attempt = 1;
+        }
+
+        if (no_ticket)
+        {
+            printf("ERR server sent no session ticket\n");
+        }
+        else if (measurements < measurements_to_make && !exhausted && !gave_up)
+        {
+            ERR_print_errors_fp(stderr);
+            printf("ERR unrecoverable OpenSSL error\n");
+        }
+        else
+        {
+            printf("END retries=%zu budget_exhausted=%d gave_up=%d\n", retries, exhausted, gave_up);
+        }
+        fflush(stdout);
+    }
 
-        handshake_times_ms[measurements] = ((finish.tv_sec - start.tv_sec) * MS_IN_S) + ((finish.tv_nsec - start.tv_nsec) / NS_IN_MS);
+    SSL_CTX_free(ssl_ctx);
+    SSL_SESSION_free(latest_ticket);
+    return 0;
+}
+
+int main(int argc, char* argv[])
+{
+    int ret = -1;
+    SSL_CTX* ssl_ctx = 0;
+    if (argc == 2 && strcmp(argv[1], "--worker") == 0)
+    {
+        return run_worker();
+    }
+    if(argc != 3)
+    {
+        fprintf(stderr, "Wrong number of arguments.\n");
+        goto end;
+    }
+    const char* kex_alg = argv[1];
+    const size_t measurements_to_make = strtol(argv[2], 0, 10);
+    size_t measurements = 0;
+
+    double* handshake_times_ms = malloc(measurements_to_make * sizeof(*handshake_times_ms));
+
+    ssl_ctx = new_ssl_ctx(kex_alg);
+    if (!ssl_ctx)
+    {
+        goto ossl_error;
+    }
+
+    while(measurements < measurements_to_make)
+    {
+        ret = measure_handshake(ssl_ctx, &handshake_times_ms[measurements], 0, TYPE_FULL, 0, 0, 0, 0);
+        if (ret < 0)
+        {
+            goto ossl_error;
+        }
+        if (ret == 0)
+        {
+            continue;
+        }
         measurements++;
     }
 
@@ -160,6 +699,7 @@ int main(int argc, char* argv[])
     goto end;
 
 ossl_error:
+    ret = -1;
     fprintf(stderr, "Unrecoverable OpenSSL error.\n");
     ERR_print_errors_fp(stderr);
 end:
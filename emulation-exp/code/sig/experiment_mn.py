@@ -1,115 +1,441 @@
+import argparse
 import csv
-from multiprocessing import Pool
+import math
 from mininet.net import Mininet
-from mininet.node import Host
 from mininet.link import TCLink
-from mininet.topo import Topo
-from tqdm import tqdm
+import numpy as np
 import os
 import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils"))
+from adaptive import StoppingLog, StoppingRule  # noqa: E402
+from capture import PacketCapture, flow_columns, handshake_flows  # noqa: E402
+from catalog import RunCatalog, build_versions  # noqa: E402
+from cpu_account import parse_cpus  # noqa: E402
+from manifest import open_run  # noqa: E402
+from metrics import METRICS_PORT, CampaignMetrics, MetricsServer  # noqa: E402
+from mn_pairs import (PairTopo, get_pairs, run_grid, setup_pairs, start_cpu_accounting, start_workers,  # noqa: E402
+                      stop_workers)
+from link_control import Netem  # noqa: E402
+from link_trace import TraceReplay, load_trace, state_netem, trace_duration  # noqa: E402
+from load_gen import LoadGenError, check_group, rate_sweep, saturation_point  # noqa: E402
+from result_store import ResultStore, parse_rtt_str  # noqa: E402
+from rtt_probe import RttMonitor, probe_rtt, rtt_label  # noqa: E402
+from timer_worker import (WORKER_COMMAND, BatchLog, attempt_columns, full_handshake_ms,  # noqa: E402
+                          handshake_type_columns, parse_mix, phase_columns)
 
 MEASUREMENTS_PER_TIMER = 100     # 10
 TIMERS = 10                    # 4
-# POOL_SIZE = 4
-server, client = None, None
-
-def change_qdisc(host, intf, pkt_loss, delay, bandwidth):
-    """Apply packet loss and delay using NetEm in Mininet."""
-    command = (
-        f"tc qdisc change dev {intf} root netem "
-        f"limit 1000 delay {delay} rate {bandwidth}mbit"
-    )
-    if pkt_loss > 0:
-        command += f" loss {pkt_loss}%"
-    print(f"{host.name}: {command}")
-    host.cmd(command)
-
-def time_handshake(sig_alg, measurements):
-    """Run handshake timing test from a Mininet host."""
-    command = f"./s_timer.o {sig_alg} {measurements}"
-    result = client.cmd(command)
-    result = result.replace("\r", "")
-    result = result.replace("\n", "")
-    
-    return [float(i) for i in result.split(",") if i != ""]
-
-def run_timers(sig_alg):
-    """Run multiple timer measurements for a key exchange algorithm sequentially."""
-    results = []
-    for _ in tqdm(range(TIMERS), desc="Running timers"):
-        results.extend(time_handshake(sig_alg, MEASUREMENTS_PER_TIMER))
+
+LATENCIES = ["2.684ms", "15.458ms", "39.224ms", "97.73ms", "297.73ms"]
+PKT_LOSSES = [0, 0.1, 0.5, 1, 1.5, 2, 2.5, 3] + list(range(4, 21))
+CLIENT_BANDWIDTH = 100  # 100 Mbps DL
+SERVER_BANDWIDTH = 20  # 20 Mbps UL
+
+LOAD_GEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils", "load_gen.py")
+
+def configure_pair(pair, pkt_loss, latency_ms):
+    """Apply the same loss and delay to both ends of a pair's link.
+
+    Both netem qdiscs are changed at once and read back, so a link that did
+    not take the settings raises LinkConfigError. Returns the seconds spent.
+    """
+    delay_ms = float(latency_ms.replace("ms", ""))
+    netems = [
+        Netem(delay_ms, pkt_loss, CLIENT_BANDWIDTH),
+        Netem(delay_ms, pkt_loss, SERVER_BANDWIDTH),
+    ]
+    elapsed = pair.link.apply(netems)
+    metrics.set_link(pair.index, netems)
+    if elapsed:
+        print(f"{pair}: netem delay {latency_ms} loss {pkt_loss}% set in {elapsed * 1000:.0f} ms")
+    return elapsed
+
+def time_handshake(pair, sig_alg, measurements, pcap_path=None):
+    """Stream one batch of handshake records from a pair's s_timer worker.
+
+    With a pcap_path the batch is captured on the client interface and the
+    packet metrics of every handshake are returned with the records; the
+    number of records and flows that could not be matched go in the batch log.
+    """
+    if pcap_path is None:
+        with pair.cpu:
+            records = list(pair.worker.measure(sig_alg, measurements, mix=args.mix, **deadlines))
+        return records, {}
+    with PacketCapture(pair.client_intf, pcap_path, popen=pair.client.popen), pair.cpu:
+        records = list(pair.worker.measure(sig_alg, measurements, mix=args.mix, **deadlines))
+    flows, unmatched = flow_columns(records, handshake_flows(pcap_path))
+    pair.worker.last_batch.update(unmatched)
+    if not args.keep_pcap:
+        os.remove(pcap_path)
+    return records, flows
+
+def run_timers(pair, sig_alg, on_batch=None, stopping_rule=None, results=None, first_timer=0,
+               pcap_prefix=None):
+    """Run multiple timer measurements for a signature algorithm sequentially on one pair.
+
+    results may hold the samples of batches checkpointed by an earlier attempt
+    at the same cell, in which case measuring continues with batch first_timer.
+    With a pcap_prefix every batch is captured to <pcap_prefix>_<timer>.pcap.
+    """
+    results = [] if results is None else results
+    timers = TIMERS
+    if stopping_rule is not None:
+        timers = math.ceil(stopping_rule.max_samples / MEASUREMENTS_PER_TIMER)
+    for timer in range(first_timer, timers):
+        if stopping_rule is not None and stopping_rule.should_stop(results):
+            break
+        measurements = MEASUREMENTS_PER_TIMER
+        if stopping_rule is not None:
+            measurements = min(measurements, stopping_rule.max_samples - len(results))
+        pcap_path = None if pcap_prefix is None else f"{pcap_prefix}_{timer}.pcap"
+        records, flows = time_handshake(pair, sig_alg, measurements, pcap_path)
+        if on_batch is not None:
+            on_batch(timer, records, flows)
+        # Resumed and 0-RTT handshakes of a --mix stay in the store only
+        results.extend(full_handshake_ms(records))
     return results
 
 def get_rtt_ms(client, server):
-    """Ping the server from the client and extract RTT."""
-    result = client.cmd(f"ping {server.IP()} -c 30")
-    # print(f"[DEBUG] Ping result: {result}")
-    lines = result.splitlines()
-    rtt_line = [line for line in lines if "rtt" in line][0]
-    avg_rtt = rtt_line.split("/")[4]
-    return avg_rtt.replace(".", "p")
-
-
-class ExperimentTopo(Topo):
-    """Custom Mininet topology with one client and one server."""
-    def build(self):
-        # Add two hosts and a direct link
-        client = self.addHost("h2", ip="10.0.0.2")
-        server = self.addHost("h1", ip="10.0.0.1")
-        self.addLink(client, server, cls=TCLink)
+    """Probe the server from the client until the median RTT converges and return the RTT statistics."""
+    stats = probe_rtt(server.IP(), run=client.cmd)
+    print(f"{client.name} -> {server.name}: RTT min {stats['min']:.3f} avg {stats['avg']:.3f} "
+          f"p95 {stats['p95']:.3f} jitter {stats['jitter']:.3f} ms from {stats['count']}/{stats['sent']} probes")
+    return stats
 
-if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python3 experiment_mn.py <sig_alg> <nginx_path> <nginx_conf_dir>")
-        sys.exit(1)
+def nominal_rtt_ms(latency_ms):
+    """netem delays both directions, so the nominal RTT is twice the delay."""
+    return 2 * float(latency_ms.replace("ms", ""))
 
-    sig_alg = sys.argv[1]
-    nginx_path = sys.argv[2]
-    nginx_conf_dir = sys.argv[3]
+def measure_rtt(pair, latency_ms):
+    """Measure the loss-free RTT of a latency level on one pair."""
+    configure_pair(pair, 0, latency_ms)
+    stats = get_rtt_ms(pair.client, pair.server)
+    print(f"✅ RTT measurement success! Delay: {latency_ms} RTT: {rtt_label(stats)}")
+    return stats
 
-    # Create the network
-    topo = ExperimentTopo()
-    net = Mininet(topo=topo, link=TCLink)
-    net.start()
+def measure_cell(pair, cell):
+    """Measure one (latency, algorithm, loss) cell on one pair."""
+    latency_ms, sig_alg, pkt_loss = cell
+    metrics.start_cell(pair.index, algorithm=sig_alg, latency=latency_ms, loss_pct=pkt_loss)
+    reconfig_s = configure_pair(pair, pkt_loss, latency_ms)
+
+    def store_batch(timer, records, flows):
+        metrics.record_batch(pair.index, records, pair.worker.last_batch)
+        store.append(
+            [record.ms for record in records],
+            run=manifest.run,
+            algorithm=sig_alg,
+            rtt_nominal_ms=nominal_rtt_ms(latency_ms),
+            rtt_measured_ms=parse_rtt_str(manifest.rtts[latency_ms]),
+            loss_pct=pkt_loss,
+            client_mbps=CLIENT_BANDWIDTH,
+            server_mbps=SERVER_BANDWIDTH,
+            timer=timer,
+            sample=[record.index for record in records],
+            timestamp=[record.timestamp for record in records],
+            concurrency=concurrency,
+            **phase_columns(records),
+            **handshake_type_columns(records),
+            **attempt_columns(records),
+            **flows,
+            **monitor.columns(records),
+            **pair.cpu.columns(records),
+        )
+        rtt_log.log({"probes": monitor.drain()}, run=manifest.run, algorithm=sig_alg, latency=latency_ms,
+                    loss_pct=pkt_loss, timer=timer)
+        batch_log.log({**pair.worker.last_batch, **pair.cpu.last}, run=manifest.run, algorithm=sig_alg,
+                      latency=latency_ms, loss_pct=pkt_loss, timer=timer, backend=args.backend,
+                      concurrency=concurrency, reconfig_s=reconfig_s)
+
+    # Pick up the batches an interrupted attempt already flushed to the store
+    stored = store.load(
+        ["handshake_ms", "timer", "handshake_type"],
+        run=manifest.run,
+        algorithm=sig_alg,
+        rtt_nominal_ms=nominal_rtt_ms(latency_ms),
+        loss_pct=pkt_loss,
+    )
+    checkpointed = stored["handshake_ms"][stored["handshake_type"] == "full"].tolist()
+    # Budgeted batches may be short, so continue after the last stored batch rather than counting samples
+    first_timer = int(stored["timer"].max()) + 1 if len(stored["timer"]) else 0
+
+    pcap_prefix = None
+    if args.capture:
+        pcap_prefix = f"../../mn_data/sig/pcap/run{manifest.run}_{sig_alg}_{latency_ms}_{pkt_loss}"
+    monitor = RttMonitor(pair.server.IP(), popen=pair.client.popen, interval=args.rtt_interval)
+    with monitor:
+        results = run_timers(pair, sig_alg, on_batch=store_batch, stopping_rule=stopping_rule, results=checkpointed,
+                             first_timer=first_timer, pcap_prefix=pcap_prefix)
+    if stopping_rule is not None:
+        stopping_log.log(stopping_rule.summary(results), algorithm=sig_alg, latency=latency_ms, loss_pct=pkt_loss)
+    metrics.finish_cell(pair.index)
+    return results
+
+def measure_load_curve(pair, sig_alg):
+    """Step the open-loop handshake rate against one pair's nginx without loss at the lowest delay."""
+    latency_ms = LATENCIES[0]
+    metrics.start_cell(pair.index, algorithm=sig_alg, rates=",".join(f"{rate:g}" for rate in args.rates))
+    configure_pair(pair, 0, latency_ms)
 
-    # Get client and server hosts
-    client = net.get("h2")
-    server = net.get("h1")
+    def log_point(point):
+        curve_log.log(point, run=manifest.run, algorithm=sig_alg, latency=latency_ms, schedule=args.schedule)
+        print(f"{sig_alg} @ {point['offered_rate']:g}/s: achieved {point['achieved_rate']:.1f}/s, "
+              f"p50 {point['p50']:.2f} ms, p99 {point['p99']:.2f} ms, {point['failures']} failures")
 
-    # Configure network interfaces
-    client.cmd("tc qdisc add dev h2-eth0 root netem")
-    server.cmd("tc qdisc add dev h1-eth0 root netem")
+    points = rate_sweep(pair.worker, sig_alg, args.rates, args.rate_duration, args.schedule, on_point=log_point)
+    saturation = saturation_point(points)
+    curve_log.log({"saturation_rate": saturation}, run=manifest.run, algorithm=sig_alg, latency=latency_ms,
+                  schedule=args.schedule)
+    metrics.finish_cell(pair.index)
+    print(f"✅ {sig_alg} saturates nginx at {saturation} handshakes/s")
 
-    # Start nginx on server
-    server.cmd(f"{nginx_path} -c {nginx_conf_dir}")
+def measure_trace(pair, sig_alg):
+    """Measure batches for as long as the link trace replays, tagging samples with their link state."""
+    timer = 0
+    metrics.start_cell(pair.index, algorithm=sig_alg, trace=args.trace)
+    monitor = RttMonitor(pair.server.IP(), popen=pair.client.popen, interval=args.rtt_interval)
+    with TraceReplay(pair.link, trace, args.trace_end) as replay, monitor:
+        while not replay.finished:
+            records, flows = time_handshake(pair, sig_alg, MEASUREMENTS_PER_TIMER)
+            link_columns = replay.columns(records)
+            metrics.record_batch(pair.index, records, pair.worker.last_batch)
+            state = replay.state_at(time.time())
+            if state is not None:
+                metrics.set_link(pair.index, state_netem(replay.states[state]))
+            store.append(
+                [record.ms for record in records],
+                run=manifest.run,
+                algorithm=sig_alg,
+                # rtt_nominal_ms and loss_pct stay NaN: the link state is in link_rtt_ms and link_loss_pct
+                timer=timer,
+                sample=[record.index for record in records],
+                timestamp=[record.timestamp for record in records],
+                concurrency=concurrency,
+                **phase_columns(records),
+                **handshake_type_columns(records),
+                **attempt_columns(records),
+                **link_columns,
+                **monitor.columns(records),
+                **pair.cpu.columns(records),
+            )
+            rtt_log.log({"probes": monitor.drain()}, run=manifest.run, algorithm=sig_alg, trace=args.trace, timer=timer)
+            batch_log.log({**pair.worker.last_batch, **pair.cpu.last}, run=manifest.run, algorithm=sig_alg,
+                          trace=args.trace, timer=timer, backend=args.backend, concurrency=concurrency)
+            timer += 1
+    metrics.finish_cell(pair.index)
+    print(f"✅ {sig_alg}: {timer} batches over {args.trace}")
+
+def csv_path(latency_ms, sig_alg):
+    return f"../../mn_data/sig/{sig_alg}_{manifest.rtts[latency_ms]}ms.csv"
+
+def write_csv(latency_ms, sig_alg):
+    """Write the wide CSV file of one latency level from the run's full handshakes."""
+    data = store.load(
+        ["loss_pct", "handshake_ms"],
+        run=manifest.run,
+        algorithm=sig_alg,
+        rtt_nominal_ms=nominal_rtt_ms(latency_ms),
+        handshake_type="full",
+    )
+    with open(csv_path(latency_ms, sig_alg), "w") as out_file:
+        csv_writer = csv.writer(out_file)
+        for loss in PKT_LOSSES:
+            samples = data["handshake_ms"][data["loss_pct"] == np.float32(loss)]
+            csv_writer.writerow([loss] + samples.tolist())
+
+def cell_cost(cell):
+    """Sort key putting the slowest cells (high delay, high loss) first."""
+    latency_ms, _, pkt_loss = cell
+    return (float(latency_ms.replace("ms", "")), pkt_loss)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Signature handshake sweep in Mininet")
+    parser.add_argument("sig_alg")
+    parser.add_argument("nginx_path")
+    parser.add_argument("nginx_conf_dir")
+    parser.add_argument("--pairs", type=int, default=1,
+                        help="number of isolated client/server pairs measuring in parallel")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="stop each cell once the median and p95 confidence intervals are narrow enough")
+    parser.add_argument("--ci-width", type=float, default=0.05,
+                        help="target relative confidence interval width in adaptive mode")
+    parser.add_argument("--min-samples", type=int, default=2 * MEASUREMENTS_PER_TIMER,
+                        help="minimum handshakes per cell in adaptive mode")
+    parser.add_argument("--max-samples", type=int, default=TIMERS * MEASUREMENTS_PER_TIMER,
+                        help="maximum handshakes per cell in adaptive mode")
+    parser.add_argument("--backend", choices=["s_timer", "asyncio"], default="s_timer",
+                        help="sequential s_timer handshakes, or concurrent ones from the asyncio load generator")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="handshakes kept in flight with --backend asyncio")
+    parser.add_argument("--group", default=None, metavar="GROUP",
+                        help="key exchange group of --backend asyncio handshakes (default: OpenSSL's defaults)")
+    parser.add_argument("--rates", type=lambda value: [float(rate) for rate in value.split(",")],
+                        help="instead of the loss grid, sweep these open-loop handshake rates per second "
+                             "(requires --backend asyncio)")
+    parser.add_argument("--rate-duration", type=float, default=10.0,
+                        help="seconds of arrivals per rate in a rate sweep")
+    parser.add_argument("--schedule", choices=["fixed", "poisson"], default="fixed",
+                        help="open-loop arrival schedule of a rate sweep")
+    parser.add_argument("--trace", default=None, metavar="CSV",
+                        help="instead of the loss grid, replay this time-varying link trace (see utils/link_trace.py) "
+                             "while measuring")
+    parser.add_argument("--trace-end", type=float, default=None, metavar="SECONDS",
+                        help="offset at which the trace's last state ends (default: one step after it starts)")
+    parser.add_argument("--rtt-interval", type=float, default=0.5,
+                        help="seconds between the background RTT probes sent while measuring")
+    parser.add_argument("--mix", type=parse_mix, default=None, metavar="full=W,resumed=W,early=W",
+                        help="weights of full, resumed and 0-RTT handshakes within every batch (default: full only)")
+    parser.add_argument("--capture", action="store_true",
+                        help="tcpdump every batch and store per-handshake bytes, segments and round trips")
+    parser.add_argument("--keep-pcap", action="store_true",
+                        help="keep the pcap files of --capture instead of deleting them once parsed")
+    parser.add_argument("--cpu-accounting", choices=["procfs", "cgroup", "off"], default="procfs",
+                        help="meter the CPU time of the client worker and nginx per batch through procfs, or by "
+                             "moving them into cgroups")
+    parser.add_argument("--pin-client", type=parse_cpus, default=None, metavar="CPUS",
+                        help="pin the client workers to these cores, e.g. 0-1 (dealt out over the pairs)")
+    parser.add_argument("--pin-server", type=parse_cpus, default=None, metavar="CPUS",
+                        help="pin nginx to these cores, e.g. 2-5 (dealt out over the pairs)")
+    parser.add_argument("--handshake-timeout", type=float, default=30.0, metavar="SECONDS",
+                        help="give up on a handshake attempt after this long and retry it (0: wait forever)")
+    parser.add_argument("--batch-budget", type=float, default=0, metavar="SECONDS",
+                        help="end a batch after this long even if handshakes are missing (0: no budget)")
+    parser.add_argument("--max-attempts", type=int, default=10, metavar="N",
+                        help="give up on a handshake after N failed attempts and end its batch (0: retry forever)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, metavar="PORT",
+                        help="serve live progress in the Prometheus text format on localhost:PORT/metrics (0: off)")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None, metavar="RUN",
+                        help="continue the latest sweep of this algorithm, or the given run number")
+    args = parser.parse_args()
+    if args.rates and args.backend != "asyncio":
+        parser.error("--rates needs --backend asyncio")
+    if args.rates and args.trace:
+        parser.error("--rates and --trace are separate modes")
+    trace = None
+    if args.trace:
+        try:
+            trace = load_trace(args.trace)
+            trace_duration(trace, args.trace_end)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.mix and args.backend != "s_timer":
+        parser.error("--mix needs --backend s_timer")
+    if args.batch_budget and args.backend != "s_timer":
+        parser.error("--batch-budget needs --backend s_timer")
+    if args.max_attempts < 0:
+        parser.error("--max-attempts must not be negative")
+    if args.group and args.backend != "asyncio":
+        parser.error("--group needs --backend asyncio")
+    if args.group:
+        try:
+            check_group(args.group)
+        except LoadGenError as e:
+            parser.error(str(e))
+
+    sig_alg = args.sig_alg
+    nginx_path = args.nginx_path
+    nginx_conf_dir = args.nginx_conf_dir
 
     # Create data directory
     if not os.path.exists("../../mn_data/sig"):
         os.makedirs("../../mn_data/sig")
+    if args.capture:
+        os.makedirs("../../mn_data/sig/pcap", exist_ok=True)
+
+    # Every batch is flushed to the columnar store, which doubles as the sweep checkpoint
+    store = ResultStore("../../mn_data/sig/store", fsync=True)
+    manifest = open_run("../../mn_data/sig/runs", args.resume, key=sig_alg)
+    print(f"{'Resuming' if manifest.key is not None else 'Starting'} run {manifest.run}")
+    manifest.start(sys.argv, key=sig_alg)
+    # Indexed record of the run and its cells that analysis queries, see utils/catalog.py
+    catalog = RunCatalog("../../mn_data/catalog.sqlite")
+    catalog_run = catalog.start_run("mininet", "sig", manifest.run, argv=sys.argv, **build_versions(nginx_path))
+
+    # In adaptive mode the stopping reason and final CI of every cell go next to the data
+    stopping_rule = None
+    if args.adaptive:
+        stopping_rule = StoppingRule(args.ci_width, args.min_samples, args.max_samples)
+        stopping_log = StoppingLog("../../mn_data/sig/stopping.jsonl")
+
+    # Throughput and failures of every batch, most interesting with --backend asyncio
+    batch_log = BatchLog("../../mn_data/sig/batches.jsonl")
+    # RTT time series of the background probes, aligned with the samples through probe_rtt_ms
+    rtt_log = BatchLog("../../mn_data/sig/rtt_monitor.jsonl")
+    concurrency = 1
+    worker_command = WORKER_COMMAND
+    # s_timer bounds every attempt and batch, load_gen.py takes its timeout on the command line
+    deadlines = {"timeout": args.handshake_timeout, "budget": args.batch_budget, "attempts": args.max_attempts}
+    if args.backend == "asyncio":
+        concurrency = args.concurrency
+        deadlines = {}
+        worker_command = [sys.executable, LOAD_GEN, "--worker", "--concurrency", str(concurrency),
+                          "--timeout", str(args.handshake_timeout),
+                          "--cafile", "../tmp/nginx/conf/{alg}_CA.crt", "--groups", args.group or ""]
+
+    # Experiment grid, minus the cells a resumed run already finished
+    cells = [(latency_ms, sig_alg, pkt_loss)
+             for latency_ms in LATENCIES
+             for pkt_loss in PKT_LOSSES]
+    cells = [cell for cell in cells if cell not in manifest.completed]
+    cells.sort(key=cell_cost, reverse=True)
+    if not cells and not (args.rates or args.trace):
+        print("✅ Nothing left to measure")
+        manifest.finish()
+        catalog.finish_run(catalog_run)
+        sys.exit(0)
+
+    # Live progress for scrapers and curl; a load curve or trace counts as one cell per algorithm
+    metrics = CampaignMetrics(total_cells=1 if args.rates or args.trace else len(cells), run=manifest.run)
+    metrics_server = MetricsServer(metrics, args.metrics_port).start()
+
+    # Create the network, with no more pairs than there are cells left. Load
+    # curves measure the server's capacity and a trace replays a single
+    # link, so both run on one pair.
+    num_pairs = 1 if args.rates or args.trace else min(args.pairs, len(cells))
+    curve_log = BatchLog("../../mn_data/sig/load_curves.jsonl")
+    topo = PairTopo(pairs=num_pairs)
+    net = Mininet(topo=topo, link=TCLink)
+    net.start()
+
+    pairs = []
+    try:
+        # Get client and server hosts, configure netem, start nginx and the workers on every pair
+        pairs = get_pairs(net, num_pairs)
+        setup_pairs(pairs, nginx_path, nginx_conf_dir)
+        start_workers(pairs, worker_command)
+        if args.cpu_accounting != "off":
+            start_cpu_accounting(pairs, nginx_path, args.cpu_accounting, args.pin_client, args.pin_server)
+
+        if args.rates:
+            measure_load_curve(pairs[0], sig_alg)
+        elif args.trace:
+            measure_trace(pairs[0], sig_alg)
+        else:
+            # Measure the base RTT of every latency level that has cells left
+            latencies = [latency_ms for latency_ms in LATENCIES
+                         if latency_ms not in manifest.rtts and any(cell[0] == latency_ms for cell in cells)]
+            for latency_ms, stats in run_grid(pairs, latencies, measure_rtt).items():
+                manifest.record_rtt(latency_ms, rtt_label(stats), stats)
+
+            # Each CSV is written once all of its loss levels have been measured
+            def write_results(cell, results):
+                manifest.record_cell(cell, len(results))
+                latency_ms, _, pkt_loss = cell
+                catalog.record_cell(catalog_run, sig_alg, len(results), rtt_nominal_ms=nominal_rtt_ms(latency_ms),
+                                    loss_pct=pkt_loss, rtt_measured_ms=parse_rtt_str(manifest.rtts[latency_ms]),
+                                    client_mbps=CLIENT_BANDWIDTH, server_mbps=SERVER_BANDWIDTH,
+                                    path=csv_path(latency_ms, sig_alg), store=store.path)
+                if all((latency_ms, sig_alg, loss) in manifest.completed for loss in PKT_LOSSES):
+                    write_csv(latency_ms, sig_alg)
 
-    # Experiment loop
-    for latency_ms in ["2.684ms", "15.458ms", "39.224ms", "97.73ms", "297.73ms"]:
-        client_bandwidth = 100  # 100 Mbps DL
-        server_bandwidth = 20  # 20 Mbps UL
-        # Configure base delay
-        change_qdisc(client, "h2-eth0", 0, latency_ms, client_bandwidth)
-        change_qdisc(server, "h1-eth0", 0, latency_ms, server_bandwidth)
-        rtt_str = get_rtt_ms(client, server)
-        print(f"✅ RTT measurement success! RTT: {rtt_str}")
-        
-        # Open CSV file for results
-        with open(f"../../mn_data/sig/{sig_alg}_{rtt_str}ms.csv", "w") as out_file:
-            csv_writer = csv.writer(out_file)
-
-            # Test different packet loss rates
-            for pkt_loss in [0, 0.1, 0.5, 1, 1.5, 2, 2.5, 3] + list(range(4, 21)):
-                change_qdisc(client, "h2-eth0", pkt_loss, latency_ms, client_bandwidth)
-                change_qdisc(server, "h1-eth0", pkt_loss, latency_ms, server_bandwidth)
-
-                # Measure handshake times
-                results = run_timers(sig_alg)
-                results.insert(0, pkt_loss)
-                csv_writer.writerow(results)
-
-    # Cleanup
-    net.stop()
\ No newline at end of file
+            # Experiment loop
+            run_grid(pairs, cells, measure_cell, on_result=write_results)
+        manifest.finish()
+        catalog.finish_run(catalog_run)
+    finally:
+        # Cleanup
+        stop_workers(pairs)
+        net.stop()
+        metrics_server.stop()
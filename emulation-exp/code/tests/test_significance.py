@@ -0,0 +1,45 @@
+"""The order statistic shortcuts of significance.py against full index matrices."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils"))
+from significance import METHODS  # noqa: E402
+
+DRAWS = 10_000
+# Two-sample Kolmogorov-Smirnov bound for DRAWS against DRAWS at alpha = 0.001
+KS_BOUND = 1.95 * np.sqrt(2 / DRAWS)
+
+
+def ks_statistic(x, y):
+    """Largest distance between the empirical CDFs of x and y."""
+    points = np.sort(np.concatenate([x, y]))
+    cdf_x = np.searchsorted(np.sort(x), points, side="right") / len(x)
+    cdf_y = np.searchsorted(np.sort(y), points, side="right") / len(y)
+    return np.abs(cdf_x - cdf_y).max()
+
+
+def draws(step, *args):
+    """DRAWS of step per method, each from its own seeded generator."""
+    return {method: functions[step](*args, DRAWS, np.random.default_rng(seed))
+            for seed, (method, functions) in enumerate(METHODS.items())}
+
+
+@pytest.mark.parametrize("n", [5, 57, 400])
+def test_bootstrap_distributions_match(n):
+    samples = np.random.default_rng(n).lognormal(3, 0.8, n)
+    result = draws(0, samples)
+    for q in range(result["ranks"].shape[1]):
+        assert ks_statistic(result["ranks"][:, q], result["matrix"][:, q]) < KS_BOUND
+
+
+@pytest.mark.parametrize("n_a, n_b", [(30, 45), (200, 130)])
+def test_permutation_distributions_match(n_a, n_b):
+    rng = np.random.default_rng(n_a)
+    a = rng.lognormal(3.1, 0.8, n_a)
+    b = rng.lognormal(3, 0.8, n_b)
+    result = draws(1, a, b)
+    for q in range(result["ranks"].shape[1]):
+        assert ks_statistic(result["ranks"][:, q], result["matrix"][:, q]) < KS_BOUND
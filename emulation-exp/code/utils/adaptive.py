@@ -0,0 +1,89 @@
+"""Adaptive sample-size control for run_timers.
+
+Instead of always collecting TIMERS x MEASUREMENTS_PER_TIMER handshakes per
+cell, a StoppingRule is checked after every s_timer batch. A cell stops once
+the distribution-free (order statistic) confidence intervals of the median
+and the 95th percentile are narrower than a target fraction of the estimate,
+subject to hard minimum and maximum sample counts.
+"""
+import json
+import math
+import threading
+from statistics import NormalDist
+
+import numpy as np
+
+
+def quantile_ci(sorted_samples, q, confidence=0.95):
+    """Order statistic confidence interval for quantile q.
+
+    Uses the normal approximation to the binomial distribution of the
+    number of samples below the true quantile. Returns (estimate, low, high)
+    with low/high set to NaN when there are too few samples for the
+    requested confidence.
+    """
+    n = len(sorted_samples)
+    if n == 0:
+        return math.nan, math.nan, math.nan
+    estimate = float(np.quantile(sorted_samples, q))
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    spread = z * math.sqrt(n * q * (1 - q))
+    lower_rank = math.floor(n * q - spread)
+    upper_rank = math.ceil(n * q + spread)
+    if lower_rank < 1 or upper_rank > n:
+        return estimate, math.nan, math.nan
+    return estimate, float(sorted_samples[lower_rank - 1]), float(sorted_samples[upper_rank - 1])
+
+
+class StoppingRule:
+    """Decide when a cell has enough samples for stable median and tail estimates."""
+    def __init__(self, rel_width=0.05, min_samples=200, max_samples=1000,
+                 confidence=0.95, quantiles=(0.5, 0.95)):
+        self.rel_width = rel_width
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.confidence = confidence
+        self.quantiles = quantiles
+
+    def summary(self, samples):
+        """Return the stopping decision and the current CI of every quantile.
+
+        The result is a dict with 'stop', 'reason' (None, 'converged' or
+        'max_samples'), 'samples' and one {'estimate', 'low', 'high',
+        'rel_width'} entry per quantile, keyed 'p50', 'p95', ...
+        """
+        sorted_samples = np.sort(np.asarray(samples, dtype=float))
+        n = len(sorted_samples)
+        result = {"samples": n, "confidence": self.confidence, "target_rel_width": self.rel_width}
+        converged = True
+        for q in self.quantiles:
+            estimate, low, high = quantile_ci(sorted_samples, q, self.confidence)
+            rel_width = (high - low) / estimate if estimate > 0 else math.nan
+            if not rel_width <= self.rel_width:  # NaN never converges
+                converged = False
+            result[f"p{q * 100:g}"] = {"estimate": estimate, "low": low, "high": high, "rel_width": rel_width}
+
+        if n >= self.min_samples and converged:
+            result["reason"] = "converged"
+        elif n >= self.max_samples:
+            result["reason"] = "max_samples"
+        else:
+            result["reason"] = None
+        result["stop"] = result["reason"] is not None
+        return result
+
+    def should_stop(self, samples):
+        return self.summary(samples)["stop"]
+
+
+class StoppingLog:
+    """Thread-safe JSON lines file recording why and where each cell stopped."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def log(self, summary, **cell):
+        record = dict(cell)
+        record.update({k: v for k, v in summary.items() if k != "stop"})
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
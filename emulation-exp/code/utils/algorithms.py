@@ -0,0 +1,324 @@
+"""Algorithm discovery and cached certificate chains.
+
+Which key exchange groups and signature algorithms exist depends on the
+OpenSSL/OQS build, so instead of hardcoding them the sweep grid can be
+asked of the installed openssl binary. Every candidate group is probed
+with `s_client -groups` (an unknown group fails before connecting) and
+every candidate signature algorithm with a throwaway `req -newkey`, in
+parallel. The result is cached per binary and config file.
+
+A spec selects the algorithms of a sweep:
+
+    default            the campaign's algorithms, DEFAULT_KEX or DEFAULT_SIG
+    auto               everything the build supports
+    auto:<regex>       the supported algorithms matching regex, e.g. auto:kyber
+    a,b,c              exactly these, checked against the build
+
+The CA and server certificate of each signature algorithm are generated
+in parallel into a content-addressed cache: a chain's directory is named
+after the hash of everything it was made from (openssl binary, config,
+algorithm, subjects, validity), so it is reused until one of them changes
+or the certificates are about to expire. install() copies chains into the
+nginx conf directory under the names setup.sh used to write:
+
+    python3 algorithms.py select kex auto:kyber
+    python3 algorithms.py certs sig --out ../tmp/nginx/conf ecdsap256 dilithium2 dilithium3
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+OPENSSL = "../tmp/openssl/apps/openssl"
+OPENSSL_CNF = "../tmp/openssl/apps/openssl.cnf"
+CACHE_DIR = "../tmp/cert_cache"
+
+DEFAULT_KEX = ["prime256v1", "p256_kyber512_90s", "p256_kyber768_90s", "p256_kyber1024_90s"]
+DEFAULT_SIG = ["ecdsap256", "dilithium2", "dilithium3"]
+BASELINES = {"kex": "prime256v1", "sig": "ecdsap256"}
+
+# Candidates probed by discover(), in the order a sweep runs them. Hybrids
+# pair a KEM with the classical group of its security level.
+CLASSICAL_GROUPS = ["prime256v1", "secp384r1", "secp521r1", "x25519", "x448"]
+PQ_KEMS = {
+    1: ["kyber512", "kyber512_90s", "mlkem512", "lightsaber", "ntru_hps2048509", "frodo640aes", "frodo640shake",
+        "bikel1", "bike1l1cpa", "hqc128", "sikep434", "sikep503"],
+    3: ["kyber768", "kyber768_90s", "mlkem768", "saber", "ntru_hps2048677", "ntru_hrss701", "frodo976aes",
+        "frodo976shake", "bikel3", "hqc192", "sikep610"],
+    5: ["kyber1024", "kyber1024_90s", "mlkem1024", "firesaber", "ntru_hps4096821", "frodo1344aes",
+        "frodo1344shake", "hqc256", "sikep751"],
+}
+HYBRID_PREFIXES = {1: ["p256_", "x25519_"], 3: ["p384_", "x448_"], 5: ["p521_"]}
+CLASSICAL_SIGS = {"ecdsap256": "ec:{ec_params}", "rsa3072": "rsa:3072", "ed25519": "ed25519"}
+PQ_SIGS = ["dilithium2", "dilithium3", "dilithium5", "dilithium2_aes", "dilithium3_aes", "dilithium5_aes",
+           "mldsa44", "mldsa65", "mldsa87", "falcon512", "falcon1024",
+           "sphincsharaka128frobust", "sphincssha256128frobust", "sphincsshake256128frobust",
+           "sphincssha2128fsimple", "sphincsshake128fsimple", "picnicl1full", "picnic3l1", "rainbowIclassic"]
+HYBRID_SIGS = ["p256_dilithium2", "rsa3072_dilithium2", "p384_dilithium3", "p521_dilithium5",
+               "p256_falcon512", "rsa3072_falcon512", "p521_falcon1024"]
+
+# Bump when the way chains are generated changes, to invalidate the cache
+RECIPE_VERSION = 1
+CERT_DAYS = 365
+# Chains are regenerated once they expire within this many seconds
+MIN_VALIDITY_S = 7 * 24 * 3600
+
+
+def kex_candidates():
+    candidates = list(CLASSICAL_GROUPS)
+    for level, kems in PQ_KEMS.items():
+        candidates += kems
+        candidates += [prefix + kem for prefix in HYBRID_PREFIXES[level] for kem in kems]
+    return candidates
+
+
+def sig_candidates():
+    return list(CLASSICAL_SIGS) + PQ_SIGS + HYBRID_SIGS
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OpenSSL:
+    """An openssl binary and its config file."""
+    def __init__(self, path=OPENSSL, config=OPENSSL_CNF):
+        self.path = path
+        self.config = config if config and os.path.exists(config) else None
+        self._digest = None
+
+    @property
+    def available(self):
+        return os.path.exists(self.path) or shutil.which(self.path) is not None
+
+    @property
+    def digest(self):
+        """Hash of the binary and its config, which decide what it supports and generates."""
+        if self._digest is None:
+            digest = hashlib.sha256(file_digest(shutil.which(self.path) or self.path).encode())
+            if self.config:
+                digest.update(file_digest(self.config).encode())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def run(self, *args, cwd=None):
+        return subprocess.run([self.path, *args], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, universal_newlines=True, cwd=cwd)
+
+    def config_args(self):
+        return ["-config", self.config] if self.config else []
+
+    def supports_group(self, group):
+        # Port 1 refuses the connection: getting as far as connecting means the group was accepted
+        result = self.run("s_client", "-groups", group, "-connect", "127.0.0.1:1")
+        return re.search(r"connect:errno|Connection refused|BIO_connect", result.stdout) is not None
+
+    def supports_sig(self, sig, workdir):
+        newkey = newkey_arg(sig, self, workdir)
+        result = self.run("req", "-new", "-newkey", newkey, "-nodes", "-keyout", os.devnull, "-out", os.devnull,
+                          "-subj", "/CN=probe", *self.config_args())
+        return result.returncode == 0
+
+
+def newkey_arg(sig, openssl, workdir):
+    """`req -newkey` argument of a signature algorithm; classical ones need a parameter file or size."""
+    newkey = CLASSICAL_SIGS.get(sig, sig)
+    if "{ec_params}" in newkey:
+        ec_params = os.path.join(workdir, "prime256v1.pem")
+        if not os.path.exists(ec_params):
+            openssl.run("ecparam", "-out", ec_params, "-name", "prime256v1")
+        newkey = newkey.format(ec_params=ec_params)
+    return newkey
+
+
+def discover(openssl, cache_dir=CACHE_DIR, jobs=None):
+    """{"kex": [...], "sig": [...]} of the candidates the build supports, cached per binary and config."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"algorithms-{openssl.digest[:16]}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+
+    with tempfile.TemporaryDirectory(dir=cache_dir) as workdir, ThreadPool(jobs or os.cpu_count()) as pool:
+        groups = kex_candidates()
+        sigs = sig_candidates()
+        supported_groups = pool.map(openssl.supports_group, groups)
+        # Generate the EC parameters once before the probes run in parallel
+        newkey_arg("ecdsap256", openssl, workdir)
+        supported_sigs = pool.starmap(openssl.supports_sig, [(sig, workdir) for sig in sigs])
+    algorithms = {
+        "kex": [group for group, ok in zip(groups, supported_groups) if ok],
+        "sig": [sig for sig, ok in zip(sigs, supported_sigs) if ok],
+    }
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(algorithms, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    return algorithms
+
+
+def select_algorithms(kind, spec="default", openssl=None, cache_dir=CACHE_DIR):
+    """Resolve a spec (see the module docstring) into the algorithms of a sweep.
+
+    The baseline of kind comes first whenever it is selected. Explicit
+    lists are checked against the build if the openssl binary is there,
+    so a typo fails before the sweep starts instead of in its first cell.
+    """
+    openssl = openssl or OpenSSL()
+    if spec == "default":
+        return list(DEFAULT_KEX if kind == "kex" else DEFAULT_SIG)
+    if spec == "auto" or spec.startswith("auto:"):
+        if not openssl.available:
+            raise ValueError(f"cannot discover {kind} algorithms: {openssl.path} not found")
+        supported = discover(openssl, cache_dir)[kind]
+        pattern = re.compile(spec[len("auto:"):]) if spec.startswith("auto:") else None
+        selected = [alg for alg in supported if pattern is None or pattern.search(alg)]
+    else:
+        selected = [alg for alg in spec.split(",") if alg]
+        if openssl.available:
+            supported = discover(openssl, cache_dir)[kind]
+            unsupported = [alg for alg in selected if alg not in supported]
+            if unsupported:
+                raise ValueError(f"{openssl.path} does not support {kind} algorithms {', '.join(unsupported)}")
+    if not selected:
+        raise ValueError(f"no {kind} algorithms match {spec!r}")
+    baseline = BASELINES[kind]
+    return ([baseline] if baseline in selected else []) + [alg for alg in selected if alg != baseline]
+
+
+class CertCache:
+    """Content-addressed store of CA and server certificate chains, one per signature algorithm."""
+    FILES = ("CA.key", "CA.crt", "server.key", "server.crt")
+
+    def __init__(self, openssl, cache_dir=CACHE_DIR, days=CERT_DAYS):
+        self.openssl = openssl
+        self.cache_dir = cache_dir
+        self.days = days
+        os.makedirs(os.path.join(cache_dir, "chains"), exist_ok=True)
+
+    def recipe(self, sig):
+        return {
+            "version": RECIPE_VERSION,
+            "openssl": self.openssl.digest,
+            "sig": sig,
+            "newkey": CLASSICAL_SIGS.get(sig, sig),
+            "ca_subject": f"/CN=OQS test {sig} CA",
+            "server_subject": f"/CN=oqstest {sig}",
+            "days": self.days,
+        }
+
+    def chain_dir(self, sig):
+        key = hashlib.sha256(json.dumps(self.recipe(sig), sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.cache_dir, "chains", key)
+
+    def valid(self, path):
+        if not all(os.path.exists(os.path.join(path, name)) for name in self.FILES):
+            return False
+        return all(self.openssl.run("x509", "-checkend", str(MIN_VALIDITY_S), "-noout",
+                                    "-in", os.path.join(path, name)).returncode == 0
+                   for name in ("CA.crt", "server.crt"))
+
+    def chain(self, sig):
+        """Directory holding the chain of sig, generated if it is not cached yet. Returns (path, generated)."""
+        path = self.chain_dir(sig)
+        if self.valid(path):
+            return path, False
+        recipe = self.recipe(sig)
+        # Generated next to its final place and renamed, so a crash never leaves half a chain
+        workdir = tempfile.mkdtemp(dir=os.path.join(self.cache_dir, "chains"))
+        try:
+            newkey = newkey_arg(sig, self.openssl, workdir)
+            days = str(self.days)
+            steps = [
+                ("req", "-x509", "-new", "-newkey", newkey, "-keyout", "CA.key", "-out", "CA.crt", "-nodes",
+                 "-subj", recipe["ca_subject"], "-days", days, *self.openssl.config_args()),
+                ("req", "-new", "-newkey", newkey, "-keyout", "server.key", "-out", "server.csr", "-nodes",
+                 "-subj", recipe["server_subject"], *self.openssl.config_args()),
+                ("x509", "-req", "-in", "server.csr", "-out", "server.crt", "-CA", "CA.crt", "-CAkey", "CA.key",
+                 "-CAcreateserial", "-days", days),
+            ]
+            for step in steps:
+                result = self.openssl.run(*step, cwd=workdir)
+                if result.returncode != 0:
+                    raise RuntimeError(f"{sig}: openssl {step[0]} failed\n{result.stdout.strip()}")
+            with open(os.path.join(workdir, "recipe.json"), "w") as f:
+                json.dump(recipe, f, indent=2)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(workdir, path)
+        except BaseException:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        return path, True
+
+    def chains(self, sigs, jobs=None):
+        """{sig: (path, generated)}, generating the missing chains in parallel."""
+        with ThreadPool(jobs or os.cpu_count()) as pool:
+            return dict(zip(sigs, pool.map(self.chain, sigs)))
+
+
+def install_names(kind, sig):
+    """File names a chain is installed under: kex uses one unnamed chain, sig one per algorithm."""
+    prefix = "" if kind == "kex" else f"{sig}_"
+    return {name: prefix + name for name in CertCache.FILES}
+
+
+def install(chain_path, out_dir, names):
+    """Copy a cached chain into out_dir, leaving files that already match alone."""
+    os.makedirs(out_dir, exist_ok=True)
+    for name, target in names.items():
+        source = os.path.join(chain_path, name)
+        target = os.path.join(out_dir, target)
+        if os.path.exists(target) and file_digest(target) == file_digest(source):
+            continue
+        shutil.copyfile(source, target)
+        if name.endswith(".key"):
+            os.chmod(target, 0o600)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discover supported algorithms and build cached certificate chains")
+    parser.add_argument("--openssl", default=OPENSSL, help="openssl binary of the OQS build")
+    parser.add_argument("--config", default=OPENSSL_CNF, help="openssl config file")
+    parser.add_argument("--cache", default=CACHE_DIR, help="directory of the algorithm and certificate cache")
+    parser.add_argument("--jobs", type=int, default=None, help="parallel openssl processes (default: one per CPU)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("discover", help="list every supported group and signature algorithm")
+    select_parser = subparsers.add_parser("select", help="print the algorithms of a sweep spec, one per line")
+    select_parser.add_argument("kind", choices=["kex", "sig"])
+    select_parser.add_argument("spec", nargs="?", default="default")
+    certs_parser = subparsers.add_parser("certs", help="install the certificate chains of signature algorithms")
+    certs_parser.add_argument("kind", choices=["kex", "sig"],
+                              help="kex installs one chain as CA.crt/server.crt, sig one <alg>_CA.crt/... per algorithm")
+    certs_parser.add_argument("--out", required=True, help="nginx conf directory")
+    certs_parser.add_argument("sigs", nargs="+")
+    args = parser.parse_args()
+
+    openssl = OpenSSL(args.openssl, args.config)
+    if args.command == "discover":
+        algorithms = discover(openssl, args.cache, args.jobs)
+        for kind in ("kex", "sig"):
+            print(f"{kind} ({len(algorithms[kind])}): {' '.join(algorithms[kind])}")
+    elif args.command == "select":
+        try:
+            print("\n".join(select_algorithms(args.kind, args.spec, openssl, args.cache)))
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        if args.kind == "kex" and len(args.sigs) != 1:
+            parser.error("kex installs a single chain")
+        cache = CertCache(openssl, args.cache)
+        for sig, (path, generated) in cache.chains(args.sigs, args.jobs).items():
+            install(path, args.out, install_names(args.kind, sig))
+            print(f"✅ {sig}: {'generated' if generated else 'cached'} chain {os.path.basename(path)[:12]} "
+                  f"installed in {args.out}")
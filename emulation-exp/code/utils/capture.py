@@ -0,0 +1,375 @@
+"""Packet capture and per-handshake flight accounting.
+
+PacketCapture runs tcpdump on the client interface (inside a Mininet host
+or on the satellite client's eth0) while a batch is measured. The capture
+is then parsed offline by a streaming pcap reader that keeps only a few
+counters per TCP connection, so arbitrarily large files can be analyzed:
+
+    python3 capture.py analyze batch.pcap
+
+s_timer and load_gen.py open one connection per handshake, so every
+connection to the TLS port is one handshake. For each one the parser
+reports, per direction ('up' is client to server), the unique payload
+bytes, TCP segments, retransmitted segments and TLS records, the size of
+every record, the SYN to SYN-ACK round trip time and the number of round
+trips: the TCP handshake plus every server data flight before the client
+Finished that starts more than half an RTT after the previous server
+segment.
+
+Only IPv4 over Ethernet, Linux cooked (tcpdump -i any) and raw IP
+captures are understood, which covers both testbeds.
+"""
+import argparse
+import json
+import signal
+import struct
+import subprocess
+
+TLS_PORT = 4433
+
+# Per-handshake metrics stored in the result store, see ResultStore.COLUMNS
+FLOW_COLUMNS = (
+    "bytes_up",
+    "bytes_down",
+    "segments_up",
+    "segments_down",
+    "retransmits_up",
+    "retransmits_down",
+    "records_up",
+    "records_down",
+    "max_record_down",
+    "round_trips",
+    "syn_rtt_ms",
+)
+
+# Largest gap between a record's start and its flow's SYN; covers the delay until the worker reports the record
+MATCH_TOLERANCE_S = 0.05
+
+TLS_APPLICATION_DATA = 23
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+# Bytes before the IP header and offset of the EtherType for each link type
+LINK_HEADERS = {
+    LINKTYPE_ETHERNET: (14, 12),
+    LINKTYPE_LINUX_SLL: (16, 14),
+    LINKTYPE_LINUX_SLL2: (20, 0),
+    LINKTYPE_RAW: (0, None),
+    LINKTYPE_IPV4: (0, None),
+}
+ETHERTYPE_IPV4 = 0x0800
+
+
+class PacketCapture:
+    """tcpdump writing the TLS traffic of one interface to a pcap file.
+
+    popen is any callable with the subprocess.Popen signature, e.g. a
+    Mininet host's popen to capture inside the client's namespace.
+    """
+    def __init__(self, intf, path, port=TLS_PORT, popen=subprocess.Popen):
+        self.intf = intf
+        self.path = path
+        self.port = port
+        self.popen = popen
+        self.proc = None
+
+    def start(self):
+        # -U writes every packet as it arrives, so nothing is lost on stop
+        self.proc = self.popen(
+            ["tcpdump", "-i", self.intf, "-s", "0", "-U", "-w", self.path, "tcp", "port", str(self.port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        # tcpdump announces on stderr once the capture is open
+        for line in self.proc.stderr:
+            if "listening on" in line:
+                return self
+        raise RuntimeError(f"tcpdump failed to start on {self.intf} (exit code {self.proc.wait()})")
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGINT)
+            self.proc.wait()
+        self.proc = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def read_pcap(path):
+    """Yield (timestamp, IPv4 packet bytes) from a classic pcap file, one packet at a time."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24:
+            return
+        magic = header[:4]
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            endian = ">"
+        else:
+            raise ValueError(f"{path} is not a pcap file")
+        # Nanosecond resolution files use a different magic
+        fraction = 1e-9 if magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d") else 1e-6
+        linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+        if linktype not in LINK_HEADERS:
+            raise ValueError(f"Unsupported pcap link type {linktype} in {path}")
+        offset, ethertype_at = LINK_HEADERS[linktype]
+        record_header = struct.Struct(endian + "IIII")
+
+        while True:
+            chunk = f.read(16)
+            if len(chunk) < 16:
+                return
+            seconds, fractions, captured, _ = record_header.unpack(chunk)
+            data = f.read(captured)
+            if ethertype_at is not None:
+                if struct.unpack("!H", data[ethertype_at:ethertype_at + 2])[0] != ETHERTYPE_IPV4:
+                    continue
+            yield seconds + fractions * fraction, data[offset:]
+
+
+def parse_tcp(packet):
+    """Return (src, sport, dst, dport, flags, seq, payload) of an IPv4/TCP packet, or None."""
+    if len(packet) < 20 or packet[0] >> 4 != 4 or packet[9] != 6:
+        return None
+    ihl = (packet[0] & 0x0F) * 4
+    total_length = struct.unpack("!H", packet[2:4])[0]
+    tcp = packet[ihl:total_length]
+    if len(tcp) < 20:
+        return None
+    sport, dport, seq = struct.unpack("!HHI", tcp[:8])
+    data_offset = (tcp[12] >> 4) * 4
+    return packet[12:16], sport, packet[16:20], dport, tcp[13], seq, tcp[data_offset:]
+
+
+class _Direction:
+    """Sequence tracking and TLS record framing of one direction of a connection."""
+    def __init__(self):
+        self.isn = None
+        self.next_seq = None   # next in-order stream byte, relative to the ISN
+        self.segments = 0
+        self.retransmits = 0
+        self.pending = {}      # out-of-order payload by relative seq
+        self.header = b""      # partial TLS record header
+        self.skip = 0          # record body bytes still to pass over
+        self.records = []      # (content type, length) of every TLS record
+
+    def syn(self, seq):
+        if self.isn is not None:
+            self.retransmits += 1
+            return
+        self.isn = seq
+        self.next_seq = 1
+
+    def data(self, seq, payload):
+        if self.isn is None:
+            return
+        start = (seq - self.isn) % (1 << 32)
+        end = start + len(payload)
+        if end <= self.next_seq or start in self.pending:
+            self.retransmits += 1
+            return
+        if start > self.next_seq:
+            self.pending[start] = payload
+            return
+        self._consume(payload[self.next_seq - start:])
+        while self.next_seq in self.pending:
+            self._consume(self.pending.pop(self.next_seq))
+
+    def _consume(self, data):
+        self.next_seq += len(data)
+        while data:
+            if self.skip:
+                step = min(self.skip, len(data))
+                self.skip -= step
+                data = data[step:]
+                continue
+            need = 5 - len(self.header)
+            self.header += data[:need]
+            data = data[need:]
+            if len(self.header) == 5:
+                length = struct.unpack("!H", self.header[3:5])[0]
+                self.records.append((self.header[0], length))
+                self.skip = length
+                self.header = b""
+
+    @property
+    def bytes(self):
+        return self.next_seq - 1 if self.next_seq else 0
+
+
+class _Connection:
+    def __init__(self):
+        self.up = _Direction()
+        self.down = _Direction()
+        self.syn_time = None
+        self.syn_ack_time = None
+        self.last_down_data = None
+        self.down_flights = 0
+        self.finished_at = None   # time of the segment carrying the client Finished
+
+    def client_data(self, timestamp, seq, payload):
+        """Account an upstream segment and note when it carries the client Finished.
+
+        In TLS 1.3 the client Finished is the first application data record
+        the client sends after the server's flight. Application data records
+        before it are 0-RTT early data and do not complete the handshake.
+        """
+        known = len(self.up.records)
+        self.up.data(seq, payload)
+        if self.finished_at is None and self.down.records and any(
+                content_type == TLS_APPLICATION_DATA for content_type, _ in self.up.records[known:]):
+            self.finished_at = timestamp
+
+    @property
+    def completed(self):
+        return self.finished_at is not None
+
+    def stats(self):
+        syn_rtt_ms = float("nan")
+        round_trips = float("nan")
+        if self.syn_time is not None and self.syn_ack_time is not None:
+            syn_rtt_ms = (self.syn_ack_time - self.syn_time) * 1000
+            round_trips = 1 + self.down_flights
+        down_sizes = [length for _, length in self.down.records]
+        return {
+            "bytes_up": self.up.bytes,
+            "bytes_down": self.down.bytes,
+            "segments_up": self.up.segments,
+            "segments_down": self.down.segments,
+            "retransmits_up": self.up.retransmits,
+            "retransmits_down": self.down.retransmits,
+            "records_up": len(self.up.records),
+            "records_down": len(self.down.records),
+            "max_record_down": max(down_sizes, default=0),
+            "round_trips": round_trips,
+            "syn_rtt_ms": syn_rtt_ms,
+            "record_sizes_up": [length for _, length in self.up.records],
+            "record_sizes_down": down_sizes,
+            "completed": self.completed,
+            "start": self.syn_time,
+            "finished": self.finished_at,
+        }
+
+
+def iter_flows(path, port=TLS_PORT):
+    """Yield the stats dict of every connection to port, as soon as it closes.
+
+    Connections still open at the end of the file are yielded last.
+    """
+    connections = {}
+    for timestamp, packet in read_pcap(path):
+        parsed = parse_tcp(packet)
+        if parsed is None:
+            continue
+        src, sport, dst, dport, flags, seq, payload = parsed
+        if dport == port:
+            key, upstream = (src, sport, dst, dport), True
+        elif sport == port:
+            key, upstream = (dst, dport, src, sport), False
+        else:
+            continue
+
+        connection = connections.get(key)
+        if connection is None:
+            if not (flags & TCP_SYN and upstream):
+                continue
+            connection = connections[key] = _Connection()
+        direction = connection.up if upstream else connection.down
+        direction.segments += 1
+
+        if flags & TCP_SYN:
+            direction.syn(seq)
+            if upstream and connection.syn_time is None:
+                connection.syn_time = timestamp
+            elif not upstream and connection.syn_ack_time is None:
+                connection.syn_ack_time = timestamp
+        if payload and upstream:
+            connection.client_data(timestamp, seq, payload)
+        elif payload:
+            direction.data(seq, payload)
+            if not connection.completed:
+                # Session tickets after the client Finished are not part of the handshake
+                rtt = None
+                if connection.syn_time is not None and connection.syn_ack_time is not None:
+                    rtt = connection.syn_ack_time - connection.syn_time
+                if connection.last_down_data is None or (rtt is not None and timestamp - connection.last_down_data > rtt / 2):
+                    connection.down_flights += 1
+                connection.last_down_data = timestamp
+        if flags & (TCP_RST | TCP_FIN):
+            yield connection.stats()
+            del connections[key]
+
+    for connection in connections.values():
+        yield connection.stats()
+
+
+def handshake_flows(path, port=TLS_PORT):
+    """Stats of the completed handshakes in a capture, in completion order."""
+    # Completed flows always have the time of their client Finished
+    flows = [flow for flow in iter_flows(path, port) if flow["completed"]]
+    flows.sort(key=lambda flow: flow["finished"])
+    return flows
+
+
+def flow_columns(records, flows, tolerance_s=MATCH_TOLERANCE_S):
+    """Result store columns with the packet metrics of a batch of records, and how many could not be matched.
+
+    A record's handshake started ms before the worker reported it, which
+    is matched to the SYN time of a flow, closest pairs first. Flows without
+    a record, such as the untimed full handshake s_timer runs before the
+    first resumption, are skipped, and records without a flow within
+    tolerance_s get NaN, so that no sample is attributed the wrong
+    handshake. The second dict counts both for the batch log.
+    """
+    starts = [record.timestamp - record.ms / 1000 for record in records]
+    pairs = sorted((abs(start - flow["start"]), i, j)
+                   for i, start in enumerate(starts)
+                   for j, flow in enumerate(flows)
+                   if flow["start"] is not None and abs(start - flow["start"]) <= tolerance_s)
+    matched, used = {}, set()
+    for _, i, j in pairs:
+        if i not in matched and j not in used:
+            matched[i] = j
+            used.add(j)
+    unmatched = {"unmatched_records": len(records) - len(matched), "unmatched_flows": len(flows) - len(used)}
+    if not matched:
+        return {}, unmatched
+    columns = {name: [flows[matched[i]][name] if i in matched else float("nan") for i in range(len(records))]
+               for name in FLOW_COLUMNS}
+    return columns, unmatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-handshake packet accounting of pcap captures")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    analyze_parser = subparsers.add_parser("analyze", help="print the flights of every handshake in a capture")
+    analyze_parser.add_argument("pcap")
+    analyze_parser.add_argument("--port", type=int, default=TLS_PORT)
+    analyze_parser.add_argument("--json", action="store_true", help="one JSON object per handshake")
+    args = parser.parse_args()
+
+    if not args.json:
+        print("  # | Bytes up | Bytes down | Segs up/down | Retx up/down | Records up/down | RTTs | SYN RTT ms")
+        print("-" * 96)
+    for i, flow in enumerate(handshake_flows(args.pcap, args.port)):
+        if args.json:
+            print(json.dumps(flow))
+            continue
+        print(f"{i:3d} | {flow['bytes_up']:8d} | {flow['bytes_down']:10d} | "
+              f"{flow['segments_up']:5d}/{flow['segments_down']:<6d} | "
+              f"{flow['retransmits_up']:5d}/{flow['retransmits_down']:<6d} | "
+              f"{flow['records_up']:7d}/{flow['records_down']:<7d} | {flow['round_trips']:4g} | {flow['syn_rtt_ms']:.3f}")
+        print(f"    | records down: {flow['record_sizes_down']}")
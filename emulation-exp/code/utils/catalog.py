@@ -0,0 +1,338 @@
+"""SQLite catalog of every run and the data files it wrote.
+
+CSV file names carry the RTT measured when the run started
+(`prime256v1_6p158ms.csv`), which differs from run to run, so finding the
+data of a latency level meant knowing the exact strings. Every runner
+registers its run (host, command line, OpenSSL/nginx builds, git commit)
+and every cell it finishes (algorithm, certificate, nominal and measured
+link parameters, sample count, CSV path and result store), and analysis
+asks the catalog instead of the directory:
+
+    catalog = RunCatalog("../../mn_data/catalog.sqlite")
+    run_id = catalog.start_run("mininet", "kex", manifest.run, argv=sys.argv, **build_versions(nginx_path))
+    catalog.record_cell(run_id, "prime256v1", path=csv_path, rtt_nominal_ms=5.368, rtt_measured_ms=6.158,
+                        loss_pct=1, samples=1000)
+    catalog.finish_run(run_id)
+
+    catalog.cells(experiment="kex", rtt_nominal_ms=5.368, loss_pct=slice(0, 5))
+    catalog.paths(experiment="kex", rtt_nominal_ms=5.368)  # {algorithm: csv path of its latest run}
+
+Filters take a value, a list of values or a slice as in ResultStore.load,
+and every lookup column is indexed. By default only the latest run of each
+(experiment, algorithm, certificate, RTT, loss) cell is returned, so a
+rerun supersedes the imported or earlier data of its cells. Paths are
+stored relative to the catalog, so a data directory can be copied off the
+testbed with its catalog. CSV files from before the catalog are registered
+with
+
+    python3 catalog.py import ../../mn_data/catalog.sqlite kex ../../mn_data/kex/*.csv
+    python3 catalog.py cells ../../mn_data/catalog.sqlite --experiment kex --rtt 5.368
+"""
+import argparse
+import glob
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import threading
+import time
+
+from algorithms import OpenSSL
+from result_store import CSV_NAME, EMULATION_RTTS_MS, parse_rtt_str
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    testbed TEXT NOT NULL,          -- mininet, satellite or import
+    experiment TEXT NOT NULL,       -- kex or sig
+    host TEXT NOT NULL,
+    run INTEGER NOT NULL,           -- run number of the manifest, or the satellite run ID
+    started REAL NOT NULL,
+    finished REAL,
+    argv TEXT,                      -- JSON list
+    openssl TEXT,
+    openssl_digest TEXT,            -- hash of the openssl binary and config, see algorithms.py
+    nginx TEXT,
+    git_commit TEXT,
+    UNIQUE (testbed, experiment, host, run)
+);
+CREATE TABLE IF NOT EXISTS cells (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    experiment TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    certificate TEXT,               -- signature algorithm served in kex x sig matrices
+    rtt_nominal_ms REAL,            -- RTT configured through netem, NULL on real links
+    rtt_measured_ms REAL,
+    loss_pct REAL,                  -- netem loss, NULL on real links
+    loss_measured_pct REAL,         -- probe loss, where measured
+    client_mbps REAL,
+    server_mbps REAL,
+    samples INTEGER NOT NULL,
+    path TEXT,                      -- CSV file holding the cell
+    store TEXT,                     -- result store holding the cell, rows tagged with runs.run
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cells_rtt ON cells (experiment, rtt_nominal_ms, algorithm, loss_pct);
+CREATE INDEX IF NOT EXISTS cells_algorithm ON cells (experiment, algorithm, certificate);
+CREATE INDEX IF NOT EXISTS cells_run ON cells (run_id);
+"""
+CELL_KEY = ("algorithm", "certificate", "rtt_nominal_ms", "loss_pct")
+RUN_COLUMNS = ("testbed", "host", "run", "started", "finished", "openssl", "nginx", "git_commit")
+
+
+def _version(command):
+    """First output line of a version command, None if it cannot run."""
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    lines = result.stdout.strip().splitlines()
+    return lines[0] if result.returncode == 0 and lines else None
+
+
+def build_versions(nginx_path=None, openssl=None):
+    """Versions of the OpenSSL and nginx builds and the git commit of the code, for start_run."""
+    openssl = openssl or OpenSSL()
+    available = openssl.available
+    return {
+        "openssl": _version([openssl.path, "version"]) if available else None,
+        "openssl_digest": openssl.digest if available else None,
+        "nginx": _version([nginx_path, "-v"]) if nginx_path else None,
+        "git_commit": _version(["git", "-C", os.path.dirname(os.path.abspath(__file__)), "rev-parse", "HEAD"]),
+    }
+
+
+def _where(where, table=None):
+    """SQL condition and parameters for ResultStore.load style filters.
+
+    Without a table, run columns are looked up in runs and all others in cells.
+    """
+    clauses, params = [], []
+    for column, value in where.items():
+        name = f"{table or ('runs' if column in RUN_COLUMNS else 'cells')}.{column}"
+        if value is None:
+            clauses.append(f"{name} IS NULL")
+        elif isinstance(value, slice):
+            if value.start is not None:
+                clauses.append(f"{name} >= ?")
+                params.append(value.start)
+            if value.stop is not None:
+                clauses.append(f"{name} < ?")
+                params.append(value.stop)
+        elif isinstance(value, (list, tuple, set)):
+            value = list(value)
+            clauses.append(f"{name} IN ({','.join('?' * len(value))})")
+            params += value
+        else:
+            clauses.append(f"{name} = ?")
+            params.append(value)
+    return " AND ".join(clauses) or "1", params
+
+
+class RunCatalog:
+    """Thread-safe handle on a catalog database, created on first use."""
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # The Mininet pairs record their cells from worker threads
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def start_run(self, testbed, experiment, run, host=None, argv=None, **versions):
+        """Register a run, or a resumed one again, and return its catalog ID."""
+        host = host or socket.gethostname()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO runs (testbed, experiment, host, run, started, argv, openssl, openssl_digest, nginx,"
+                " git_commit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (testbed, experiment, host, run) DO UPDATE SET finished = NULL, argv = excluded.argv,"
+                " openssl = excluded.openssl, openssl_digest = excluded.openssl_digest, nginx = excluded.nginx,"
+                " git_commit = excluded.git_commit",
+                (testbed, experiment, host, run, time.time(), json.dumps(argv), versions.get("openssl"),
+                 versions.get("openssl_digest"), versions.get("nginx"), versions.get("git_commit")))
+            return self._db.execute("SELECT id FROM runs WHERE testbed = ? AND experiment = ? AND host = ? AND run = ?",
+                                    (testbed, experiment, host, run)).fetchone()[0]
+
+    def record_cell(self, run_id, algorithm, samples, certificate=None, rtt_nominal_ms=None, loss_pct=None,
+                    **columns):
+        """Record a finished cell of a run, replacing an earlier record of the same cell."""
+        for column in ("path", "store"):
+            if columns.get(column):
+                columns[column] = os.path.relpath(columns[column], os.path.dirname(os.path.abspath(self.path)))
+        key = {"algorithm": algorithm, "certificate": certificate, "rtt_nominal_ms": rtt_nominal_ms,
+               "loss_pct": loss_pct}
+        row = {"run_id": run_id, **key, "samples": samples, "recorded": time.time(), **columns}
+        with self._lock, self._db:
+            experiment = self._db.execute("SELECT experiment FROM runs WHERE id = ?", (run_id,)).fetchone()[0]
+            self._db.execute("DELETE FROM cells WHERE run_id = ? AND " +
+                             " AND ".join(f"{column} IS ?" for column in CELL_KEY),
+                             [run_id] + [key[column] for column in CELL_KEY])
+            row["experiment"] = experiment
+            self._db.execute(f"INSERT INTO cells ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                             list(row.values()))
+
+    def finish_run(self, run_id):
+        with self._lock, self._db:
+            self._db.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), run_id))
+
+    def runs(self, **where):
+        """Registered runs as dicts, oldest first."""
+        condition, params = _where(where, "runs")
+        with self._lock:
+            rows = self._db.execute(f"SELECT * FROM runs WHERE {condition} ORDER BY started, id", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def cells(self, latest=True, **where):
+        """Cells matching where, joined with their run, as dicts ordered by RTT, algorithm and loss.
+
+        With latest only the most recent run's record of every cell is kept.
+        """
+        condition, params = _where(where)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT cells.*, runs.testbed, runs.host, runs.run, runs.started, runs.finished, runs.openssl,"
+                " runs.nginx, runs.git_commit FROM cells JOIN runs ON runs.id = cells.run_id"
+                f" WHERE {condition} ORDER BY runs.started, cells.recorded", params).fetchall()
+        cells = [dict(row) for row in rows]
+        for cell in cells:
+            for column in ("path", "store"):
+                if cell[column]:
+                    cell[column] = os.path.join(os.path.dirname(self.path), cell[column])
+        if latest:
+            newest = {}
+            for cell in cells:
+                newest[(cell["experiment"],) + tuple(cell[column] for column in CELL_KEY)] = cell
+            cells = list(newest.values())
+
+        def order(cell):
+            return tuple((cell[column] is None, cell[column] or 0) for column in ("rtt_nominal_ms", "loss_pct")) + \
+                (cell["algorithm"], cell["certificate"] or "")
+        return sorted(cells, key=order)
+
+    def paths(self, **where):
+        """{algorithm: CSV path} of the latest cells matching where that have a file."""
+        return {cell["algorithm"]: cell["path"] for cell in self.cells(**where) if cell["path"]}
+
+    def values(self, column, **where):
+        """Distinct values of a cells column among the latest cells matching where, ascending."""
+        return sorted({cell[column] for cell in self.cells(**where) if cell[column] is not None})
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def import_csv(catalog, run_id, csv_path, nominal_rtts=EMULATION_RTTS_MS, has_loss=True, **columns):
+    """Register one '<alg>_<rtt>ms.csv' file of a run; the nominal RTT is the closest of nominal_rtts.
+
+    Returns the number of samples in the file.
+    """
+    match = CSV_NAME.match(os.path.basename(csv_path))
+    if not match:
+        raise ValueError(f"Cannot parse algorithm and RTT from {csv_path}")
+    algorithm = match.group(1)
+    rtt_measured_ms = parse_rtt_str(match.group(2))
+    rtt_nominal_ms = None
+    if nominal_rtts:
+        rtt_nominal_ms = min(nominal_rtts, key=lambda rtt: abs(rtt - rtt_measured_ms))
+
+    total = 0
+    with open(csv_path) as f:
+        for line in f:
+            values = [v for v in line.strip().split(",") if v != ""]
+            if not values:
+                continue
+            loss_pct = float(values.pop(0)) if has_loss else None
+            catalog.record_cell(run_id, algorithm, len(values), rtt_nominal_ms=rtt_nominal_ms, loss_pct=loss_pct,
+                                rtt_measured_ms=rtt_measured_ms, path=csv_path, **columns)
+            total += len(values)
+    return total
+
+
+def import_directory(catalog, experiment, type_dir, nominal_rtts=EMULATION_RTTS_MS, has_loss=True, **columns):
+    """Register the CSV files in type_dir once, while the catalog has no run of experiment yet.
+
+    Lets the analysis scripts find data measured before the catalog existed;
+    after that, runs register themselves. Returns the number of files.
+    """
+    if catalog.runs(experiment=experiment):
+        return 0
+    csv_paths = sorted(path for path in glob.glob(os.path.join(type_dir, "*ms.csv"))
+                       if CSV_NAME.match(os.path.basename(path)))
+    if not csv_paths:
+        return 0
+    run_id = catalog.start_run("import", experiment, int(time.time()), argv=csv_paths)
+    for csv_path in csv_paths:
+        import_csv(catalog, run_id, csv_path, nominal_rtts, has_loss, **columns)
+    catalog.finish_run(run_id)
+    print(f"✅ Registered {len(csv_paths)} {experiment} CSV files from before the catalog in {catalog.path}")
+    return len(csv_paths)
+
+
+def print_cells(cells):
+    print(f"{'Run':>12} | {'Host':12} | {'Algorithm':24} | {'Certificate':12} | {'RTT nominal':>11} | "
+          f"{'RTT measured':>12} | {'Loss %':>6} | {'Samples':>7} | Path")
+    for cell in cells:
+        nominal = "" if cell["rtt_nominal_ms"] is None else f"{cell['rtt_nominal_ms']:.3f}"
+        loss = "" if cell["loss_pct"] is None else f"{cell['loss_pct']:g}"
+        measured = "" if cell["rtt_measured_ms"] is None else f"{cell['rtt_measured_ms']:.3f}"
+        print(f"{cell['testbed'][:3]}-{cell['run']:<8} | {cell['host'][:12]:12} | {cell['algorithm'][:24]:24} | "
+              f"{(cell['certificate'] or '')[:12]:12} | {nominal:>11} | {measured:>12} | {loss:>6} | "
+              f"{cell['samples']:7d} | {cell['path'] or cell['store'] or ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the run catalog or register existing CSV files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    runs_parser = subparsers.add_parser("runs", help="list the registered runs")
+    runs_parser.add_argument("catalog")
+    cells_parser = subparsers.add_parser("cells", help="list the latest cells matching the filters")
+    cells_parser.add_argument("catalog")
+    cells_parser.add_argument("--experiment", choices=["kex", "sig"])
+    cells_parser.add_argument("--testbed", choices=["mininet", "satellite", "import"])
+    cells_parser.add_argument("--algorithm", nargs="+")
+    cells_parser.add_argument("--certificate")
+    cells_parser.add_argument("--rtt", type=float, help="nominal RTT in ms")
+    cells_parser.add_argument("--loss", type=float, help="netem loss in %%")
+    cells_parser.add_argument("--all", action="store_true", help="every run's record, not only the latest")
+    import_parser = subparsers.add_parser("import", help="register CSV files written before the catalog")
+    import_parser.add_argument("catalog")
+    import_parser.add_argument("experiment", choices=["kex", "sig"])
+    import_parser.add_argument("csv_files", nargs="+")
+    import_parser.add_argument("--satellite", action="store_true",
+                               help="CSV rows have no loss column and no nominal RTT")
+    args = parser.parse_args()
+
+    with RunCatalog(args.catalog) as catalog:
+        if args.command == "runs":
+            for run in catalog.runs():
+                state = "finished" if run["finished"] else "unfinished"
+                started = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["started"]))
+                print(f"{run['testbed']:9} {run['experiment']:3} {run['host']:16} run {run['run']:<10} {started} "
+                      f"{state:10} {run['openssl'] or ''} {run['git_commit'] or ''}")
+        elif args.command == "cells":
+            where = {"experiment": args.experiment, "testbed": args.testbed, "algorithm": args.algorithm,
+                     "certificate": args.certificate, "rtt_nominal_ms": args.rtt, "loss_pct": args.loss}
+            print_cells(catalog.cells(latest=not args.all,
+                                      **{column: value for column, value in where.items() if value is not None}))
+        else:
+            # All files of one import share a run, named after the time of the import
+            run_id = catalog.start_run("import", args.experiment, int(time.time()), argv=args.csv_files)
+            link = {} if args.satellite else {"client_mbps": 100, "server_mbps": 20}
+            for csv_path in args.csv_files:
+                count = import_csv(catalog, run_id, csv_path, nominal_rtts=None if args.satellite else EMULATION_RTTS_MS,
+                                   has_loss=not args.satellite, **link)
+                print(f"✅ Registered {count} samples from {csv_path}")
+            catalog.finish_run(run_id)
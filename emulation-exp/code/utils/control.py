@@ -0,0 +1,189 @@
+"""JSON lines control channel between the satellite client and server.
+
+The client drives the campaign over one persistent TCP connection. Every
+request is one JSON object per line with a command name, and the server
+answers each with one line:
+
+    -> {"id": 3, "cmd": "use_cert", "sig": "dilithium3"}
+    <- {"id": 3, "ok": true, "sig": "dilithium3", "ca": "-----BEGIN CERTIFICATE-----...", "reload_s": 0.41}
+    <- {"id": 4, "ok": false, "error": "..."}
+
+ControlServer dispatches requests to handler functions until one of them
+raises Finished. ControlClient waits for the server to come up, and if the
+connection drops it reconnects and repeats the request, so every command
+must be safe to repeat. The nginx helpers below are what the satellite
+server's handlers use to switch certificates without restarting nginx.
+"""
+import json
+import socket
+import subprocess
+import time
+
+from cpu_account import process_tree
+
+
+class ControlError(RuntimeError):
+    """Raised by ControlClient.call when the server reports a failed command."""
+
+
+class Finished(Exception):
+    """Raised by a handler to answer its request and stop serving; args[0] is the reply."""
+
+
+def _send(sock, message):
+    sock.sendall((json.dumps(message) + "\n").encode())
+
+
+class ControlServer:
+    """Serves control connections one at a time on host:port."""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def serve(self, handlers):
+        """Answer requests with handlers[cmd](**arguments) until a handler raises Finished."""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server_socket.bind((self.host, self.port))
+            server_socket.listen()
+            while True:
+                conn, addr = server_socket.accept()
+                print(f"Control connection from {addr[0]}")
+                with conn, conn.makefile("r") as lines:
+                    try:
+                        for line in lines:
+                            if line.strip() and not self._handle(conn, json.loads(line), handlers):
+                                return
+                    except (ConnectionError, json.JSONDecodeError) as e:
+                        print(f"⚠️ Control connection lost: {e}")
+
+    @staticmethod
+    def _handle(conn, request, handlers):
+        """Answer one request; returns False once serving should stop."""
+        arguments = {key: value for key, value in request.items() if key not in ("id", "cmd")}
+        reply = {"id": request.get("id")}
+        handler = handlers.get(request.get("cmd"))
+        try:
+            if handler is None:
+                raise ValueError(f"unknown command {request.get('cmd')!r}")
+            reply.update(ok=True, **(handler(**arguments) or {}))
+        except Finished as finished:
+            reply.update(ok=True, **(finished.args[0] if finished.args else {}))
+            _send(conn, reply)
+            return False
+        except Exception as e:
+            reply.update(ok=False, error=f"{type(e).__name__}: {e}")
+        _send(conn, reply)
+        return True
+
+
+class ControlClient:
+    """Persistent connection to a ControlServer.
+
+    Connecting is retried for up to connect_timeout seconds, so the client
+    may start before the server. timeout bounds each reply, and generating
+    the certificates of a slow algorithm takes a while.
+    """
+    def __init__(self, host, port, timeout=300.0, connect_timeout=600.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._sock = None
+        self._lines = None
+        self._next_id = 0
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                self._lines = self._sock.makefile("r")
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(1)
+
+    def _close(self):
+        if self._sock is not None:
+            self._lines.close()
+            self._sock.close()
+            self._sock = self._lines = None
+
+    def call(self, cmd, **arguments):
+        """Send one command and return the server's reply, retrying once on a new connection."""
+        self._next_id += 1
+        request = {"id": self._next_id, "cmd": cmd, **arguments}
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                _send(self._sock, request)
+                line = self._lines.readline()
+                if not line:
+                    raise ConnectionError("control connection closed")
+                break
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt:
+                    raise
+        reply = json.loads(line)
+        if not reply.pop("ok"):
+            raise ControlError(f"{cmd} failed on the server: {reply['error']}")
+        reply.pop("id")
+        return reply
+
+    def close(self):
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def nginx_workers(master_pid):
+    """Worker pids of an nginx master."""
+    return set(process_tree(master_pid)[1:])
+
+
+def port_open(host, port, timeout=1.0):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def reload_nginx(nginx_path, nginx_conf, master_pid, host, port, timeout=30.0):
+    """Reload nginx gracefully and wait until it is ready.
+
+    Ready means every worker of the old configuration has exited, so no
+    handshake is answered with the old certificate any more, and the TLS port
+    accepts connections. Returns the seconds it took.
+    """
+    start = time.perf_counter()
+    old_workers = nginx_workers(master_pid)
+    result = subprocess.run([nginx_path, "-c", nginx_conf, "-s", "reload"], stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"nginx rejected {nginx_conf}: {result.stdout.strip()}")
+    deadline = time.monotonic() + timeout
+    while True:
+        workers = nginx_workers(master_pid)
+        if workers and not workers & old_workers and port_open(host, port):
+            return time.perf_counter() - start
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"nginx not ready {timeout:g} s after reloading {nginx_conf}")
+        time.sleep(0.05)
+
+
+def render_conf(template_path, conf_path, sig):
+    """Write the sig nginx.conf template with ??SERVER_CERT??/??SERVER_KEY?? pointing at sig's chain."""
+    with open(template_path) as f:
+        conf = f.read()
+    conf = conf.replace("??SERVER_CERT??", f"{sig}_server.crt").replace("??SERVER_KEY??", f"{sig}_server.key")
+    with open(conf_path, "w") as f:
+        f.write(conf)
@@ -0,0 +1,338 @@
+"""Per-handshake CPU accounting for s_timer and nginx.
+
+Wall-clock latency hides how much CPU an algorithm costs the server. A
+CpuMeter snapshots the CPU time of named process groups around every batch,
+so the cost per handshake is the difference divided by the handshakes:
+
+    meter = CpuMeter(client=ProcessCpu(worker.proc.pid), server=ProcessCpu(nginx_master_pid))
+    with meter:
+        records = list(worker.measure(alg, 100))
+    columns = meter.columns(records)   # {"client_cpu_us": [...], "server_cpu_us": [...]}
+
+ProcessCpu follows a process and all of its descendants through procfs,
+e.g. the nginx master and its workers. It reads the nanosecond run time from
+/proc/<pid>/task/<tid>/schedstat and falls back to the utime and stime ticks
+of /proc/<pid>/stat on kernels without schedstats. CgroupCpu reads the usage
+of a cgroup (v2 cpu.stat or v1 cpuacct.usage) instead, which also counts
+processes that exited during the batch; Cgroup.create moves processes into a
+fresh one. pin() restricts a process tree to a set of cores, so that the
+client and server do not share caches or steal each other's time.
+
+The satellite server cannot see the client's batches, so there
+telemetry.TelemetryCollector logs the cumulative nginx CPU time as a time
+series and
+
+    python3 cpu_account.py join server_telemetry.jsonl batches.jsonl
+
+attributes it to the batches the client logged with their start and end
+times. `python3 cpu_account.py report <store>` prints the median CPU time per
+handshake of every algorithm next to its median latency.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def parse_cpus(value):
+    """Parse a CPU list such as '2-3,6' into a sorted list of core numbers."""
+    cpus = set()
+    for item in value.split(","):
+        first, _, last = item.partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"bad CPU list entry {item!r}, expected <n> or <first>-<last>")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def split_cpus(cpus, parts):
+    """Deal cpus round-robin into parts groups, sharing all of them if there are fewer cores than parts."""
+    if cpus is None:
+        return [None] * parts
+    if len(cpus) < parts:
+        return [list(cpus)] * parts
+    return [cpus[i::parts] for i in range(parts)]
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _stat_fields(pid):
+    """Fields of /proc/<pid>/stat after the command name, which may contain spaces."""
+    return _read(f"/proc/{pid}/stat").rsplit(")", 1)[1].split()
+
+
+def children(pid):
+    """Direct children of pid, from the task children files or a scan of /proc."""
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+        return [int(child) for tid in tasks for child in _read(f"/proc/{pid}/task/{tid}/children").split()]
+    except FileNotFoundError:
+        pass
+    result = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                if int(_stat_fields(entry)[1]) == pid:
+                    result.append(int(entry))
+            except (FileNotFoundError, ProcessLookupError, IndexError):
+                continue
+    return result
+
+
+def process_tree(pid):
+    """pid followed by all of its live descendants."""
+    tree = [pid]
+    for parent in tree:
+        try:
+            tree.extend(children(parent))
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return tree
+
+
+def process_cpu_us(pid):
+    """CPU time pid has used so far in microseconds, summed over its threads."""
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+        return sum(int(_read(f"/proc/{pid}/task/{tid}/schedstat").split()[0]) for tid in tasks) / 1000
+    except FileNotFoundError:
+        if not os.path.exists(f"/proc/{pid}"):
+            raise
+    fields = _stat_fields(pid)
+    return (int(fields[11]) + int(fields[12])) * 1e6 / CLK_TCK
+
+
+class ProcessCpu:
+    """CPU time of a process and all of its descendants, from procfs.
+
+    Processes are told apart by pid and start time, so a recycled pid is not
+    mistaken for the process that had it before. CPU used by a process that
+    exits during a batch is lost, which CgroupCpu avoids.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+
+    def snapshot(self):
+        usage = {}
+        for pid in process_tree(self.pid):
+            try:
+                usage[(pid, _stat_fields(pid)[19])] = process_cpu_us(pid)
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+        return usage
+
+    @staticmethod
+    def delta(before, after):
+        return sum(used - before.get(key, 0.0) for key, used in after.items())
+
+    def pids(self):
+        return process_tree(self.pid)
+
+
+class CgroupCpu:
+    """CPU time of every process in a cgroup, including those that already exited."""
+    def __init__(self, path):
+        self.path = path
+
+    def snapshot(self):
+        stat_path = os.path.join(self.path, "cpu.stat")
+        if os.path.exists(stat_path):
+            for line in _read(stat_path).splitlines():
+                name, value = line.split()
+                if name == "usage_usec":
+                    return float(value)
+        # cgroup v1 cpuacct reports nanoseconds
+        return int(_read(os.path.join(self.path, "cpuacct.usage"))) / 1000
+
+    @staticmethod
+    def delta(before, after):
+        return after - before
+
+    def pids(self):
+        return [int(pid) for pid in _read(os.path.join(self.path, "cgroup.procs")).split()]
+
+
+class Cgroup(CgroupCpu):
+    """A cgroup created for one process group and removed again on close()."""
+    @classmethod
+    def create(cls, name, pids, root=CGROUP_ROOT):
+        """Create <root>/pq-tls/<name> (v2) or its cpuacct equivalent (v1) and move pids into it."""
+        base = os.path.join(root, "pq-tls") if os.path.exists(os.path.join(root, "cgroup.controllers")) \
+            else os.path.join(root, "cpuacct", "pq-tls")
+        path = os.path.join(base, name)
+        os.makedirs(path, exist_ok=True)
+        cgroup = cls(path)
+        for pid in pids:
+            with open(os.path.join(path, "cgroup.procs"), "w") as f:
+                f.write(str(pid))
+        return cgroup
+
+    def close(self):
+        """Move the remaining processes back to the parent cgroup and remove this one."""
+        parent = os.path.dirname(os.path.dirname(self.path))
+        for pid in self.pids():
+            try:
+                with open(os.path.join(parent, "cgroup.procs"), "w") as f:
+                    f.write(str(pid))
+            except OSError:
+                continue
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+
+def account(name, pid, source="procfs"):
+    """CPU source of a process tree: procfs, or a cgroup the tree is moved into."""
+    if source == "procfs":
+        return ProcessCpu(pid)
+    if source == "cgroup":
+        return Cgroup.create(name, process_tree(pid))
+    raise ValueError(f"unknown CPU accounting source {source!r}")
+
+
+def pin(pid, cpus):
+    """Restrict every thread of a process tree to cpus; returns the pinned thread ids."""
+    pinned = []
+    for process in process_tree(pid):
+        try:
+            tids = [int(tid) for tid in os.listdir(f"/proc/{process}/task")]
+        except FileNotFoundError:
+            continue
+        for tid in tids:
+            try:
+                os.sched_setaffinity(tid, cpus)
+                pinned.append(tid)
+            except ProcessLookupError:
+                continue
+    return pinned
+
+
+def nginx_master_pid(nginx_path, pid_file="logs/nginx.pid", timeout=5.0):
+    """Read the pid of a daemonized nginx, waiting for it to write its pid file.
+
+    Relative pid files are resolved against the nginx prefix, the parent of
+    the sbin directory holding the binary.
+    """
+    path = pid_file
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(nginx_path))), pid_file)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            pid = int(_read(path).strip())
+            # A pid file left behind by a killed nginx names a dead process
+            if os.path.exists(f"/proc/{pid}"):
+                return pid
+        except (FileNotFoundError, ValueError):
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"no running nginx in pid file {path}")
+        time.sleep(0.05)
+
+
+class CpuMeter:
+    """CPU time of named process groups over one batch at a time.
+
+    Used as a context manager around a batch. Afterwards `last` holds the CPU
+    microseconds of each group as <name>_cpu_us, the batch wall time and its
+    start and end as unix times, ready for BatchLog.
+    """
+    def __init__(self, **sources):
+        self.sources = sources
+        self.last = {}
+
+    def __enter__(self):
+        self._before = {name: source.snapshot() for name, source in self.sources.items()}
+        self._start = time.time()
+        self._perf = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._perf
+        self.last = {f"{name}_cpu_us": source.delta(self._before[name], source.snapshot())
+                     for name, source in self.sources.items()}
+        self.last.update(cpu_wall_s=elapsed, batch_start=self._start, batch_end=self._start + elapsed)
+
+    def columns(self, records):
+        """Result store columns with the CPU microseconds per handshake of the last batch."""
+        if not self.last or not records:
+            return {}
+        return {f"{name}_cpu_us": self.last[f"{name}_cpu_us"] / len(records) for name in self.sources}
+
+    def close(self):
+        for source in self.sources.values():
+            if hasattr(source, "close"):
+                source.close()
+
+
+def join_batches(samples, batches):
+    """Attribute a series of cumulative cpu_us samples to logged batches by interpolating it at their start and end.
+
+    Both files come from different machines, so their clocks should be
+    synchronized (e.g. NTP) to well within the batch duration. Returns a
+    copy of every batch that lies inside the series with server_cpu_us set.
+    """
+    timestamps = np.asarray([sample["timestamp"] for sample in samples])
+    cpu_us = np.asarray([sample["cpu_us"] for sample in samples])
+    joined = []
+    for batch in batches:
+        if "batch_start" not in batch or len(timestamps) < 2:
+            continue
+        if batch["batch_start"] < timestamps[0] or batch["batch_end"] > timestamps[-1]:
+            continue
+        start, end = np.interp([batch["batch_start"], batch["batch_end"]], timestamps, cpu_us)
+        joined.append(dict(batch, server_cpu_us=float(end - start)))
+    return joined
+
+
+def _load_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def report(store_path, **where):
+    """Print the median CPU microseconds per handshake and latency of every algorithm in a store."""
+    from result_store import ResultStore
+
+    data = ResultStore(store_path).load(["algorithm", "handshake_ms", "client_cpu_us", "server_cpu_us"], **where)
+    print(f"{'Algorithm':24} | {'handshakes':>10} | {'latency ms':>10} | {'client CPU us':>13} | {'server CPU us':>13}")
+    for algorithm in dict.fromkeys(data["algorithm"]):
+        mask = data["algorithm"] == algorithm
+        client, server = data["client_cpu_us"][mask], data["server_cpu_us"][mask]
+        print(f"{algorithm:24} | {mask.sum():10d} | {np.median(data['handshake_ms'][mask]):10.2f} | "
+              f"{np.nanmedian(client) if (~np.isnan(client)).any() else np.nan:13.1f} | "
+              f"{np.nanmedian(server) if (~np.isnan(server)).any() else np.nan:13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-handshake CPU accounting")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="median CPU per handshake of every algorithm in a store")
+    report_parser.add_argument("store")
+    report_parser.add_argument("--loss", type=float, default=None, help="only this loss level")
+    join_parser = subparsers.add_parser("join", help="attribute a server CPU series to the client's batches")
+    join_parser.add_argument("samples", help="server_telemetry.jsonl the satellite server sent back")
+    join_parser.add_argument("batches", help="batches.jsonl written by the satellite client")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report(args.store, **({} if args.loss is None else {"loss_pct": args.loss}))
+    else:
+        per_algorithm = {}
+        for batch in join_batches(_load_jsonl(args.samples), _load_jsonl(args.batches)):
+            totals = per_algorithm.setdefault(batch.get("algorithm"), [0.0, 0])
+            totals[0] += batch["server_cpu_us"]
+            totals[1] += batch["handshakes"]
+        if not per_algorithm:
+            print("⚠️ No batch lies inside the server CPU series")
+        for algorithm, (cpu_us, handshakes) in per_algorithm.items():
+            print(f"{algorithm:24} | {handshakes:8d} handshakes | {cpu_us / max(handshakes, 1):10.1f} server CPU us each")
@@ -0,0 +1,422 @@
+"""Discrete-event model of a TLS 1.3 handshake over a lossy, delayed link.
+
+Predicts the handshake latency distribution of any (RTT, loss, bandwidth,
+algorithm) cell in milliseconds of CPU time instead of minutes of Mininet
+time. Every handshake is the chain of events s_timer waits for:
+
+    SYN -> SYN-ACK -> ClientHello -> server flight (in slow start rounds)
+
+followed by the client's processing. Losses are drawn independently per
+packet and direction, like netem's loss on both ends. On Mininet's veth
+links netem sees whole GSO bursts, so by default a multi-segment write is
+lost or delivered as one (gso=False drops segments independently).
+
+A lost SYN or SYN-ACK is retransmitted after Linux's 1 s initial RTO. A
+lost single-segment write waits for the data RTO, RTT + max(2 RTT, 200 ms),
+while a multi-segment one is recovered by a tail loss probe and fast
+retransmit after about 3 RTT. Every further loss of the same data doubles
+the RTO. The server flight starts with a congestion window of 10 segments,
+doubles it every round and falls back to one segment after a timeout.
+Serialization runs at the client's and server's netem rates.
+
+All cells and samples are simulated at once as numpy arrays, so thousands
+of cells are evaluated per second. The per-algorithm processing time, the
+only free parameter, is fitted to the loss-free rows of the measured CSVs:
+
+    python3 handshake_sim.py calibrate kex ../../mn_data/kex
+    python3 handshake_sim.py rank kex ../../mn_data/kex --bandwidths 100/20,10/2 --top 20
+
+calibrate prints the prediction error of the median and 95th percentile of
+every measured cell and saves the fit next to the data; rank predicts the
+whole grid and lists the cells not measured yet by how much the algorithm
+is expected to differ from the classical baseline, counting only what the
+simulation can tell apart from its own sampling noise.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from plot import load_csv
+from result_store import EMULATION_RTTS_MS, parse_rtt_str
+
+# Grid of the emulation experiments
+EMULATION_LOSSES = [0, 0.1, 0.5, 1, 1.5, 2, 2.5, 3] + list(range(4, 21))
+CLIENT_MBPS = 100  # client egress, CLIENT_BANDWIDTH in experiment_mn.py
+SERVER_MBPS = 20   # server egress, SERVER_BANDWIDTH in experiment_mn.py
+
+# Linux TCP defaults
+MSS = 1448             # payload bytes per segment with timestamps
+HEADER_BYTES = 66      # Ethernet, IPv4 and TCP with timestamps
+INITIAL_CWND = 10
+SYN_RTO_MS = 1000
+MIN_RTO_MS = 200
+TLP_RTTS = 3           # probe timeout of 2 RTT plus the fast retransmit
+MAX_RETRIES = 15
+
+# Key share bytes (ClientHello, ServerHello) of the hybrid groups
+KEX_SIZES = {
+    "prime256v1": (65, 65),
+    "p256_kyber512_90s": (65 + 800, 65 + 768),
+    "p256_kyber768_90s": (65 + 1184, 65 + 1088),
+    "p256_kyber1024_90s": (65 + 1568, 65 + 1568),
+}
+# Public key and signature bytes; the CA signs with the same algorithm
+SIG_SIZES = {
+    "ecdsap256": (65, 72),
+    "rsa3072": (398, 384),
+    "dilithium2": (1312, 2420),
+    "dilithium3": (1952, 3293),
+    "dilithium5": (2592, 4595),
+    "falcon512": (897, 666),
+    "falcon1024": (1793, 1280),
+    "sphincssha256128fsimple": (32, 17088),
+    "sphincssha256128ssimple": (32, 7856),
+}
+# The algorithm each experiment keeps fixed, and the baseline it compares against
+EXPERIMENTS = {
+    "kex": {"fixed": "ecdsap256", "baseline": "prime256v1", "algorithms": list(KEX_SIZES)},
+    "sig": {"fixed": "p256_kyber512_90s", "baseline": "ecdsap256", "algorithms": list(SIG_SIZES)},
+}
+
+# Fixed TLS overhead around the key shares, certificate and signature
+CLIENT_HELLO_BYTES = 230
+SERVER_FLIGHT_BYTES = 270
+CERTIFICATE_BYTES = 350
+
+# Processing time before calibration: s_timer and nginx overhead plus crypto
+DEFAULT_COMPUTE_MS = 2.5
+
+
+def flight_bytes(kex, sig):
+    """TLS bytes of the ClientHello and of the server's first flight."""
+    client_share, server_share = KEX_SIZES[kex]
+    public_key, signature = SIG_SIZES[sig]
+    certificate = CERTIFICATE_BYTES + public_key + signature
+    return CLIENT_HELLO_BYTES + client_share, SERVER_FLIGHT_BYTES + server_share + certificate + signature
+
+
+def experiment_flights(kind, algorithm):
+    """Flight sizes of an algorithm in the kex or sig experiment."""
+    fixed = EXPERIMENTS[kind]["fixed"]
+    return flight_bytes(algorithm, fixed) if kind == "kex" else flight_bytes(fixed, algorithm)
+
+
+def _timeouts(u, loss, units, rto_ms, probe_ms=None):
+    """Extra delay until every one of units independently lost packets got through.
+
+    The consecutive losses of the unluckiest unit are drawn by inverting
+    P(max losses <= k) = (1 - loss^(k+1))^units at the uniform numbers u.
+    k losses cost rto_ms *
+    (2^k - 1) of exponential backoff, or probe_ms for the first one where
+    probe_ms is given. Also returns k.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = np.ceil(np.log1p(-u ** (1 / units)) / np.log(loss)) - 1
+    k = np.where(loss > 0, np.clip(np.nan_to_num(k, posinf=MAX_RETRIES), 0, MAX_RETRIES), 0)
+    delay = rto_ms * (2 ** k - 1)
+    if probe_ms is not None:
+        delay = np.where(k > 0, probe_ms + rto_ms * (2 ** np.maximum(k - 1, 0) - 1), delay)
+    return delay, k
+
+
+def simulate(rtt_ms, loss_pct, client_mbps, server_mbps, client_bytes, server_bytes, compute_ms,
+             samples=1000, seed=None, gso=True, streams=None):
+    """Simulate samples handshakes of every cell; the arguments broadcast to one value per cell.
+
+    Cells with the same entry in streams draw the same random numbers for
+    the same event (the SYN, the i-th server window, ...), so the difference
+    between algorithms in one network condition is not drowned in sampling
+    noise. By default every cell draws its own.
+
+    Returns an array of shape (cells, samples) of handshake times in ms.
+    """
+    rng = np.random.default_rng(seed)
+    columns = np.broadcast_arrays(*(np.atleast_1d(np.asarray(value, dtype=float)) for value in
+                                    (rtt_ms, loss_pct, client_mbps, server_mbps, client_bytes, server_bytes, compute_ms)))
+    cells = len(columns[0])
+    streams = np.arange(cells) if streams is None else np.unique(streams, return_inverse=True)[1].ravel()
+    stream_count = streams.max() + 1
+    # Row of every simulated handshake in one draw of stream_count x samples uniform numbers
+    draw_index = (streams[:, None] * samples + np.arange(samples)).ravel()
+
+    def draw():
+        return rng.random(stream_count * samples)[draw_index]
+    rtt, loss, up_mbps, down_mbps, client_bytes, server_bytes, compute = (np.repeat(c, samples) for c in columns)
+    loss = loss / 100
+    one_way = rtt / 2
+    data_rto = rtt + np.maximum(2 * rtt, MIN_RTO_MS)
+
+    tail_probe = TLP_RTTS * rtt
+
+    def serialize(payload, segments, mbps):
+        return (payload + segments * HEADER_BYTES) * 8 / (mbps * 1000)
+
+    def write_timeouts(segments, sending=slice(None)):
+        # A multi-segment write is recovered by a tail loss probe, a single segment by the RTO
+        units = np.ones_like(segments) if gso else segments
+        probe = np.where(segments > 1, tail_probe[sending], np.inf)
+        delay, losses = _timeouts(draw()[sending], loss[sending], units, data_rto[sending], probe)
+        return np.where(np.isinf(delay), data_rto[sending] * (2 ** losses - 1), delay), losses
+
+    # TCP handshake
+    t = one_way + _timeouts(draw(), loss, 1, SYN_RTO_MS)[0]
+    t += one_way + _timeouts(draw(), loss, 1, SYN_RTO_MS)[0]
+
+    # ClientHello
+    segments = np.ceil(client_bytes / MSS)
+    t += serialize(client_bytes, segments, up_mbps) + one_way + write_timeouts(segments)[0]
+
+    # Server flight, one congestion window per round trip
+    total = np.ceil(server_bytes / MSS)
+    remaining = total.copy()
+    cwnd = np.full(len(t), INITIAL_CWND, dtype=float)
+    arrival = t.copy()
+    while True:
+        sending = remaining > 0
+        if not sending.any():
+            break
+        segments = np.minimum(cwnd, remaining)[sending]
+        sent = (total - remaining)[sending] * MSS
+        payload = np.minimum(segments * MSS, server_bytes[sending] - sent)
+        delay, losses = write_timeouts(segments, sending)
+        arrival[sending] = t[sending] + serialize(payload, segments, down_mbps[sending]) + one_way[sending] + delay
+        # The next window leaves once the ACKs of this one are back
+        t[sending] = arrival[sending] + one_way[sending]
+        cwnd[sending] = np.where(losses > 0, 1, 2 * cwnd[sending])
+        remaining[sending] -= segments
+
+    return (arrival + compute).reshape(cells, samples)
+
+
+def load_measured(data_dir):
+    """Measured cells of a data directory as (algorithm, rtt_ms, loss_pct, samples) tuples."""
+    cells = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*ms.csv"))):
+        match = re.fullmatch(r"(.+)_(\d+p\d+)ms\.csv", os.path.basename(path))
+        if match is None:
+            continue
+        losses, samples = load_csv(path)
+        for loss_pct, row in zip(losses, samples):
+            cells.append((match.group(1), parse_rtt_str(match.group(2)), float(loss_pct), row[~np.isnan(row)]))
+    return cells
+
+
+def predict_cells(kind, cells, compute_ms, samples=1000, seed=0, common_random=False):
+    """Simulate (algorithm, rtt_ms, loss_pct, client_mbps, server_mbps) cells of an experiment.
+
+    With common_random the algorithms of the same network condition share
+    their random numbers, see simulate.
+    """
+    algorithms, rtts, losses, client_mbps, server_mbps = (np.asarray(column) for column in zip(*cells))
+    flights = np.array([experiment_flights(kind, algorithm) for algorithm in algorithms], dtype=float)
+    compute = [compute_ms.get(algorithm, compute_ms.get(None, DEFAULT_COMPUTE_MS)) for algorithm in algorithms]
+    streams = None
+    if common_random:
+        streams = np.unique(np.stack([rtts, losses, client_mbps, server_mbps]).astype(float), axis=1,
+                            return_inverse=True)[1]
+    return simulate(rtts.astype(float), losses.astype(float), client_mbps.astype(float), server_mbps.astype(float),
+                    flights[:, 0], flights[:, 1], compute, samples=samples, seed=seed, streams=streams)
+
+
+def calibrate(kind, measured, samples=1000):
+    """Fit each algorithm's processing time to its loss-free cells.
+
+    The fit is the median gap between the measured and the simulated
+    loss-free medians; key None holds the median fit of all algorithms,
+    used for algorithms without data.
+    """
+    clean = [cell for cell in measured if cell[2] == 0 and cell[0] in EXPERIMENTS[kind]["algorithms"]]
+    if not clean:
+        raise ValueError(f"No loss-free {kind} cells to calibrate against")
+    predicted = predict_cells(kind, [(alg, rtt, 0, CLIENT_MBPS, SERVER_MBPS) for alg, rtt, _, _ in clean],
+                              {None: 0}, samples)
+    gaps = {}
+    for (algorithm, _, _, values), network in zip(clean, predicted):
+        gaps.setdefault(algorithm, []).append(np.median(values) - np.median(network))
+    compute_ms = {algorithm: max(float(np.median(gap)), 0.0) for algorithm, gap in gaps.items()}
+    compute_ms[None] = float(np.median(list(compute_ms.values())))
+    return compute_ms
+
+
+def calibration_error(kind, measured, compute_ms, samples=1000):
+    """Measured and predicted median and p95 of every measured cell."""
+    measured = [cell for cell in measured if cell[0] in EXPERIMENTS[kind]["algorithms"]]
+    predicted = predict_cells(kind, [(alg, rtt, loss, CLIENT_MBPS, SERVER_MBPS) for alg, rtt, loss, _ in measured],
+                              compute_ms, samples)
+    rows = []
+    for (algorithm, rtt, loss, values), simulated in zip(measured, predicted):
+        rows.append({
+            "algorithm": algorithm, "rtt_ms": rtt, "loss_pct": loss,
+            "median": float(np.median(values)), "predicted_median": float(np.median(simulated)),
+            "p95": float(np.percentile(values, 95)), "predicted_p95": float(np.percentile(simulated, 95)),
+        })
+    return rows
+
+
+def calibration_path(data_dir):
+    return os.path.join(data_dir, "sim_calibration.json")
+
+
+def save_calibration(data_dir, compute_ms):
+    # JSON keys are strings, so the fallback is stored as "*"
+    with open(calibration_path(data_dir), "w") as f:
+        json.dump({("*" if alg is None else alg): ms for alg, ms in compute_ms.items()}, f, indent=2)
+
+
+def load_calibration(data_dir):
+    try:
+        with open(calibration_path(data_dir)) as f:
+            return {(None if alg == "*" else alg): ms for alg, ms in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def quantile_bounds(ordered, q, confidence=0.95):
+    """Distribution-free confidence interval of the q quantile of every row of a row-sorted array.
+
+    The bounds are the order statistics at n q -/+ z sqrt(n q (1 - q)).
+    """
+    n = ordered.shape[1]
+    half = NormalDist().inv_cdf(0.5 + confidence / 2) * np.sqrt(n * q * (1 - q))
+    low = int(np.clip(np.floor(n * q - half), 0, n - 1))
+    high = int(np.clip(np.ceil(n * q + half), 0, n - 1))
+    return ordered[:, low], ordered[:, high]
+
+
+def rank_cells(kind, rtts, losses, bandwidths, compute_ms, measured=(), samples=1000, samples_per_cell=1000,
+               confidence=0.95, seed=0):
+    """Predict the grid and score every cell by the predicted gap to the baseline.
+
+    The algorithms of one network condition share their random numbers.
+    Every cell's median and p95 difference to the baseline gets an interval
+    from the quantiles' confidence intervals, and the score is the larger
+    of the two intervals' distance from zero in %, so a difference the
+    simulation cannot tell from noise scores 0. At high loss the latency
+    is bimodal and the median jumps between the modes from seed to seed;
+    its interval then spans both. cost is the predicted seconds to measure
+    samples_per_cell handshakes. Cells in measured (algorithm, rtt, loss)
+    are flagged.
+    """
+    algorithms = EXPERIMENTS[kind]["algorithms"]
+    baseline = EXPERIMENTS[kind]["baseline"]
+    cells = [(alg, rtt, loss, client, server)
+             for client, server in bandwidths for rtt in rtts for loss in losses for alg in algorithms]
+    predicted = predict_cells(kind, cells, compute_ms, samples, seed, common_random=True)
+    means = predicted.mean(axis=1)
+    predicted.sort(axis=1)
+    # (point estimate, low, high) of the median and p95 of every cell
+    stats = {}
+    for name, q in (("median", 0.5), ("p95", 0.95)):
+        stats[name] = (np.quantile(predicted, q, axis=1), *quantile_bounds(predicted, q, confidence))
+    base = {cell[1:]: i for i, cell in enumerate(cells) if cell[0] == baseline}
+    # Measured files are named after the ping RTT, match them to the closest grid RTT
+    done = {(alg, min(rtts, key=lambda rtt: abs(rtt - measured_rtt)), loss) for alg, measured_rtt, loss in measured}
+
+    rows = []
+    for i, (cell, mean) in enumerate(zip(cells, means)):
+        alg, rtt, loss, client, server = cell
+        j = base[cell[1:]]
+        row = {"algorithm": alg, "rtt_ms": rtt, "loss_pct": loss, "client_mbps": client, "server_mbps": server}
+        score = 0.0
+        for name, (point, low, high) in stats.items():
+            # Widest difference the two intervals allow, relative to the baseline's estimate
+            diff_low = 100 * (low[i] - high[j]) / point[j]
+            diff_high = 100 * (high[i] - low[j]) / point[j]
+            row[name] = float(point[i])
+            row[f"{name}_diff_pct"] = float(100 * (point[i] - point[j]) / point[j])
+            row[f"{name}_diff_low_pct"] = float(diff_low)
+            row[f"{name}_diff_high_pct"] = float(diff_high)
+            if diff_low > 0 or diff_high < 0:
+                score = max(score, min(abs(diff_low), abs(diff_high)))
+        row.update(score=float(score), cost_s=float(mean * samples_per_cell / 1000),
+                   measured=(alg, rtt, loss) in done and (client, server) == (CLIENT_MBPS, SERVER_MBPS))
+        rows.append(row)
+    # Among cells with the same score the cheaper ones come first
+    rows.sort(key=lambda row: (-row["score"], row["cost_s"]))
+    return rows
+
+
+def parse_bandwidths(value):
+    """Turn '100/20,10/2' into [(100.0, 20.0), (10.0, 2.0)] (client/server Mbps)."""
+    return [tuple(float(mbps) for mbps in pair.split("/")) for pair in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discrete-event TLS 1.3 handshake latency model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = subparsers.add_parser("calibrate", help="fit processing times to measured CSVs and report the error")
+    rank_parser = subparsers.add_parser("rank", help="predict a grid and rank the cells worth measuring")
+    for sub in (calibrate_parser, rank_parser):
+        sub.add_argument("kind", choices=sorted(EXPERIMENTS))
+        sub.add_argument("data_dir", help="directory with the '<alg>_<rtt>ms.csv' files, e.g. ../../mn_data/kex")
+        sub.add_argument("--samples", type=int, default=1000, help="simulated handshakes per cell")
+    rank_parser.add_argument("--rtts", type=lambda value: [float(rtt) for rtt in value.split(",")],
+                             default=EMULATION_RTTS_MS, help="comma separated RTTs in ms")
+    rank_parser.add_argument("--losses", type=lambda value: [float(loss) for loss in value.split(",")],
+                             default=EMULATION_LOSSES, help="comma separated loss percentages")
+    rank_parser.add_argument("--bandwidths", type=parse_bandwidths, default=[(CLIENT_MBPS, SERVER_MBPS)],
+                             help="comma separated client/server Mbps pairs, e.g. 100/20,10/2")
+    rank_parser.add_argument("--top", type=int, default=25, help="cells to print")
+    rank_parser.add_argument("--budget-hours", type=float, default=None,
+                             help="print the highest scoring cells that fit in this much measuring time instead")
+    rank_parser.add_argument("--include-measured", action="store_true", help="also rank cells already in data_dir")
+    rank_parser.add_argument("--json", action="store_true", help="print every ranked cell as one JSON object per line")
+    args = parser.parse_args()
+
+    measured = load_measured(args.data_dir)
+    if args.command == "calibrate":
+        compute_ms = calibrate(args.kind, measured, args.samples)
+        save_calibration(args.data_dir, compute_ms)
+        print("Fitted processing time (ms): " + ", ".join(
+            f"{alg or 'default'} {ms:.2f}" for alg, ms in compute_ms.items()))
+        start = time.perf_counter()
+        rows = calibration_error(args.kind, measured, compute_ms, args.samples)
+        elapsed = time.perf_counter() - start
+        print(f"\n{'Algorithm':<20} | {'RTT ms':>8} | {'Loss %':>6} | {'Median':>8} | {'Sim':>8} | {'p95':>8} | {'Sim':>8}")
+        print("-" * 84)
+        for row in rows:
+            print(f"{row['algorithm']:<20} | {row['rtt_ms']:8.2f} | {row['loss_pct']:6g} | {row['median']:8.1f} | "
+                  f"{row['predicted_median']:8.1f} | {row['p95']:8.1f} | {row['predicted_p95']:8.1f}")
+        for stat in ("median", "p95"):
+            errors = [abs(row[f"predicted_{stat}"] - row[stat]) / row[stat] for row in rows]
+            print(f"✅ {stat} error over {len(rows)} cells: median {100 * np.median(errors):.1f}%, "
+                  f"90th percentile {100 * np.percentile(errors, 90):.1f}%")
+        print(f"✅ Simulated {len(rows)} cells x {args.samples} handshakes in {elapsed:.2f} s")
+    else:
+        compute_ms = load_calibration(args.data_dir)
+        if not compute_ms:
+            print(f"⚠️ No calibration in {args.data_dir}, assuming {DEFAULT_COMPUTE_MS} ms of processing")
+        start = time.perf_counter()
+        rows = rank_cells(args.kind, args.rtts, args.losses, args.bandwidths, compute_ms,
+                          [cell[:3] for cell in measured], args.samples)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Predicted {len(rows)} cells in {elapsed:.2f} s")
+        if not args.include_measured:
+            rows = [row for row in rows if not row["measured"]]
+        if args.budget_hours is not None:
+            budget, picked = args.budget_hours * 3600, []
+            for row in rows:
+                if row["cost_s"] <= budget:
+                    picked.append(row)
+                    budget -= row["cost_s"]
+            rows = picked
+        else:
+            rows = rows[:args.top]
+        if args.json:
+            for row in rows:
+                print(json.dumps(row))
+        else:
+            print(f"{'Algorithm':<24} | {'RTT ms':>7} | {'Loss %':>6} | {'Mbps':>9} | {'Median':>8} | {'p95':>8} | "
+                  f"{'dMed %':>7} | {'dp95 %':>7} | {'Score':>7} | {'Cost s':>7}")
+            print("-" * 122)
+            for row in rows:
+                mbps = f"{row['client_mbps']:g}/{row['server_mbps']:g}"
+                print(f"{row['algorithm']:<24} | {row['rtt_ms']:7.2f} | {row['loss_pct']:6g} | {mbps:>9} | "
+                      f"{row['median']:8.1f} | {row['p95']:8.1f} | {row['median_diff_pct']:7.1f} | "
+                      f"{row['p95_diff_pct']:7.1f} | {row['score']:7.1f} | {row['cost_s']:7.0f}")
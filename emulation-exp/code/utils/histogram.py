@@ -0,0 +1,253 @@
+"""High dynamic range latency histograms.
+
+Buckets grow geometrically, so every recorded value between lowest_ms and
+highest_ms is kept with the same relative precision (0.1% with the default
+three significant digits) whether it is a 5 ms loopback handshake or a
+30 s retransmission stall. Recording is a single bincount, histograms of
+the same layout merge by addition, and they serialize sparsely to JSON.
+
+A SketchBook keeps one histogram per measurement cell, e.g. (algorithm,
+certificate, handshake type), and rewrites its JSON file every interval
+seconds, so a campaign of any length holds a fixed amount of memory and its
+percentiles can be read while it runs. Files from different runs and hosts
+merge without the raw samples:
+
+    python3 histogram.py show ../../../satellite-exp/sat_data/kex/sketches/*.json --by algorithm
+    python3 histogram.py merge all.json host1_*.json host2_*.json
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of latencies in milliseconds."""
+    def __init__(self, lowest_ms=0.01, highest_ms=3_600_000, digits=3):
+        self.lowest_ms = lowest_ms
+        self.highest_ms = highest_ms
+        self.digits = digits
+        self._log_ratio = math.log1p(10 ** -digits)
+        buckets = math.ceil(math.log(highest_ms / lowest_ms) / self._log_ratio) + 1
+        self.counts = np.zeros(buckets, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, values):
+        clipped = np.clip(values, self.lowest_ms, self.highest_ms)
+        index = np.floor(np.log(clipped / self.lowest_ms) / self._log_ratio).astype(np.int64)
+        return np.minimum(index, len(self.counts) - 1)
+
+    def _upper_edge(self, index):
+        return self.lowest_ms * np.exp((index + 1) * self._log_ratio)
+
+    def record(self, values):
+        """Add one value or an array of values."""
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.counts += np.bincount(self._index(values), minlength=len(self.counts))
+        self.total += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def _check_layout(self, other):
+        if (self.lowest_ms, self.highest_ms, self.digits) != (other.lowest_ms, other.highest_ms, other.digits):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+
+    def __iadd__(self, other):
+        self._check_layout(other)
+        self.counts += other.counts
+        self.total += other.total
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else math.nan
+
+    def quantiles(self, qs):
+        """Values at the given quantiles, each exact to the bucket precision.
+
+        Like HdrHistogram, the value reported is the upper edge of the bucket
+        holding the ceil(q * count)-th value, capped at the recorded maximum.
+        """
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        if self.total == 0:
+            return np.full(len(qs), math.nan)
+        ranks = np.maximum(np.ceil(qs * self.total), 1)
+        index = np.searchsorted(np.cumsum(self.counts), ranks)
+        return np.clip(self._upper_edge(index), self.min, self.max)
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def summary(self, qs=(0.5, 0.9, 0.99, 0.999)):
+        """Count, mean, max and the given quantiles, keyed 'p50', 'p99.9', ..."""
+        result = {"count": self.total, "mean": self.mean, "max": self.max if self.total else math.nan}
+        for q, value in zip(qs, self.quantiles(qs)):
+            result[f"p{q * 100:g}"] = float(value)
+        return result
+
+    def to_dict(self):
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "lowest_ms": self.lowest_ms,
+            "highest_ms": self.highest_ms,
+            "digits": self.digits,
+            "total": self.total,
+            "sum": self.sum,
+            "min": self.min if self.total else None,
+            "max": self.max if self.total else None,
+            "buckets": nonzero.tolist(),
+            "counts": self.counts[nonzero].tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["lowest_ms"], data["highest_ms"], data["digits"])
+        histogram.counts[data["buckets"]] = data["counts"]
+        histogram.total = data["total"]
+        histogram.sum = data["sum"]
+        if data["total"]:
+            histogram.min = data["min"]
+            histogram.max = data["max"]
+        return histogram
+
+
+def cell_key(cell):
+    return tuple(sorted(cell.items()))
+
+
+class SketchBook:
+    """LatencyHistograms keyed by cell labels, persisted as one JSON file.
+
+    runs and hosts list where the merged histograms came from.
+    """
+    def __init__(self, path=None, interval=60.0, runs=(), hosts=()):
+        self.path = path
+        self.interval = interval
+        self.runs = list(runs)
+        self.hosts = list(hosts)
+        self.sketches = {}
+        self._saved = time.monotonic()
+
+    def record(self, cell, values):
+        """Add values to the histogram of cell, a dict of labels."""
+        key = cell_key(cell)
+        if key not in self.sketches:
+            self.sketches[key] = LatencyHistogram()
+        self.sketches[key].record(values)
+
+    def __iadd__(self, other):
+        for key, histogram in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key] += histogram
+            else:
+                self.sketches[key] = LatencyHistogram.from_dict(histogram.to_dict())
+        self.runs += [run for run in other.runs if run not in self.runs]
+        self.hosts += [host for host in other.hosts if host not in self.hosts]
+        return self
+
+    def get(self, **cell):
+        return self.sketches.get(cell_key(cell))
+
+    def grouped(self, labels):
+        """Merge the cells that agree on labels, e.g. ['algorithm'] to pool runs and conditions."""
+        result = SketchBook(runs=self.runs, hosts=self.hosts)
+        for key, histogram in self.sketches.items():
+            cell = {name: value for name, value in key if name in labels}
+            group = result.sketches.setdefault(cell_key(cell), LatencyHistogram(
+                histogram.lowest_ms, histogram.highest_ms, histogram.digits))
+            group += histogram
+        return result
+
+    def summaries(self, qs=(0.5, 0.95, 0.99)):
+        """[(cell, summary)] of every cell, sorted by its labels."""
+        return [(dict(key), self.sketches[key].summary(qs)) for key in sorted(self.sketches, key=str)]
+
+    def to_dict(self):
+        return {
+            "runs": self.runs,
+            "hosts": self.hosts,
+            "cells": [{"cell": dict(key), "histogram": histogram.to_dict()} for key, histogram in self.sketches.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data, path=None, interval=60.0):
+        book = cls(path, interval, data.get("runs", ()), data.get("hosts", ()))
+        for entry in data["cells"]:
+            book.sketches[cell_key(entry["cell"])] = LatencyHistogram.from_dict(entry["histogram"])
+        return book
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f), path)
+
+    def save(self):
+        """Atomically rewrite the file."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, self.path)
+        self._saved = time.monotonic()
+
+    def maybe_save(self):
+        """Save if the last save is more than interval seconds ago."""
+        if time.monotonic() - self._saved >= self.interval:
+            self.save()
+
+
+def merge_files(paths):
+    book = SketchBook()
+    for path in paths:
+        book += SketchBook.load(path)
+    return book
+
+
+def print_summaries(book, qs=(0.5, 0.95, 0.99)):
+    rows = book.summaries(qs)
+    if not rows:
+        print("⚠️ No sketches")
+        return
+    names = [f"p{q * 100:g}" for q in qs]
+    lines = [f"{'Cell':60} | {'count':>8} | " + " | ".join(f"{name:>10}" for name in names) + f" | {'max':>10}"]
+    for cell, summary in rows:
+        label = ", ".join(f"{name}={value}" for name, value in cell.items()) or "all"
+        lines.append(f"{label:60} | {summary['count']:8d} | " + " | ".join(f"{summary[name]:10.2f}" for name in names)
+                     + f" | {summary['max']:10.2f}")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge and inspect latency sketch files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="print count and percentiles of every cell")
+    show_parser.add_argument("files", nargs="+")
+    show_parser.add_argument("--by", default=None,
+                             help="comma separated labels to group cells by, e.g. algorithm,certificate")
+    merge_parser = subparsers.add_parser("merge", help="merge sketch files from several runs or hosts into one")
+    merge_parser.add_argument("out")
+    merge_parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    book = merge_files(args.files)
+    if args.command == "show":
+        if args.by:
+            book = book.grouped(args.by.split(","))
+        print(f"Runs {', '.join(map(str, book.runs)) or '-'} on {', '.join(book.hosts) or '-'}")
+        print_summaries(book)
+    else:
+        book.path = args.out
+        book.save()
+        print(f"✅ Merged {len(args.files)} files into {len(book.sketches)} cells in {args.out}")
@@ -0,0 +1,138 @@
+"""Batched, verified configuration of the experiment links.
+
+A LinkController owns the ends of a link, e.g. the client and server
+interfaces of a Mininet pair. apply() changes the netem qdisc of every end
+in a single shell round trip per end, all ends at once: one `tc -batch`
+followed by a JSON read-back of the live qdisc. Ends already holding the
+requested settings are skipped, and a qdisc that does not match what was
+asked for raises LinkConfigError instead of silently measuring the wrong
+link for a whole CSV:
+
+    link = LinkController([LinkEnd("cli0-eth0", client.cmd), LinkEnd("srv0-eth0", server.cmd)])
+    elapsed_s = link.apply([Netem(2.684, 1, 100), Netem(2.684, 1, 20)])
+
+configure_address() does the same for the satellite hosts' `ip` set-up.
+"""
+import ipaddress
+import json
+import subprocess
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+Netem = namedtuple("Netem", ["delay_ms", "loss_pct", "rate_mbit", "limit", "jitter_ms"], defaults=[1000, 0])
+
+
+class LinkConfigError(RuntimeError):
+    """The live configuration of an interface differs from the requested one."""
+
+
+def shell(command):
+    """Run a shell command on this host and return its output, like Mininet's host.cmd."""
+    result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    return result.stdout
+
+
+def netem_command(intf, netem):
+    """tc batch line setting the root qdisc of intf; replace also creates it."""
+    command = (f"qdisc replace dev {intf} root netem "
+               f"limit {netem.limit} delay {netem.delay_ms:g}ms")
+    if netem.jitter_ms > 0:
+        command += f" {netem.jitter_ms:g}ms"
+    command += f" rate {netem.rate_mbit:g}mbit"
+    if netem.loss_pct > 0:
+        command += f" loss {netem.loss_pct:g}%"
+    return command
+
+
+def read_netem(output):
+    """Parse the Netem of the root qdisc from `tc -j qdisc show`, None if it is not netem."""
+    try:
+        # The JSON follows whatever tc -batch printed
+        qdiscs = json.loads(output[output.index("[{"):])
+    except ValueError:
+        return None
+    for qdisc in qdiscs:
+        if qdisc.get("kind") == "netem" and qdisc.get("root"):
+            options = qdisc.get("options", {})
+            return Netem(
+                delay_ms=1000 * options.get("delay", {}).get("delay", 0),
+                loss_pct=options.get("loss-random", {}).get("loss", 0) * 100,
+                rate_mbit=8 * options.get("rate", {}).get("rate", 0) / 1e6,
+                limit=options.get("limit", 0),
+                jitter_ms=1000 * options.get("delay", {}).get("jitter", 0),
+            )
+    return None
+
+
+def netem_matches(wanted, live):
+    """Compare settings up to the rounding of the kernel's tick and rate units."""
+    return (live is not None
+            and live.limit == wanted.limit
+            and abs(live.delay_ms - wanted.delay_ms) <= 0.001 + 1e-3 * wanted.delay_ms
+            and abs(live.jitter_ms - wanted.jitter_ms) <= 0.001 + 1e-3 * wanted.jitter_ms
+            and abs(live.loss_pct - wanted.loss_pct) <= 1e-6 + 1e-3 * wanted.loss_pct
+            and abs(live.rate_mbit - wanted.rate_mbit) <= 1e-2 * wanted.rate_mbit)
+
+
+class LinkEnd:
+    """One interface and the callable running shell commands in its namespace."""
+    def __init__(self, intf, run=shell):
+        self.intf = intf
+        self.run = run
+        self.netem = None  # last verified settings
+
+    def __repr__(self):
+        return f"LinkEnd({self.intf})"
+
+    def set_netem(self, netem):
+        output = self.run(f"printf '%s\\n' '{netem_command(self.intf, netem)}' | tc -batch - ; "
+                          f"tc -j qdisc show dev {self.intf}")
+        live = read_netem(output)
+        if not netem_matches(netem, live):
+            self.netem = None
+            raise LinkConfigError(f"{self.intf}: asked for {netem}, live qdisc is {live}\n{output.strip()}")
+        self.netem = netem
+
+
+class LinkController:
+    """The ends of one link, reconfigured together."""
+    def __init__(self, ends):
+        self.ends = ends
+
+    def apply(self, settings):
+        """Set settings[i] on ends[i] and return the seconds it took, 0 if nothing changed."""
+        changes = [(end, netem) for end, netem in zip(self.ends, settings) if end.netem != netem]
+        if not changes:
+            return 0.0
+        start = time.perf_counter()
+        with ThreadPool(len(changes)) as pool:
+            pool.starmap(LinkEnd.set_netem, changes)
+        return time.perf_counter() - start
+
+
+def configure_address(intf, address, run=shell):
+    """Bring intf up with address (CIDR) as its only address; return the seconds it took.
+
+    Does nothing if the interface is already up with just that address.
+    """
+    def live_addresses():
+        output = run(f"ip -j addr show dev {intf}")
+        try:
+            link = json.loads(output[output.index("[{"):])[0]
+        except (ValueError, IndexError) as e:
+            raise LinkConfigError(f"{intf}: {output.strip()}") from e
+        addresses = {f"{info['local']}/{info['prefixlen']}" for info in link.get("addr_info", [])
+                     if info.get("family") == "inet"}
+        return "UP" in link.get("flags", []), addresses
+
+    wanted = str(ipaddress.ip_interface(address))
+    if live_addresses() == (True, {wanted}):
+        return 0.0
+    start = time.perf_counter()
+    commands = [f"link set {intf} down", f"addr flush dev {intf}", f"link set {intf} up", f"addr add {wanted} dev {intf}"]
+    output = run("printf '%s\\n' " + " ".join(f"'{command}'" for command in commands) + " | ip -batch -")
+    if live_addresses() != (True, {wanted}):
+        raise LinkConfigError(f"{intf}: could not set {wanted}\n{output.strip()}")
+    return time.perf_counter() - start
@@ -0,0 +1,291 @@
+"""Time-varying link profiles replayed onto a pair's netem qdiscs.
+
+A trace is a CSV file with one row per link state: the offset in seconds
+at which the state starts and the delay, jitter, loss and rate of each
+direction ('up' is the client's egress, 'down' the server's):
+
+    time_s,up_delay_ms,up_jitter_ms,up_loss_pct,up_rate_mbit,down_delay_ms,...
+
+TraceReplay applies the rows on schedule from a background thread while
+handshakes run, and tags every sample with the row that was active when
+its handshake started. Synthetic traces of a LEO or GEO satellite path are
+generated with
+
+    python3 link_trace.py generate leo leo.csv --duration 600 --seed 1
+    python3 link_trace.py show leo.csv
+"""
+import argparse
+import bisect
+import csv
+import math
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from link_control import Netem
+
+LinkState = namedtuple("LinkState", [
+    "time_s",
+    "up_delay_ms", "up_jitter_ms", "up_loss_pct", "up_rate_mbit",
+    "down_delay_ms", "down_jitter_ms", "down_loss_pct", "down_rate_mbit",
+])
+
+# Result store columns describing the link state of a sample, see ResultStore.COLUMNS
+TRACE_COLUMNS = ("link_state", "link_rtt_ms", "link_loss_pct")
+
+SPEED_OF_LIGHT_KM_S = 299_792
+EARTH_RADIUS_KM = 6371
+
+
+def load_trace(path):
+    """Read a trace CSV into a list of LinkState sorted by time."""
+    with open(path) as f:
+        states = [LinkState(**{field: float(row[field]) for field in LinkState._fields}) for row in csv.DictReader(f)]
+    if not states:
+        raise ValueError(f"{path} holds no link states")
+    return sorted(states, key=lambda state: state.time_s)
+
+
+def save_trace(path, states):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(LinkState._fields)
+        for state in states:
+            writer.writerow(f"{value:.6g}" for value in state)
+
+
+def state_netem(state):
+    """Client and server Netem settings of a link state, in LinkController order."""
+    return [
+        Netem(state.up_delay_ms, state.up_loss_pct, state.up_rate_mbit, jitter_ms=state.up_jitter_ms),
+        Netem(state.down_delay_ms, state.down_loss_pct, state.down_rate_mbit, jitter_ms=state.down_jitter_ms),
+    ]
+
+
+def state_rtt_ms(state):
+    return state.up_delay_ms + state.down_delay_ms
+
+
+def state_loss_pct(state):
+    """Probability that a packet or its reply is lost, in percent."""
+    return 100 * (1 - (1 - state.up_loss_pct / 100) * (1 - state.down_loss_pct / 100))
+
+
+def trace_duration(states, end_s=None):
+    """Seconds until the last state ends.
+
+    That is end_s if given, otherwise the last state is assumed to last as
+    long as the one before. A single state needs end_s.
+    """
+    if end_s is not None:
+        if end_s <= states[-1].time_s:
+            raise ValueError(f"The trace ends at {end_s:g} s, before its last state starts at {states[-1].time_s:g} s")
+        return end_s
+    if len(states) == 1:
+        raise ValueError("A trace with a single link state needs an end time")
+    return states[-1].time_s + (states[-1].time_s - states[-2].time_s)
+
+
+class TraceReplay:
+    """Apply the states of a trace to a LinkController on schedule.
+
+    Use as a context manager around the measurement; finished turns true
+    once the last state has run for its duration, and raises the
+    LinkConfigError of a state the link did not take. Every applied state
+    is logged with the wall clock time it took effect, which is what
+    samples are tagged against. end_s is passed to trace_duration.
+    """
+    def __init__(self, link, states, end_s=None):
+        self.link = link
+        self.states = states
+        self.duration = trace_duration(states, end_s)
+        self.applied = []  # (unix time the state took effect, state index)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._error = None
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # Samples must never run on the link of the previous measurement
+        while not self.applied and self._thread.is_alive():
+            time.sleep(0.001)
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self):
+        for index, state in enumerate(self.states):
+            if self._stop.wait(max(0.0, self.start_time + state.time_s - time.time())):
+                return
+            try:
+                self.link.apply(state_netem(state))
+            except Exception as e:
+                self._error = e
+                return
+            with self._lock:
+                self.applied.append((time.time(), index))
+        self._stop.wait(max(0.0, self.start_time + self.duration - time.time()))
+
+    @property
+    def finished(self):
+        if self._error is not None:
+            raise self._error
+        return self._thread is not None and not self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def state_at(self, timestamp):
+        """Index of the state in effect at a unix time, None before the first one."""
+        with self._lock:
+            i = bisect.bisect_right(self.applied, (timestamp, math.inf)) - 1
+            return self.applied[i][1] if i >= 0 else None
+
+    def columns(self, records):
+        """Result store columns with the state each record's handshake started in."""
+        indices = [self.state_at(record.timestamp - record.ms / 1000) for record in records]
+        states = [None if i is None else self.states[i] for i in indices]
+        return {
+            "link_state": [math.nan if i is None else i for i in indices],
+            "link_rtt_ms": [math.nan if s is None else state_rtt_ms(s) for s in states],
+            "link_loss_pct": [math.nan if s is None else state_loss_pct(s) for s in states],
+        }
+
+
+def slant_range_km(altitude_km, elevation_deg):
+    """Distance from a ground station to a satellite seen at the given elevation."""
+    elevation = np.radians(elevation_deg)
+    orbit = EARTH_RADIUS_KM + altitude_km
+    return np.sqrt(orbit ** 2 - (EARTH_RADIUS_KM * np.cos(elevation)) ** 2) - EARTH_RADIUS_KM * np.sin(elevation)
+
+
+def generate_leo(duration_s=600, step_s=1.0, seed=None, altitude_km=550, handover_s=15,
+                 processing_ms=20, up_mbit=10, down_mbit=100, loss_pct=0.2):
+    """Synthetic bent-pipe LEO path in the style of Starlink.
+
+    The serving satellite changes every handover_s seconds. During an
+    interval its elevation drifts seen from the terminal and the gateway,
+    which sets the propagation delay. Each handover adds a short delay
+    jump and a loss burst. Jitter and rates fluctuate around their means.
+    """
+    rng = np.random.default_rng(seed)
+    times = np.arange(0, duration_s, step_s)
+    interval = (times // handover_s).astype(int)
+    intervals = interval[-1] + 1
+    # Elevation of the serving satellite at the start of each interval and its drift in deg/s
+    start_elevation = rng.uniform(40, 90, intervals)
+    drift = rng.uniform(-1.5, 1.5, intervals)
+    elevation = np.clip(start_elevation[interval] + drift[interval] * (times % handover_s), 25, 90)
+    gateway_elevation = np.clip(elevation + rng.normal(0, 10, intervals)[interval], 25, 90)
+    propagation_ms = 1000 * (slant_range_km(altitude_km, elevation) +
+                             slant_range_km(altitude_km, gateway_elevation)) / SPEED_OF_LIGHT_KM_S
+    # Scheduling and queueing on top of propagation, larger right after a handover
+    since_handover = times % handover_s
+    handover = (since_handover < step_s) & (times >= handover_s)
+    queueing_ms = processing_ms + rng.gamma(2, 2, len(times)) + np.where(handover, rng.uniform(5, 30, len(times)), 0)
+
+    states = []
+    for i, t in enumerate(times):
+        burst = rng.uniform(2, 10) if handover[i] else 0
+        up_loss = min(loss_pct * rng.lognormal(0, 0.5) + burst, 100)
+        down_loss = min(loss_pct * rng.lognormal(0, 0.5) + burst, 100)
+        states.append(LinkState(
+            time_s=float(t),
+            up_delay_ms=float(propagation_ms[i] + queueing_ms[i] / 2),
+            up_jitter_ms=float(rng.uniform(0.5, 3)),
+            up_loss_pct=float(up_loss),
+            up_rate_mbit=float(max(1, up_mbit * rng.uniform(0.5, 1.2))),
+            down_delay_ms=float(propagation_ms[i] + queueing_ms[i] / 2),
+            down_jitter_ms=float(rng.uniform(0.5, 3)),
+            down_loss_pct=float(down_loss),
+            down_rate_mbit=float(max(1, down_mbit * rng.uniform(0.5, 1.2))),
+        ))
+    return states
+
+
+def generate_geo(duration_s=600, step_s=1.0, seed=None, processing_ms=20, up_mbit=3, down_mbit=30,
+                 loss_pct=0.1, fade_rate_per_s=1 / 300, fade_mean_s=30):
+    """Synthetic GEO path: ~280 ms one-way, little jitter, and rain fades.
+
+    Fades arrive as a Poisson process and last an exponential time; during
+    a fade loss rises and the modem falls back to a lower rate.
+    """
+    rng = np.random.default_rng(seed)
+    times = np.arange(0, duration_s, step_s)
+    # Terminal to satellite to gateway, both near 38000 km at mid latitudes
+    propagation_ms = 2 * 1000 * 38_000 / SPEED_OF_LIGHT_KM_S
+    fading = np.zeros(len(times), dtype=bool)
+    t = rng.exponential(1 / fade_rate_per_s)
+    while t < duration_s:
+        length = rng.exponential(fade_mean_s)
+        fading |= (times >= t) & (times < t + length)
+        t += length + rng.exponential(1 / fade_rate_per_s)
+
+    states = []
+    for i, t in enumerate(times):
+        fade_loss = rng.uniform(1, 8) if fading[i] else 0
+        rate_factor = rng.uniform(0.3, 0.6) if fading[i] else rng.uniform(0.9, 1.0)
+        delay = propagation_ms + processing_ms / 2 + rng.gamma(2, 1)
+        states.append(LinkState(
+            time_s=float(t),
+            up_delay_ms=float(delay),
+            up_jitter_ms=float(rng.uniform(0.5, 2)),
+            up_loss_pct=float(loss_pct + fade_loss),
+            up_rate_mbit=float(up_mbit * rate_factor),
+            down_delay_ms=float(delay),
+            down_jitter_ms=float(rng.uniform(0.5, 2)),
+            down_loss_pct=float(loss_pct + fade_loss),
+            down_rate_mbit=float(down_mbit * rate_factor),
+        ))
+    return states
+
+
+GENERATORS = {"leo": generate_leo, "geo": generate_geo}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate and inspect time-varying link traces")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser("generate", help="write a synthetic satellite trace")
+    generate_parser.add_argument("orbit", choices=sorted(GENERATORS))
+    generate_parser.add_argument("path")
+    generate_parser.add_argument("--duration", type=float, default=600, help="seconds of trace")
+    generate_parser.add_argument("--step", type=float, default=1.0, help="seconds between link states")
+    generate_parser.add_argument("--seed", type=int, default=None)
+    show_parser = subparsers.add_parser("show", help="summarize a trace")
+    show_parser.add_argument("path")
+    show_parser.add_argument("--end", type=float, default=None, help="seconds at which the last state ends")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        states = GENERATORS[args.orbit](duration_s=args.duration, step_s=args.step, seed=args.seed)
+        save_trace(args.path, states)
+        print(f"✅ Wrote {len(states)} {args.orbit.upper()} link states to {args.path}")
+    else:
+        states = load_trace(args.path)
+        rtts = np.array([state_rtt_ms(state) for state in states])
+        losses = np.array([state_loss_pct(state) for state in states])
+        try:
+            duration = trace_duration(states, args.end)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"{len(states)} states over {duration:g} s")
+        print(f"RTT ms:  min {rtts.min():.1f}, median {np.median(rtts):.1f}, max {rtts.max():.1f}")
+        print(f"Loss %:  min {losses.min():.2f}, median {np.median(losses):.2f}, max {losses.max():.2f}")
+        for direction in ("up", "down"):
+            rates = np.array([getattr(state, f"{direction}_rate_mbit") for state in states])
+            print(f"{direction.capitalize():<4} Mbit: min {rates.min():.1f}, median {np.median(rates):.1f}, max {rates.max():.1f}")
@@ -0,0 +1,443 @@
+"""Asyncio TLS 1.3 handshake load generator.
+
+s_timer performs one blocking handshake at a time, which measures
+single-connection latency. LoadGenerator instead keeps a configurable number
+of handshakes in flight against the nginx endpoint, so the per-handshake
+latency it records reflects a loaded server and the batch throughput shows
+how a KEX or certificate choice affects server capacity.
+
+It is a drop-in replacement for TimerWorker: measure(alg, count) yields
+HandshakeRecords, and the batch throughput, error counts and failed
+attempts end up in `last_batch`. Inside Mininet it runs as a
+worker process speaking the s_timer worker protocol (see timer_worker.py)
+in the client's namespace:
+
+    python3 load_gen.py --worker --concurrency 16
+
+With a target rate, a batch runs open-loop instead: handshakes start on a
+fixed or Poisson schedule regardless of how earlier ones fare, and latency
+is measured from each handshake's intended start time. A stalled handshake
+therefore also delays the latency of everything scheduled behind it, as it
+would for real clients, instead of silently postponing the next attempt
+(coordinated omission). rate_sweep() steps the offered rate to produce a
+latency-vs-load curve and saturation_point() finds where the server stops
+keeping up.
+
+The ssl module can only pick named EC curves (set_ecdh_curve), so groups are
+set with SSL_CTX_set1_groups_list on the OpenSSL that Python is linked
+against, like s_timer does (see set_groups). Post-quantum groups are
+therefore only available when that OpenSSL has the OQS provider loaded;
+check_group() tells before a campaign starts. It can be tried on loopback
+with classical groups and a self-signed certificate:
+
+    openssl req -x509 -newkey ec -pkeyopt ec_paramgen_curve:prime256v1 -nodes \\
+        -subj /CN=localhost -keyout key.pem -out cert.pem
+    python3 load_gen.py prime256v1 1000 --loopback cert.pem key.pem --host 127.0.0.1
+    python3 load_gen.py prime256v1 --rates 100,200,400 --loopback cert.pem key.pem --host 127.0.0.1
+"""
+import _ssl
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import json
+import math
+import ssl
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from histogram import LatencyHistogram
+from timer_worker import HandshakeFailure, HandshakeRecord
+
+SERVER_HOST = "10.0.0.1"
+SERVER_PORT = 4433
+CAFILE = "../tmp/nginx/conf/CA.crt"
+# SSL_CTX_set1_groups_list() is a macro for SSL_CTX_ctrl() with this command
+SSL_CTRL_SET_GROUPS_LIST = 92
+
+
+class LoadGenError(RuntimeError):
+    """Raised when a batch cannot be completed."""
+
+
+def arrival_offsets(rate, count, schedule="fixed", rng=None):
+    """Intended start times, in seconds from the start of an open-loop batch."""
+    if schedule == "poisson":
+        rng = np.random.default_rng() if rng is None else rng
+        gaps = rng.exponential(1 / rate, count)
+        return np.cumsum(gaps) - gaps[0]
+    if schedule != "fixed":
+        raise ValueError(f"Unknown arrival schedule {schedule}")
+    return np.arange(count) / rate
+
+
+def _ssl_ctx_ctrl():
+    """SSL_CTX_ctrl of the libssl the ssl module uses."""
+    try:
+        ctrl = ctypes.CDLL(_ssl.__file__).SSL_CTX_ctrl
+    except (AttributeError, OSError):
+        # _ssl linked statically or not a shared object: fall back to the system libssl
+        ctrl = ctypes.CDLL(ctypes.util.find_library("ssl")).SSL_CTX_ctrl
+    ctrl.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_long, ctypes.c_char_p]
+    ctrl.restype = ctypes.c_long
+    return ctrl
+
+
+def set_groups(ctx, groups):
+    """Restrict an ssl.SSLContext to a colon separated list of key exchange groups.
+
+    The SSL_CTX pointer directly follows the object header of an SSLContext.
+    Raises LoadGenError if OpenSSL does not know one of the groups.
+    """
+    ssl_ctx = ctypes.c_void_p.from_address(id(ctx) + object.__basicsize__).value
+    if _ssl_ctx_ctrl()(ssl_ctx, SSL_CTRL_SET_GROUPS_LIST, 0, groups.encode()) != 1:
+        raise LoadGenError(f"Group {groups} is not available in {ssl.OPENSSL_VERSION}")
+
+
+def check_group(group):
+    """Raise LoadGenError unless the load generator can offer group."""
+    set_groups(ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT), group)
+
+
+def new_ssl_context(cafile, group=None):
+    """TLS 1.3-only client context verifying the server chain like s_timer does."""
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_3
+    ctx.maximum_version = ssl.TLSVersion.TLSv1_3
+    # s_timer checks the chain against the CA but not the host name
+    ctx.check_hostname = False
+    ctx.load_verify_locations(cafile)
+    if group:
+        set_groups(ctx, group)
+    return ctx
+
+
+class LoadGenerator:
+    """Keep up to `concurrency` TLS handshakes in flight against one server.
+
+    cafile and groups may contain '{alg}', which is replaced by the
+    algorithm passed to measure(): the kex sweep selects the group
+    (groups='{alg}'), the sig sweep the CA certificate
+    (cafile='.../{alg}_CA.crt') with a fixed group.
+    """
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, cafile=CAFILE, groups="{alg}",
+                 concurrency=8, timeout=10.0, max_in_flight=1000):
+        self.host = host
+        self.port = port
+        self.cafile = cafile
+        self.groups = groups
+        self.concurrency = concurrency
+        self.timeout = timeout
+        # Open-loop arrivals beyond this many open connections fail as 'Overload'
+        self.max_in_flight = max_in_flight
+        self.last_batch = None
+        self._contexts = {}
+
+    def _context(self, alg):
+        if alg not in self._contexts:
+            self._contexts[alg] = new_ssl_context(self.cafile.format(alg=alg), self.groups.format(alg=alg))
+        return self._contexts[alg]
+
+    async def _handshake(self, ctx):
+        """Time TCP connect plus TLS handshake; returns (ms, error class or None)."""
+        start = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=ctx),
+                self.timeout or None,
+            )
+        except (OSError, ssl.SSLError, asyncio.TimeoutError) as e:
+            return (time.perf_counter() - start) * 1000, type(e).__name__
+        ms = (time.perf_counter() - start) * 1000
+        # Reset instead of a graceful close, like s_timer's zero linger
+        writer.transport.abort()
+        return ms, None
+
+    async def run(self, alg, count, on_result=None):
+        """Run handshakes until count have succeeded.
+
+        on_result is called with a HandshakeRecord or HandshakeFailure as
+        soon as each attempt finishes. Raises LoadGenError once count
+        attempts have failed. Returns the batch statistics.
+        """
+        ctx = self._context(alg)
+        state = {"done": 0, "in_flight": 0, "failed": 0}
+        errors = Counter()
+
+        async def slot():
+            while True:
+                if state["done"] + state["in_flight"] >= count or state["failed"] >= count:
+                    return
+                state["in_flight"] += 1
+                ms, error = await self._handshake(ctx)
+                state["in_flight"] -= 1
+                if error is None:
+                    result = HandshakeRecord(state["done"], ms, time.time())
+                    state["done"] += 1
+                else:
+                    result = HandshakeFailure(state["failed"], ms, error, time.time())
+                    state["failed"] += 1
+                    errors[error] += 1
+                if on_result is not None:
+                    on_result(result)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(slot() for _ in range(max(1, min(self.concurrency, count)))))
+        elapsed = time.perf_counter() - start
+        if state["done"] < count:
+            raise LoadGenError(f"{state['failed']} of {state['failed'] + state['done']} handshakes with {alg} failed")
+        return {
+            "handshakes": state["done"],
+            "failures": state["failed"],
+            "success_rate": state["done"] / (state["done"] + state["failed"]) if state["done"] + state["failed"] else math.nan,
+            # A failed handshake is not retried
+            "abandoned": state["failed"],
+            "errors": dict(errors),
+            "elapsed_s": elapsed,
+            "throughput": state["done"] / elapsed if elapsed > 0 else float("nan"),
+        }
+
+    async def run_open_loop(self, alg, count, rate, schedule="fixed", on_result=None):
+        """Start count handshakes at rate per second on a fixed or Poisson schedule.
+
+        Each latency runs from the intended start time to completion.
+        Failed attempts are not retried. Returns the batch statistics.
+        """
+        ctx = self._context(alg)
+        loop = asyncio.get_running_loop()
+        state = {"done": 0, "in_flight": 0, "failed": 0}
+        errors = Counter()
+
+        async def fire(intended):
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if state["in_flight"] >= self.max_in_flight:
+                error = "Overload"
+            else:
+                state["in_flight"] += 1
+                _, error = await self._handshake(ctx)
+                state["in_flight"] -= 1
+            ms = (loop.time() - intended) * 1000
+            if error is None:
+                result = HandshakeRecord(state["done"], ms, time.time())
+                state["done"] += 1
+            else:
+                result = HandshakeFailure(state["failed"], ms, error, time.time())
+                state["failed"] += 1
+                errors[error] += 1
+            if on_result is not None:
+                on_result(result)
+
+        start = loop.time()
+        await asyncio.gather(*(fire(start + offset) for offset in arrival_offsets(rate, count, schedule)))
+        elapsed = loop.time() - start
+        return {
+            "handshakes": state["done"],
+            "failures": state["failed"],
+            "success_rate": state["done"] / (state["done"] + state["failed"]) if state["done"] + state["failed"] else math.nan,
+            # A failed handshake is not retried
+            "abandoned": state["failed"],
+            "errors": dict(errors),
+            "elapsed_s": elapsed,
+            "throughput": state["done"] / elapsed if elapsed > 0 else float("nan"),
+            "offered_rate": rate,
+        }
+
+    def measure(self, alg, count, rate=None, schedule="fixed", mix=None):
+        """Run one batch and yield its HandshakeRecords, like TimerWorker.measure.
+
+        Without a rate the batch is closed-loop at the configured concurrency,
+        with one it runs open-loop. Handshake mixes need s_timer's session
+        tickets and are rejected.
+        """
+        if mix is not None:
+            raise ValueError("the asyncio load generator only measures full handshakes")
+        records = []
+        failures = []
+
+        def collect(result):
+            if isinstance(result, HandshakeFailure):
+                failures.append(result)
+            else:
+                records.append(result)
+
+        if rate is None:
+            self.last_batch = asyncio.run(self.run(alg, count, collect))
+        else:
+            self.last_batch = asyncio.run(self.run_open_loop(alg, count, rate, schedule, collect))
+        if failures:
+            self.last_batch["failed_attempts"] = [failure._asdict() for failure in failures]
+        yield from records
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def rate_sweep(worker, alg, rates, duration_s=10.0, schedule="fixed", on_point=None):
+    """Measure one open-loop batch per offered rate and return the load curve.
+
+    worker is a LoadGenerator or a TimerWorker running load_gen.py. Every
+    point holds the offered and achieved rate, failures, the latency
+    summary and the serialized LatencyHistogram. on_point is called with
+    each point as soon as it is measured.
+    """
+    points = []
+    for rate in rates:
+        histogram = LatencyHistogram()
+        records = list(worker.measure(alg, max(1, round(rate * duration_s)), rate, schedule))
+        histogram.record([record.ms for record in records])
+        batch = worker.last_batch
+        point = {
+            "offered_rate": rate,
+            # A batch that overruns its schedule lowers the achieved rate
+            "achieved_rate": batch["handshakes"] / max(duration_s, batch["elapsed_s"]),
+            "handshakes": batch["handshakes"],
+            "failures": batch["failures"],
+            "errors": batch["errors"],
+        }
+        point.update(histogram.summary())
+        point["histogram"] = histogram.to_dict()
+        points.append(point)
+        if on_point is not None:
+            on_point(point)
+    return points
+
+
+def saturation_point(points, tolerance=0.1, max_failures=0.01, latency_factor=10):
+    """Highest offered rate the server still kept up with, or None.
+
+    A rate is sustained when at least (1 - tolerance) of it was achieved,
+    no more than max_failures of the attempts failed and the p99 latency
+    stayed within latency_factor times that of the lowest rate.
+    """
+    points = sorted(points, key=lambda point: point["offered_rate"])
+    if not points:
+        return None
+    baseline_p99 = points[0]["p99"]
+    saturation = None
+    for point in points:
+        attempts = point["handshakes"] + point["failures"]
+        if (point["achieved_rate"] < (1 - tolerance) * point["offered_rate"]
+                or point["failures"] > max_failures * attempts
+                or not point["p99"] <= latency_factor * baseline_p99):
+            break
+        saturation = point["offered_rate"]
+    return saturation
+
+
+def start_loopback_server(certfile, keyfile, host="127.0.0.1", port=SERVER_PORT):
+    """Serve TLS 1.3 from a background thread, closing every connection after the handshake."""
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_3
+    ctx.load_cert_chain(certfile, keyfile)
+
+    async def handle(reader, writer):
+        writer.close()
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(handle, host, port, ssl=ctx, backlog=1024))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server
+
+
+def print_result(result):
+    """Write one result in the s_timer worker protocol."""
+    if isinstance(result, HandshakeFailure):
+        print(f"FAIL {result.index},{result.ms:f},{result.error}", flush=True)
+    else:
+        print(f"{result.index},{result.ms:f}", flush=True)
+
+
+def run_worker(generator):
+    """Serve '<alg> <count> [<rate> [fixed|poisson]]' commands from stdin until it is closed."""
+    for line in sys.stdin:
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            alg, count = parts[0], int(parts[1])
+            if len(parts) > 2:
+                schedule = parts[3] if len(parts) > 3 else "fixed"
+                asyncio.run(generator.run_open_loop(alg, count, float(parts[2]), schedule, print_result))
+            else:
+                asyncio.run(generator.run(alg, count, print_result))
+        except (IndexError, ValueError, LoadGenError, OSError) as e:
+            print(f"ERR {e}", flush=True)
+            continue
+        print("END", flush=True)
+
+
+def run_once(generator, alg, count):
+    records = list(generator.measure(alg, count))
+    stats = generator.last_batch
+    ms = np.array([record.ms for record in records])
+    print(f"✅ {stats['handshakes']} handshakes with {alg}, {stats['failures']} failures, "
+          f"{stats['throughput']:.1f} handshakes/s at concurrency {generator.concurrency}")
+    print(f"   median {np.median(ms):.3f} ms, p95 {np.quantile(ms, 0.95):.3f} ms")
+
+
+def run_sweep(generator, alg, rates, duration_s, schedule, out=None):
+    print("Offered/s | Achieved/s | Failures |   p50 ms |   p99 ms | p99.9 ms")
+    print("-" * 66)
+
+    def report(point):
+        print(f"{point['offered_rate']:9.1f} | {point['achieved_rate']:10.1f} | {point['failures']:8d} | "
+              f"{point['p50']:8.2f} | {point['p99']:8.2f} | {point['p99.9']:8.2f}", flush=True)
+        if out is not None:
+            with open(out, "a") as f:
+                f.write(json.dumps(dict(point, algorithm=alg, schedule=schedule)) + "\n")
+
+    points = rate_sweep(generator, alg, rates, duration_s, schedule, on_point=report)
+    saturation = saturation_point(points)
+    if saturation is None:
+        print(f"❌ {alg} did not sustain even the lowest rate")
+    else:
+        print(f"✅ {alg} sustains {saturation:g} handshakes/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent TLS 1.3 handshake load generator")
+    parser.add_argument("alg", nargs="?", help="algorithm for a one-shot run")
+    parser.add_argument("count", nargs="?", type=int, default=1000)
+    parser.add_argument("--worker", action="store_true", help="serve s_timer worker commands on stdin")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--cafile", default=CAFILE, help="CA certificate, may contain {alg}")
+    parser.add_argument("--groups", default="{alg}",
+                        help="key exchange group, may contain {alg} (empty: OpenSSL's default groups)")
+    parser.add_argument("--concurrency", type=int, default=8, help="handshakes kept in flight")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-handshake timeout in seconds (0: none)")
+    parser.add_argument("--rates", type=lambda value: [float(rate) for rate in value.split(",")],
+                        help="comma separated open-loop handshake rates to sweep, per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per rate in a sweep")
+    parser.add_argument("--schedule", choices=["fixed", "poisson"], default="fixed",
+                        help="open-loop arrival schedule")
+    parser.add_argument("--out", help="append the sweep's points and histograms to this JSON lines file")
+    parser.add_argument("--loopback", nargs=2, metavar=("CERT", "KEY"),
+                        help="serve CERT/KEY from a local Python TLS server and use CERT as the CA")
+    args = parser.parse_args()
+
+    cafile = args.cafile
+    if args.loopback:
+        start_loopback_server(*args.loopback, host=args.host, port=args.port)
+        cafile = args.loopback[0]
+    generator = LoadGenerator(args.host, args.port, cafile, args.groups, args.concurrency, args.timeout)
+    if args.worker:
+        run_worker(generator)
+    elif args.alg and args.rates:
+        run_sweep(generator, args.alg, args.rates, args.duration, args.schedule, args.out)
+    elif args.alg:
+        run_once(generator, args.alg, args.count)
+    else:
+        parser.error("either an algorithm or --worker is required")
@@ -0,0 +1,113 @@
+"""Run manifests for resumable experiment sweeps.
+
+Each sweep gets a run number and a JSON lines manifest in
+mn_data/<kex|sig>/runs/run_<n>.jsonl recording the measured RTT of every
+latency level and every completed (latency, algorithm, loss) cell. Samples
+themselves are checkpointed batch by batch in the result store (tagged with
+the run number), so a resumed sweep skips finished cells and continues
+partially measured ones from their last complete batch.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+
+class RunManifest:
+    """Append-only JSON lines log of one sweep's progress."""
+    def __init__(self, path, run):
+        self.path = path
+        self.run = run
+        self.key = None
+        self.rtts = {}
+        self.completed = set()
+        self.finished = False
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._replay()
+
+    def _replay(self):
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from a crash mid-write
+                    continue
+                if event["event"] == "start" and self.key is None:
+                    self.key = event.get("key", "")
+                elif event["event"] == "rtt":
+                    self.rtts[event["latency"]] = event["rtt"]
+                elif event["event"] == "cell":
+                    self.completed.add(tuple(event["cell"]))
+                elif event["event"] == "done":
+                    self.finished = True
+
+    def _write(self, **event):
+        event["time"] = time.time()
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(event) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self, argv, key=""):
+        if self.key is None:
+            self.key = key
+        self._write(event="start", run=self.run, key=key, argv=argv)
+
+    def record_rtt(self, latency, rtt_str, stats=None):
+        """Record the RTT string of a latency level, with the full probe statistics if given."""
+        self.rtts[latency] = rtt_str
+        self._write(event="rtt", latency=latency, rtt=rtt_str, stats=stats)
+
+    def record_cell(self, cell, samples):
+        self.completed.add(tuple(cell))
+        self._write(event="cell", cell=list(cell), samples=samples)
+
+    def finish(self):
+        self.finished = True
+        self._write(event="done")
+
+
+def manifest_path(runs_dir, run):
+    return os.path.join(runs_dir, f"run_{run}.jsonl")
+
+
+def list_runs(runs_dir):
+    """Return the run numbers that have a manifest in runs_dir, ascending."""
+    if not os.path.isdir(runs_dir):
+        return []
+    runs = []
+    for name in os.listdir(runs_dir):
+        match = re.match(r"run_(\d+)\.jsonl$", name)
+        if match:
+            runs.append(int(match.group(1)))
+    return sorted(runs)
+
+
+def open_run(runs_dir, resume=None, key=""):
+    """Open the manifest of a new run, or of the run to resume.
+
+    resume is None for a fresh run, "latest" for the most recent run started
+    with the same key (e.g. the signature algorithm), or an explicit run
+    number. When no run with that key exists yet a fresh run is opened, so a
+    whole runExp.sh loop can be restarted with --resume.
+    """
+    os.makedirs(runs_dir, exist_ok=True)
+    runs = list_runs(runs_dir)
+    if resume == "latest":
+        for run in reversed(runs):
+            manifest = RunManifest(manifest_path(runs_dir, run), run)
+            if manifest.key == key:
+                return manifest
+        resume = None
+
+    if resume is None:
+        run = runs[-1] + 1 if runs else 0
+        return RunManifest(manifest_path(runs_dir, run), run)
+
+    run = int(resume)
+    if run not in runs:
+        raise SystemExit(f"Run {run} not found in {runs_dir}")
+    return RunManifest(manifest_path(runs_dir, run), run)
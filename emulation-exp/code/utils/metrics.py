@@ -0,0 +1,232 @@
+"""Live campaign metrics over HTTP in the Prometheus text format.
+
+The runners update a CampaignMetrics as cells start and batches arrive, and
+a MetricsServer serves it on a local port, so a headless campaign can be
+watched with a scraper or plain curl:
+
+    metrics = CampaignMetrics(total_cells=len(cells))
+    with MetricsServer(metrics, port=9108):
+        metrics.start_cell(pair.index, algorithm="p256_kyber512_90s", latency="2.684ms", loss_pct=1)
+        metrics.set_link(pair.index, [Netem(2.684, 1, 100), Netem(2.684, 1, 20)])
+        metrics.record_batch(pair.index, records, worker.last_batch)
+        metrics.finish_cell(pair.index)
+
+    $ curl -s localhost:9108/metrics | grep -v '^#'
+    pqtls_cells_done 12
+    pqtls_eta_seconds 5310.4
+    pqtls_handshake_ms{slot="0",quantile="0.95"} 61.2
+    ...
+
+Every measuring slot (a Mininet pair, or the one satellite client) reports
+its current cell, handshake rate and p50/p95 over the last window seconds,
+its handshake, failure and retry counters, its success ratio and its netem
+settings.
+pqtls_seconds_since_batch growing past a few batch durations points at a
+stalled cell. The ETA extrapolates the campaign's cells per second so far.
+"""
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+METRICS_PORT = 9108
+WINDOW_S = 60.0
+QUANTILES = (0.5, 0.95)
+NETEM_FIELDS = (("delay_ms", "netem delay in ms"), ("loss_pct", "netem loss in %"), ("rate_mbit", "netem rate in Mbit/s"))
+LINK_ENDS = ("client", "server")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+
+class _Slot:
+    """State of one measuring slot."""
+    def __init__(self):
+        self.cell = {}
+        self.cell_start = None
+        self.cell_handshakes = 0
+        self.last_batch = None
+        self.handshakes = 0
+        self.failed_attempts = 0
+        self.abandoned = 0
+        self.retries = 0
+        self.sum_ms = 0.0
+        self.window = deque()  # (unix time, ms)
+        self.link = []
+
+
+class CampaignMetrics:
+    """Thread-safe counters and gauges of a running campaign."""
+    def __init__(self, total_cells=0, window_s=WINDOW_S, **labels):
+        self.total_cells = total_cells
+        self.window_s = window_s
+        self.labels = labels
+        self.cells_done = 0
+        self.start_time = time.time()
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, slot):
+        return self._slots.setdefault(slot, _Slot())
+
+    def start_cell(self, slot, **cell):
+        """slot starts measuring the cell with these labels."""
+        with self._lock:
+            state = self._slot(slot)
+            state.cell = cell
+            state.cell_start = time.time()
+            state.cell_handshakes = 0
+
+    def set_link(self, slot, netems):
+        """Netem settings of slot's link, one Netem per end (client, server)."""
+        with self._lock:
+            self._slot(slot).link = list(netems)
+
+    def record_batch(self, slot, records, last_batch=None):
+        """Count a batch of HandshakeRecords and the worker's batch summary."""
+        now = time.time()
+        with self._lock:
+            state = self._slot(slot)
+            state.last_batch = now
+            state.handshakes += len(records)
+            state.cell_handshakes += len(records)
+            state.sum_ms += sum(record.ms for record in records)
+            state.window.extend((record.timestamp, record.ms) for record in records)
+            if last_batch:
+                state.failed_attempts += last_batch.get("failures", 0)
+                state.abandoned += last_batch.get("abandoned", 0)
+                state.retries += last_batch.get("retries", 0)
+            while state.window and state.window[0][0] < now - self.window_s:
+                state.window.popleft()
+
+    def finish_cell(self, slot):
+        with self._lock:
+            self.cells_done += 1
+            state = self._slot(slot)
+            state.cell = {}
+            state.cell_start = None
+
+    @property
+    def eta_s(self):
+        """Seconds left at the rate cells finished so far, NaN before the first one."""
+        if not self.cells_done:
+            return math.nan
+        elapsed = time.time() - self.start_time
+        return elapsed / self.cells_done * max(0, self.total_cells - self.cells_done)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        now = time.time()
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP pqtls_{name} {help}")
+            lines.append(f"# TYPE pqtls_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"pqtls_{name}{_labels(**self.labels, **labels)} {_number(value)}")
+
+        with self._lock:
+            slots = sorted(self._slots.items())
+            metric("cells_total", "gauge", "cells of the campaign grid", [({}, self.total_cells)])
+            metric("cells_done", "counter", "cells finished by this process", [({}, self.cells_done)])
+            metric("elapsed_seconds", "gauge", "seconds since the campaign started", [({}, now - self.start_time)])
+            metric("eta_seconds", "gauge", "estimated seconds until the remaining cells are done", [({}, self.eta_s)])
+            metric("cell_info", "gauge", "cell a slot is measuring",
+                   [({"slot": slot, **state.cell}, 1) for slot, state in slots if state.cell])
+            metric("cell_seconds", "gauge", "seconds the slot has spent on its current cell",
+                   [({"slot": slot}, now - state.cell_start) for slot, state in slots if state.cell_start])
+            metric("cell_handshakes", "gauge", "handshakes of the current cell so far",
+                   [({"slot": slot}, state.cell_handshakes) for slot, state in slots])
+            metric("seconds_since_batch", "gauge", "seconds since the slot's last batch ended",
+                   [({"slot": slot}, now - state.last_batch) for slot, state in slots if state.last_batch])
+            metric("handshakes_total", "counter", "completed handshakes",
+                   [({"slot": slot}, state.handshakes) for slot, state in slots])
+            metric("handshake_failures_total", "counter", "handshakes the worker gave up on",
+                   [({"slot": slot}, state.abandoned) for slot, state in slots])
+            metric("handshake_retries_total", "counter", "handshake attempts the worker retried",
+                   [({"slot": slot}, state.retries) for slot, state in slots])
+            metric("handshake_success_ratio", "gauge", "completed handshakes per attempt so far",
+                   [({"slot": slot}, state.handshakes / (state.handshakes + state.failed_attempts))
+                    for slot, state in slots if state.handshakes + state.failed_attempts])
+            # Early on the window reaches back to the start of the campaign only
+            span = max(min(self.window_s, now - self.start_time), 1.0)
+            rates, quantiles = [], []
+            for slot, state in slots:
+                values = np.array([ms for timestamp, ms in state.window if timestamp >= now - self.window_s])
+                rates.append(({"slot": slot}, len(values) / span))
+                estimates = np.quantile(values, QUANTILES) if len(values) else [math.nan] * len(QUANTILES)
+                quantiles += [({"slot": slot, "quantile": f"{q:g}"}, float(value)) for q, value in zip(QUANTILES, estimates)]
+            metric("handshakes_per_second", "gauge", f"handshakes per second over the last {self.window_s:g} s", rates)
+            metric("handshake_ms", "summary", f"handshake latency in ms over the last {self.window_s:g} s", quantiles)
+            lines += [f"pqtls_handshake_ms_sum{_labels(**self.labels, slot=slot)} {_number(state.sum_ms)}"
+                      for slot, state in slots]
+            lines += [f"pqtls_handshake_ms_count{_labels(**self.labels, slot=slot)} {state.handshakes}"
+                      for slot, state in slots]
+            for field, help in NETEM_FIELDS:
+                metric(f"netem_{field}", "gauge", help,
+                       [({"slot": slot, "end": end}, float(getattr(netem, field)))
+                        for slot, state in slots for end, netem in zip(LINK_ENDS, state.link)])
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a CampaignMetrics on http://host:port/metrics from a daemon thread; port 0 disables it."""
+    def __init__(self, metrics, port=METRICS_PORT, host="127.0.0.1"):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self._server = None
+
+    def start(self):
+        if not self.port:
+            return self
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"✅ Metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,134 @@
+"""Multi-pair Mininet sweep engine.
+
+Builds N isolated client/server host pairs inside one Mininet instance and
+spreads the (latency, algorithm, loss) grid across them. Every pair sits on
+its own point-to-point link in its own network namespaces, so each pair can
+reuse the 10.0.0.1/10.0.0.2 addressing that s_timer and nginx.conf expect.
+"""
+import threading
+from multiprocessing.pool import ThreadPool
+from queue import Empty, Queue
+
+from mininet.link import TCLink
+from mininet.topo import Topo
+
+from cpu_account import CpuMeter, account, nginx_master_pid, pin, split_cpus
+from link_control import LinkController, LinkEnd
+from timer_worker import WORKER_COMMAND, TimerWorker
+
+SERVER_IP = "10.0.0.1"
+CLIENT_IP = "10.0.0.2"
+
+
+class PairTopo(Topo):
+    """Custom Mininet topology with one direct link per client/server pair."""
+    def build(self, pairs=1):
+        for i in range(pairs):
+            client = self.addHost(f"cli{i}", ip=f"{CLIENT_IP}/24")
+            server = self.addHost(f"srv{i}", ip=f"{SERVER_IP}/24")
+            self.addLink(client, server, cls=TCLink)
+
+
+class Pair:
+    """One client/server pair, its link and the s_timer worker running on its client."""
+    def __init__(self, index, client, server):
+        self.index = index
+        self.client = client
+        self.server = server
+        self.client_intf = f"{client.name}-eth0"
+        self.server_intf = f"{server.name}-eth0"
+        self.link = LinkController([LinkEnd(self.client_intf, client.cmd), LinkEnd(self.server_intf, server.cmd)])
+        self.worker = None
+        self.cpu = CpuMeter()
+
+    def __repr__(self):
+        return f"Pair({self.index})"
+
+
+def get_pairs(net, pairs):
+    """Return the Pair objects of a running network built from PairTopo."""
+    return [Pair(i, net.get(f"cli{i}"), net.get(f"srv{i}")) for i in range(pairs)]
+
+
+def setup_pairs(pairs, nginx_path, nginx_conf):
+    """Add a root netem qdisc on both ends and start one nginx per pair."""
+    for pair in pairs:
+        pair.client.cmd(f"tc qdisc add dev {pair.client_intf} root netem")
+        pair.server.cmd(f"tc qdisc add dev {pair.server_intf} root netem")
+        # Each nginx needs its own pid file since the hosts share a filesystem
+        pair.server.cmd(f"{nginx_path} -c {nginx_conf} -g 'pid {nginx_pid_file(pair)};'")
+
+
+def start_workers(pairs, command=WORKER_COMMAND):
+    """Start one persistent measurement worker inside every pair's client host.
+
+    command defaults to s_timer; any program speaking the same worker
+    protocol (e.g. load_gen.py --worker) can be used instead.
+    """
+    for pair in pairs:
+        pair.worker = TimerWorker(popen=pair.client.popen, command=command)
+
+
+def nginx_pid_file(pair):
+    """pid file of a pair's nginx, relative to the nginx prefix."""
+    return f"logs/nginx_{pair.index}.pid"
+
+
+def start_cpu_accounting(pairs, nginx_path, source="procfs", client_cpus=None, server_cpus=None):
+    """Meter the CPU time of every pair's worker and nginx, optionally pinning them first.
+
+    client_cpus and server_cpus are lists of cores dealt out round-robin, so
+    that every pair gets its own cores when there are enough of them.
+    """
+    for pair, client_cores, server_cores in zip(pairs, split_cpus(client_cpus, len(pairs)),
+                                                split_cpus(server_cpus, len(pairs))):
+        worker_pid = pair.worker.proc.pid
+        server_pid = nginx_master_pid(nginx_path, nginx_pid_file(pair))
+        if client_cores:
+            pin(worker_pid, client_cores)
+        if server_cores:
+            pin(server_pid, server_cores)
+        pair.cpu = CpuMeter(client=account(f"cli{pair.index}", worker_pid, source),
+                            server=account(f"srv{pair.index}", server_pid, source))
+
+
+def stop_workers(pairs):
+    """Shut down the s_timer workers started by start_workers and their CPU accounting."""
+    for pair in pairs:
+        pair.cpu.close()
+        pair.cpu = CpuMeter()
+        if pair.worker is not None:
+            pair.worker.close()
+            pair.worker = None
+
+
+def run_grid(pairs, cells, measure, on_result=None):
+    """Run measure(pair, cell) for every cell, one cell per idle pair.
+
+    Cells are handed out in the given order, so callers should put the most
+    expensive cells first to keep the tail of the sweep short. on_result is
+    called as on_result(cell, result) under a lock as soon as a cell finishes.
+    Returns a dict mapping each cell to its result.
+    """
+    work = Queue()
+    for cell in cells:
+        work.put(cell)
+
+    results = {}
+    lock = threading.Lock()
+
+    def drain(pair):
+        while True:
+            try:
+                cell = work.get_nowait()
+            except Empty:
+                return
+            result = measure(pair, cell)
+            with lock:
+                results[cell] = result
+                if on_result is not None:
+                    on_result(cell, result)
+
+    with ThreadPool(len(pairs)) as pool:
+        pool.map(drain, pairs)
+    return results
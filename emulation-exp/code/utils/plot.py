@@ -1,137 +1,138 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # headless, also inside the worker processes
+import matplotlib.pyplot as plt
+
+from catalog import RunCatalog, import_directory
+from result_store import ResultStore
+from timer_worker import HANDSHAKE_TYPES, PHASES
+
 KEX_ALG = ['p256_kyber512_90s', 'p256_kyber768_90s', 'p256_kyber1024_90s', 'prime256v1']
 SIG_ALG = ['dilithium2', 'dilithium3', 'ecdsap256']
 
-def plot_data(pkt_loss, handshake_times_pq, handshake_time_trad, type, label=None):
-    """Load CSV data and create visualization with separate plots for each algorithm"""
-    
-    # Calculate medians and percentiles for traditional
-    median_trad = handshake_time_trad.apply(lambda x: x.median(), axis=1)
-    percentile_95_trad = handshake_time_trad.apply(lambda x: x.quantile(0.95), axis=1)
+QUANTILES = (0.5, 0.95)
+
+# Handshake phases as (label, start milestone, end milestone), see PHASES
+PHASE_SEGMENTS = [
+    ('TCP connect', None, 'tcp_connect_ms'),
+    ('Send ClientHello', 'tcp_connect_ms', 'client_hello_ms'),
+    ('Wait for ServerHello', 'client_hello_ms', 'server_hello_ms'),
+    ('Certificate', 'server_hello_ms', 'certificate_ms'),
+    ('CertificateVerify', 'certificate_ms', 'certificate_verify_ms'),
+    ('Verify and send Finished', 'certificate_verify_ms', 'finished_ms'),
+    ('Rest', 'finished_ms', 'handshake_ms'),
+]
+PHASE_COLUMNS = ('algorithm', 'rtt_nominal_ms', 'loss_pct', 'handshake_ms') + PHASES
+RESUMPTION_COLUMNS = ('algorithm', 'rtt_nominal_ms', 'loss_pct', 'handshake_ms', 'handshake_type')
+RELIABILITY_COLUMNS = ('algorithm', 'rtt_nominal_ms', 'loss_pct', 'handshake_ms', 'attempts', 'time_to_success_ms')
+
+Figure = namedtuple('Figure', ['name', 'inputs', 'render', 'args'])
+
+def load_csv(path):
+    """Load a '<alg>_<rtt>ms.csv' file into a loss vector and a 2-D sample array.
+
+    Rows may hold different numbers of samples (e.g. adaptive sweeps), so
+    the sample array is padded with NaN to the longest row.
+    """
+    rows = []
+    with open(path) as f:
+        for line in f:
+            values = [v for v in line.strip().split(',') if v != '']
+            if values:
+                rows.append(np.asarray(values, dtype=float))
+    width = max((len(row) for row in rows), default=1)
+    data = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        data[i, :len(row)] = row
+    return data[:, 0], data[:, 1:]
+
+def pad_rows(samples, rows):
+    """Pad a sample array with NaN rows so every series shares the loss axis."""
+    if len(samples) >= rows:
+        return samples[:rows]
+    padding = np.full((rows - len(samples), samples.shape[1]), np.nan)
+    return np.vstack([samples, padding])
+
+def row_stats(samples):
+    """Median and 95th percentile of every row, ignoring NaN padding.
+
+    Returns an array of shape (len(QUANTILES), rows).
+    """
+    with np.errstate(all='ignore'):
+        return np.nanquantile(samples, QUANTILES, axis=1)
+
+def diff_percent(stats_pq, stats_trad):
+    """Relative difference of each PQ quantile to the traditional one, in %."""
+    with np.errstate(all='ignore'):
+        return (stats_pq - stats_trad) / stats_trad * 100
+
+def scatter_points(pkt_loss, samples):
+    """Flatten a (loss, sample) array into x/y vectors for a single scatter call."""
+    x = np.broadcast_to(np.asarray(pkt_loss)[:, None], samples.shape).ravel()
+    y = samples.ravel()
+    keep = ~np.isnan(y)
+    return x[keep], y[keep]
+
+def print_diff_table(pkt_loss, diff, pq_name, trad_name, label):
+    # Printed in one call so tables from parallel workers do not interleave
+    lines = [f"\n=== Results for {pq_name} vs {trad_name} - RTT: {label} ===",
+             "Packet Loss % | Median Diff % | 95th Percentile Diff %",
+             "-" * 50]
+    lines += [f"{loss:11.1f} | {median:11.1f} | {p95:20.1f}" for loss, median, p95 in zip(pkt_loss, *diff)]
+    print("\n".join(lines), flush=True)
+
+def plot_data(pkt_loss, handshake_times_pq, handshake_time_trad, algs, label=None):
+    """Plot every PQ algorithm against the traditional one, median left and 95th percentile right.
+
+    handshake_times_pq is a list of 2-D sample arrays (one row per loss level),
+    handshake_time_trad the traditional algorithm's array, and algs the
+    algorithm names with the traditional one last.
+    """
+    stats_trad = row_stats(handshake_time_trad)
+    trad_x, trad_y = scatter_points(pkt_loss, handshake_time_trad)
 
     # Create figure with subplots for each PQ algorithm
     num_pq_algs = len(handshake_times_pq)
-    fig, axes = plt.subplots(num_pq_algs, 2, figsize=(15, 5 * num_pq_algs))
-    
+    fig, axes = plt.subplots(num_pq_algs, 2, figsize=(15, 5 * num_pq_algs), squeeze=False)
+
     # Colors for PQ and traditional algorithms
     pq_color = 'blue'
     trad_color = 'red'
 
-    if type == 'kex':
-        # Plot each PQ algorithm in its own subplot
-        for idx, handshake_time_pq in enumerate(handshake_times_pq):
-            median_pq = handshake_time_pq.apply(lambda x: x.median(), axis=1)
-            percentile_95_pq = handshake_time_pq.apply(lambda x: x.quantile(0.95), axis=1)
-            
-            # Print comparison results
-            print(f"\n=== Results for {KEX_ALG[idx]} vs {KEX_ALG[-1]} - RTT: {label} ===")
-            print("Packet Loss % | Median Diff % | 95th Percentile Diff %")
-            print("-" * 50)
-            median_diff_percent = ((median_pq - median_trad) / median_trad) * 100
-            percentile_95_diff_percent = ((percentile_95_pq - percentile_95_trad) / percentile_95_trad) * 100
-            for i, loss in enumerate(pkt_loss):
-                print(f"{loss:11.1f} | {median_diff_percent[i]:11.1f} | {percentile_95_diff_percent[i]:20.1f}")
-
-            # Plot median comparison
-            for col in handshake_time_pq.columns:
-                axes[idx, 0].scatter(pkt_loss, handshake_time_pq[col], alpha=0.05, color=pq_color, s=10)
-            for col in handshake_time_trad.columns:
-                axes[idx, 0].scatter(pkt_loss, handshake_time_trad[col], alpha=0.05, color=trad_color, s=10)
-            
-            axes[idx, 0].plot(pkt_loss, median_pq, label=KEX_ALG[idx], color=pq_color, 
-                            linewidth=2, marker='o', markersize=8)
-            axes[idx, 0].plot(pkt_loss, median_trad, label=KEX_ALG[-1], color=trad_color, 
-                            linewidth=2, linestyle='--', marker='o', markersize=8)
-            
-            # Plot 95th percentile comparison
-            for col in handshake_time_pq.columns:
-                axes[idx, 1].scatter(pkt_loss, handshake_time_pq[col], alpha=0.05, color=pq_color, s=10)
-            for col in handshake_time_trad.columns:
-                axes[idx, 1].scatter(pkt_loss, handshake_time_trad[col], alpha=0.05, color=trad_color, s=10)
-            
-            axes[idx, 1].plot(pkt_loss, percentile_95_pq, label=KEX_ALG[idx], color=pq_color, 
-                            linewidth=2, marker='o', markersize=8)
-            axes[idx, 1].plot(pkt_loss, percentile_95_trad, label=KEX_ALG[-1], color=trad_color, 
-                            linewidth=2, linestyle='--', marker='o', markersize=8)
-            
-            # Add labels and legends
-            axes[idx, 0].set_title(f'Median Comparison: {KEX_ALG[idx]} vs {KEX_ALG[-1]}')
-            axes[idx, 1].set_title(f'95th Percentile: {KEX_ALG[idx]} vs {KEX_ALG[-1]}')
-            axes[idx, 0].legend()
-            axes[idx, 1].legend()
-            axes[idx, 0].set_xlabel('Packet Loss (%)')
-            axes[idx, 1].set_xlabel('Packet Loss (%)')
-            axes[idx, 0].set_ylabel('Handshake Time (ms)')
-            axes[idx, 1].set_ylabel('Handshake Time (ms)')
-            axes[idx, 0].grid(True)
-            axes[idx, 1].grid(True)
-
-            # Add y-axis limits after creating the plots
-            max_median = max(max(median_pq), max(median_trad))
-            max_95th = max(max(percentile_95_pq), max(percentile_95_trad))
-            
-            # Set y-axis limits with 10% padding
-            axes[idx, 0].set_ylim(0, max_median * 1.1)
-            axes[idx, 1].set_ylim(0, max_95th * 1.1)
-
-    elif type == 'sig':
-        # Similar structure for signature plots
-        for idx, handshake_time_pq in enumerate(handshake_times_pq):
-            median_pq = handshake_time_pq.apply(lambda x: x.median(), axis=1)
-            percentile_95_pq = handshake_time_pq.apply(lambda x: x.quantile(0.95), axis=1)
-            
-            print(f"\n=== Results for {SIG_ALG[idx]} vs {SIG_ALG[-1]} - RTT: {label} ===")
-            print("Packet Loss % | Median Diff % | 95th Percentile Diff %")
-            print("-" * 50)
-            median_diff_percent = ((median_pq - median_trad) / median_trad) * 100
-            percentile_95_diff_percent = ((percentile_95_pq - percentile_95_trad) / percentile_95_trad) * 100
-            for i, loss in enumerate(pkt_loss):
-                print(f"{loss:11.1f} | {median_diff_percent[i]:11.1f} | {percentile_95_diff_percent[i]:20.1f}")
-
-            # Plot median comparison
-            for col in handshake_time_pq.columns:
-                axes[idx, 0].scatter(pkt_loss, handshake_time_pq[col], alpha=0.05, color=pq_color, s=10)
-            for col in handshake_time_trad.columns:
-                axes[idx, 0].scatter(pkt_loss, handshake_time_trad[col], alpha=0.05, color=trad_color, s=10)
-            
-            axes[idx, 0].plot(pkt_loss, median_pq, label=SIG_ALG[idx], color=pq_color, 
-                            linewidth=2, marker='o', markersize=8)
-            axes[idx, 0].plot(pkt_loss, median_trad, label=SIG_ALG[-1], color=trad_color, 
-                            linewidth=2, linestyle='--', marker='o', markersize=8)
-            
-            # Plot 95th percentile comparison
-            for col in handshake_time_pq.columns:
-                axes[idx, 1].scatter(pkt_loss, handshake_time_pq[col], alpha=0.05, color=pq_color, s=10)
-            for col in handshake_time_trad.columns:
-                axes[idx, 1].scatter(pkt_loss, handshake_time_trad[col], alpha=0.05, color=trad_color, s=10)
-            
-            axes[idx, 1].plot(pkt_loss, percentile_95_pq, label=SIG_ALG[idx], color=pq_color, 
-                            linewidth=2, marker='o', markersize=8)
-            axes[idx, 1].plot(pkt_loss, percentile_95_trad, label=SIG_ALG[-1], color=trad_color, 
-                            linewidth=2, linestyle='--', marker='o', markersize=8)
-            
-            # Add labels and legends
-            axes[idx, 0].set_title(f'Median Comparison: {SIG_ALG[idx]} vs {SIG_ALG[-1]}')
-            axes[idx, 1].set_title(f'95th Percentile: {SIG_ALG[idx]} vs {SIG_ALG[-1]}')
-            axes[idx, 0].legend()
-            axes[idx, 1].legend()
-            axes[idx, 0].set_xlabel('Packet Loss (%)')
-            axes[idx, 1].set_xlabel('Packet Loss (%)')
-            axes[idx, 0].set_ylabel('Handshake Time (ms)')
-            axes[idx, 1].set_ylabel('Handshake Time (ms)')
-            axes[idx, 0].grid(True)
-            axes[idx, 1].grid(True)
-
-            # Add y-axis limits after creating the plots
-            max_median = max(max(median_pq), max(median_trad))
-            max_95th = max(max(percentile_95_pq), max(percentile_95_trad))
-            
+    for idx, handshake_time_pq in enumerate(handshake_times_pq):
+        stats_pq = row_stats(handshake_time_pq)
+        print_diff_table(pkt_loss, diff_percent(stats_pq, stats_trad), algs[idx], algs[-1], label)
+
+        pq_x, pq_y = scatter_points(pkt_loss, handshake_time_pq)
+        titles = (f'Median Comparison: {algs[idx]} vs {algs[-1]}',
+                  f'95th Percentile: {algs[idx]} vs {algs[-1]}')
+        for ax, stat_pq, stat_trad, title in zip(axes[idx], stats_pq, stats_trad, titles):
+            # One collection per sample cloud
+            ax.scatter(pq_x, pq_y, alpha=0.05, color=pq_color, s=10)
+            ax.scatter(trad_x, trad_y, alpha=0.05, color=trad_color, s=10)
+
+            ax.plot(pkt_loss, stat_pq, label=algs[idx], color=pq_color,
+                    linewidth=2, marker='o', markersize=8)
+            ax.plot(pkt_loss, stat_trad, label=algs[-1], color=trad_color,
+                    linewidth=2, linestyle='--', marker='o', markersize=8)
+
+            ax.set_title(title)
+            # loc='best' would search every scatter point; low loss, low latency corner is empty
+            ax.legend(loc='upper left')
+            ax.set_xlabel('Packet Loss (%)')
+            ax.set_ylabel('Handshake Time (ms)')
+            ax.grid(True)
+
             # Set y-axis limits with 10% padding
-            axes[idx, 0].set_ylim(0, max_median * 1.1)
-            axes[idx, 1].set_ylim(0, max_95th * 1.1)
+            ax.set_ylim(0, np.nanmax([np.nanmax(stat_pq), np.nanmax(stat_trad)]) * 1.1)
 
     plt.tight_layout()
     return plt
@@ -139,78 +140,289 @@ def plot_data(pkt_loss, handshake_times_pq, handshake_time_trad, type, label=Non
 def save_plot(plt, output_filename):
     """
     Save the plot to a file
-    
+
     Args:
         plt: matplotlib plot object
         output_filename (str): Name of the output file
     """
 
 
-    output_path = Path(__file__).parent.parent.parent / 'mn_data' / 'plots' / output_filename
+    output_path = PLOT_DIR / output_filename
     output_path.parent.mkdir(exist_ok=True)
     plt.savefig(output_path)
     plt.close()
 
+def phase_durations(data):
+    """Duration of every PHASE_SEGMENTS entry per handshake, as a (segments, rows) array."""
+    starts = [np.zeros(len(data['handshake_ms'])) if start is None else data[start] for _, start, _ in PHASE_SEGMENTS]
+    ends = [data[end] for _, _, end in PHASE_SEGMENTS]
+    return np.asarray(ends, dtype=float) - np.asarray(starts, dtype=float)
 
-KEX_RTT = ['6p158ms', '31p730ms', '79p220ms', '196p246ms', '596p386ms'] # ms
-SIG_RTT_D2 = ['6p325ms', '31p723ms', '79p253ms', '196p327ms', '596p335ms'] # ms
-SIG_RTT_D3 = ['6p331ms', '31p745ms', '79p240ms', '196p386ms', '596p309ms'] # ms
-SIG_RTT_E = ['6p253ms', '31p733ms', '79p207ms', '196p264ms', '596p328ms']
+def plot_phases(type, algs, loss=0):
+    """Stacked median phase durations of every algorithm, one subplot per nominal RTT."""
+    store = ResultStore(f'{DATA_FILE}/{type}/store')
+    data = store.load(list(PHASE_COLUMNS), loss_pct=loss)
+    durations = phase_durations(data)
+    # Handshakes from before the phase instrumentation have no milestones
+    complete = ~np.isnan(durations).any(axis=0)
+    rtts = np.unique(data['rtt_nominal_ms'][complete])
+    if len(rtts) == 0:
+        print(f"⚠️ No phase timings for {type} at {loss:g}% loss")
+        return
 
-DATA_FILE = '../../mn_data'
+    fig, axes = plt.subplots(len(rtts), 1, figsize=(15, (1 + 0.6 * len(algs)) * len(rtts)), squeeze=False)
+    for ax, rtt in zip(axes[:, 0], rtts):
+        medians = np.full((len(algs), len(PHASE_SEGMENTS)), np.nan)
+        for i, alg in enumerate(algs):
+            mask = complete & (data['algorithm'] == alg) & (data['rtt_nominal_ms'] == rtt)
+            if mask.any():
+                medians[i] = np.median(durations[:, mask], axis=1)
 
-if __name__ == '__main__':
-    # KEX Plot
-    for rtt in KEX_RTT:
-        df_kyber_list = []
-        df_prime = None
-        
-        for kex in KEX_ALG:
-            if kex != 'prime256v1':
-                df_kyber_list.append(pd.read_csv(f'{DATA_FILE}/kex/{kex}_{rtt}.csv'))
-            else:
-                df_prime = pd.read_csv(f'{DATA_FILE}/kex/{kex}_{rtt}.csv')
-        
-        # Use the longest packet loss array
-        packet_loss = df_prime.iloc[:, 0]
-        for df in df_kyber_list:
-            if len(df.iloc[:, 0]) > len(packet_loss):
-                packet_loss = df.iloc[:, 0]
-        
-        # Prepare data frames
-        handshake_times_kyber = [df.iloc[: len(packet_loss), 1:] for df in df_kyber_list]
-        handshake_time_prime = df_prime.iloc[: len(packet_loss), 1:]
-        
-        plt.figure(figsize=(10, 10))
-        plot_data(packet_loss, handshake_times_kyber, handshake_time_prime, type='kex', label=f'{rtt}')
-        output_filename = f'kex_{rtt}_plot.png'
-        save_plot(plt, output_filename)
-
-    # SIG Plot
-    for i in range(len(SIG_RTT_D2)):
-        df_dilithium_list = []
-        df_ecdsa = None
-        rtt = SIG_RTT_D2[i]  # Use D2's RTT for the plot name
-
-        for sig in SIG_ALG:
-            if sig == 'dilithium2':
-                df_dilithium_list.append(pd.read_csv(f'{DATA_FILE}/sig/{sig}_{SIG_RTT_D2[i]}.csv'))
-            elif sig == 'dilithium3':
-                df_dilithium_list.append(pd.read_csv(f'{DATA_FILE}/sig/{sig}_{SIG_RTT_D3[i]}.csv'))
-            else:  # ecdsap256
-                df_ecdsa = pd.read_csv(f'{DATA_FILE}/sig/{sig}_{SIG_RTT_E[i]}.csv')
-        
-        packet_loss = df_ecdsa.iloc[:, 0]
-        for df in df_dilithium_list:
-            if len(df.iloc[:, 0]) > len(packet_loss):
-                packet_loss = df.iloc[:, 0]
-        
-        handshake_times_dilithium = [df.iloc[: len(packet_loss), 1:] for df in df_dilithium_list]
-        handshake_time_ecdsa = df_ecdsa.iloc[: len(packet_loss), 1:]
-        
-        plt.figure(figsize=(10, 10))
-        plot_data(packet_loss, handshake_times_dilithium, handshake_time_ecdsa, type='sig', label=f'{rtt}')
-        output_filename = f'sig_{rtt}_plot.png'
-        save_plot(plt, output_filename)
+        lines = [f"\n=== Median phase durations (ms) - {type} RTT: {rtt:g} ms, loss: {loss:g}% ===",
+                 f"{'Algorithm':24} | " + " | ".join(label for label, _, _ in PHASE_SEGMENTS)]
+        lines += [f"{alg:24} | " + " | ".join(f"{value:{len(label)}.2f}" for value, (label, _, _) in zip(row, PHASE_SEGMENTS))
+                  for alg, row in zip(algs, medians)]
+        print("\n".join(lines), flush=True)
+
+        left = np.zeros(len(algs))
+        for j, (label, _, _) in enumerate(PHASE_SEGMENTS):
+            ax.barh(algs, medians[:, j], left=left, label=label)
+            left += np.nan_to_num(medians[:, j])
+        ax.set_title(f'Median phase durations: RTT {rtt:g} ms, {loss:g}% loss')
+        ax.set_xlabel('Time since handshake start (ms)')
+        ax.grid(True, axis='x')
+    handles, labels = axes[0, 0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='lower center', ncol=len(PHASE_SEGMENTS), fontsize='small')
 
+    plt.tight_layout(rect=(0, 0.06, 1, 1))
+    save_plot(plt, f'{type}_phases_plot.png')
 
+def plot_resumption(type, algs, loss=0):
+    """Median and p95 latency of every handshake type per algorithm, one subplot per nominal RTT."""
+    store = ResultStore(f'{DATA_FILE}/{type}/store')
+    data = store.load(list(RESUMPTION_COLUMNS), loss_pct=loss)
+    types = [t for t in HANDSHAKE_TYPES if (data['handshake_type'] == t).any()]
+    if types == ['full'] or not types:
+        print(f"⚠️ No resumed handshakes for {type} at {loss:g}% loss")
+        return
+    rtts = np.unique(data['rtt_nominal_ms'][data['handshake_type'] != 'full'])
+
+    width = 0.8 / len(types)
+    fig, axes = plt.subplots(len(rtts), 1, figsize=(12, 4 * len(rtts)), squeeze=False)
+    for ax, rtt in zip(axes[:, 0], rtts):
+        lines = [f"\n=== Handshake latency by type (ms) - {type} RTT: {rtt:g} ms, loss: {loss:g}% ===",
+                 f"{'Algorithm':24} | " + " | ".join(f"{t:>20}" for t in types)]
+        for j, handshake_type in enumerate(types):
+            stats = np.full((len(algs), len(QUANTILES)), np.nan)
+            counts = np.zeros(len(algs), dtype=int)
+            for i, alg in enumerate(algs):
+                samples = data['handshake_ms'][(data['algorithm'] == alg) & (data['rtt_nominal_ms'] == rtt) &
+                                               (data['handshake_type'] == handshake_type)]
+                counts[i] = len(samples)
+                if len(samples):
+                    stats[i] = np.quantile(samples, QUANTILES)
+            x = np.arange(len(algs)) + (j - (len(types) - 1) / 2) * width
+            ax.bar(x, stats[:, 0], width, label=handshake_type)
+            ax.errorbar(x, stats[:, 0], yerr=[np.zeros(len(algs)), stats[:, 1] - stats[:, 0]],
+                        fmt='none', ecolor='black', capsize=3)
+            for i, alg in enumerate(algs):
+                cell = f"{stats[i, 0]:.2f}/{stats[i, 1]:.2f} (n={counts[i]})"
+                if j == 0:
+                    lines.append(f"{alg:24} | {cell:>20}")
+                else:
+                    lines[2 + i] += f" | {cell:>20}"
+        print("\n".join(lines), flush=True)
+
+        ax.set_xticks(np.arange(len(algs)))
+        ax.set_xticklabels(algs)
+        ax.set_title(f'Full vs resumed handshakes: RTT {rtt:g} ms, {loss:g}% loss (bars: median, whiskers: p95)')
+        ax.set_ylabel('Handshake latency (ms)')
+        ax.grid(True, axis='y')
+        ax.legend()
+
+    plt.tight_layout()
+    save_plot(plt, f'{type}_resumption_plot.png')
+
+def plot_reliability(type, algs):
+    """Success rate per attempt and time to success including retries vs loss, one row per nominal RTT."""
+    store = ResultStore(f'{DATA_FILE}/{type}/store')
+    # Trace replays have no nominal RTT (NaN) and are left out
+    data = store.load(list(RELIABILITY_COLUMNS), rtt_nominal_ms=slice(0, None))
+    # Handshakes from before the s_timer deadlines carry no attempt count
+    counted = data['attempts'] > 0
+    if not counted.any():
+        print(f"⚠️ No attempt counts for {type}")
+        return
+    rtts = np.unique(data['rtt_nominal_ms'][counted])
+
+    fig, axes = plt.subplots(len(rtts), 2, figsize=(15, 4 * len(rtts)), squeeze=False)
+    for (rate_ax, time_ax), rtt in zip(axes, rtts):
+        lines = [f"\n=== Handshake reliability - {type} RTT: {rtt:g} ms ===",
+                 f"{'Algorithm':24} | {'Loss %':>6} | {'Success %':>9} | {'Retried':>7} | {'TTS p50/p95 (ms)':>18}"]
+        for alg in algs:
+            mask = counted & (data['algorithm'] == alg) & (data['rtt_nominal_ms'] == rtt)
+            losses = np.unique(data['loss_pct'][mask])
+            if len(losses) == 0:
+                continue
+            rates, stats = [], []
+            for loss in losses:
+                cell = mask & (data['loss_pct'] == loss)
+                attempts = data['attempts'][cell]
+                rates.append(100 * len(attempts) / attempts.sum())
+                stats.append(np.quantile(data['time_to_success_ms'][cell], QUANTILES))
+                lines.append(f"{alg:24} | {loss:6g} | {rates[-1]:9.2f} | {(attempts > 1).sum():7d} | "
+                             f"{stats[-1][0]:8.2f}/{stats[-1][1]:9.2f}")
+            stats = np.array(stats)
+            rate_ax.plot(losses, rates, marker='o', label=alg)
+            line, = time_ax.plot(losses, stats[:, 0], marker='o', label=f'{alg} p50')
+            time_ax.plot(losses, stats[:, 1], marker='x', linestyle='--', color=line.get_color(), label=f'{alg} p95')
+        print("\n".join(lines), flush=True)
+
+        rate_ax.set_title(f'Successful attempts: RTT {rtt:g} ms')
+        rate_ax.set_xlabel('Packet loss (%)')
+        rate_ax.set_ylabel('Success rate per attempt (%)')
+        rate_ax.grid(True)
+        rate_ax.legend(fontsize='small')
+        time_ax.set_title(f'Time to success including retries: RTT {rtt:g} ms')
+        time_ax.set_xlabel('Packet loss (%)')
+        time_ax.set_ylabel('Time to success (ms)')
+        time_ax.grid(True)
+        time_ax.legend(fontsize='small')
+
+    plt.tight_layout()
+    save_plot(plt, f'{type}_reliability_plot.png')
+
+def store_algorithms(type, algs):
+    """algs followed by any other algorithm in the result store, e.g. from a sweep with --algs auto."""
+    try:
+        with open(f'{DATA_FILE}/{type}/store/schema.json') as f:
+            stored = json.load(f)['categories']['algorithm']
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        stored = []
+    return list(algs) + [alg for alg in stored if alg not in algs]
+
+def store_paths(type, columns):
+    """Column files of a result store that a figure reads."""
+    store_dir = f'{DATA_FILE}/{type}/store'
+    return [f'{store_dir}/schema.json'] + [f'{store_dir}/{column}.bin' for column in columns]
+
+def plot_rtt(type, algs, paths, label):
+    """Load one RTT level of every algorithm from its CSV file in paths and save its comparison plot."""
+    series = [load_csv(path) for path in paths]
+
+    # Use the longest packet loss array, padding the other series with NaN
+    packet_loss = max((loss for loss, _ in series), key=len)
+    handshake_times = [pad_rows(samples, len(packet_loss)) for _, samples in series]
+
+    plot_data(packet_loss, handshake_times[:-1], handshake_times[-1], algs, label=label)
+    save_plot(plt, figure_name(type, label))
+
+def figure_name(type, label):
+    return f'{type}_{label}_plot.png'
+
+def rtt_figures(catalog, type, algs):
+    """One comparison figure per nominal RTT in the run catalog, from every algorithm's latest CSV file.
+
+    Algorithms of the catalog that are not in algs are plotted too, before
+    the traditional one, which algs lists last.
+    """
+    result = []
+    for rtt in catalog.values('rtt_nominal_ms', experiment=type):
+        paths = catalog.paths(experiment=type, rtt_nominal_ms=rtt)
+        if algs[-1] not in paths:
+            print(f"⚠️ No {algs[-1]} data at {rtt:g} ms nominal RTT to compare {type} against")
+            continue
+        names = [alg for alg in algs[:-1] if alg in paths] + sorted(set(paths) - set(algs)) + [algs[-1]]
+        if len(names) < 2:
+            continue
+        # Named after the nominal RTT, which unlike the measured one is the same in every run
+        label = f"{rtt:.3f}".replace('.', 'p') + 'ms'
+        inputs = [paths[alg] for alg in names]
+        result.append(Figure(figure_name(type, label), inputs, plot_rtt, (type, names, inputs, label)))
+    return result
+
+def figures():
+    """Every figure of the campaign, with the files it is rendered from."""
+    result = []
+    with RunCatalog(CATALOG_FILE) as catalog:
+        for type, algs in (('kex', KEX_ALG), ('sig', SIG_ALG)):
+            # CSV files from before the catalog are registered on the first build
+            import_directory(catalog, type, f'{DATA_FILE}/{type}')
+            result += rtt_figures(catalog, type, algs)
+    for type, algs in (('kex', KEX_ALG), ('sig', SIG_ALG)):
+        algs = store_algorithms(type, algs)
+        result.append(Figure(f'{type}_phases_plot.png', store_paths(type, PHASE_COLUMNS), plot_phases, (type, algs)))
+        result.append(Figure(f'{type}_resumption_plot.png', store_paths(type, RESUMPTION_COLUMNS), plot_resumption,
+                             (type, algs)))
+        result.append(Figure(f'{type}_reliability_plot.png', store_paths(type, RELIABILITY_COLUMNS), plot_reliability,
+                             (type, algs)))
+    return result
+
+def figure_hash(paths):
+    """Hash the input files together with this file, so code changes also invalidate figures."""
+    digest = hashlib.sha256(Path(__file__).read_bytes())
+    for path in paths:
+        digest.update(path.encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def load_cache():
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_cache(cache):
+    CACHE_FILE.parent.mkdir(exist_ok=True)
+    tmp_path = CACHE_FILE.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, CACHE_FILE)
+
+def stale_figures(force=False):
+    """Return [(figure, input hash)] for figures whose inputs changed since they were rendered."""
+    cache = load_cache()
+    stale = []
+    for figure in figures():
+        missing = [path for path in figure.inputs if not os.path.exists(path)]
+        if missing:
+            print(f"⚠️ Skipping {figure.name}: missing {', '.join(missing)}")
+            continue
+        digest = figure_hash(figure.inputs)
+        if not force and cache.get(figure.name) == digest and (PLOT_DIR / figure.name).exists():
+            continue
+        stale.append((figure, digest))
+    return stale
+
+def build(jobs=None, force=False):
+    """Render the stale figures in a process pool and record their input hashes."""
+    stale = stale_figures(force)
+    if not stale:
+        print("✅ All plots up to date")
+        return
+    cache = load_cache()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(figure.render, *figure.args): (figure, digest) for figure, digest in stale}
+        for future in as_completed(futures):
+            figure, digest = futures[future]
+            future.result()
+            # Saved after every figure so an interrupted build keeps its progress
+            cache[figure.name] = digest
+            save_cache(cache)
+            print(f"✅ Rendered {figure.name}")
+
+
+DATA_FILE = '../../mn_data'
+CATALOG_FILE = f'{DATA_FILE}/catalog.sqlite'
+PLOT_DIR = Path(__file__).parent.parent.parent / 'mn_data' / 'plots'
+CACHE_FILE = PLOT_DIR / '.plot_cache.json'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the kex/sig plots whose input data changed")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--force', action='store_true', help="re-render every plot")
+    args = parser.parse_args()
+    build(args.jobs, args.force)
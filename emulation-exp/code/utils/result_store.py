@@ -0,0 +1,303 @@
+"""Append-only columnar store for handshake samples.
+
+A store is a directory holding one raw little-endian file per column plus a
+schema.json describing the dtypes and the category dictionaries. Every
+handshake is one row, so a campaign of millions of samples can be memory
+mapped and filtered without any text parsing:
+
+    store = ResultStore("../../mn_data/kex/store")
+    df = pd.DataFrame(store.load(algorithm="prime256v1", rtt_nominal_ms=slice(100, 700)))
+
+Existing wide CSV files (one row per loss level) can be imported with
+
+    python3 result_store.py convert ../../mn_data/kex/store ../../mn_data/kex/*.csv
+"""
+import argparse
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+SCHEMA_VERSION = 1
+
+COLUMNS = {
+    "run": "<u4",              # sweep number from the run manifest
+    "algorithm": "<u2",        # code into the schema's algorithm dictionary
+    "rtt_nominal_ms": "<f4",   # RTT configured through netem
+    "rtt_measured_ms": "<f4",  # average RTT probed with rtt_probe.py before the sweep
+    "loss_pct": "<f4",
+    "client_mbps": "<f4",
+    "server_mbps": "<f4",
+    "timer": "<u4",            # s_timer batch within the cell
+    "sample": "<u4",           # handshake within the batch
+    "concurrency": "<u4",      # handshakes in flight, 0 where not recorded
+    "timestamp": "<f8",        # unix time the sample was received
+    "handshake_ms": "<f8",
+    # Handshake milestones from s_timer, ms since the handshake started
+    "tcp_connect_ms": "<f4",
+    "client_hello_ms": "<f4",
+    "server_hello_ms": "<f4",
+    "certificate_ms": "<f4",
+    "certificate_verify_ms": "<f4",
+    "finished_ms": "<f4",
+    # Packet accounting from capture.py, NaN where the batch was not captured
+    "bytes_up": "<f4",
+    "bytes_down": "<f4",
+    "segments_up": "<f4",
+    "segments_down": "<f4",
+    "retransmits_up": "<f4",
+    "retransmits_down": "<f4",
+    "records_up": "<f4",
+    "records_down": "<f4",
+    "max_record_down": "<f4",
+    "round_trips": "<f4",
+    "syn_rtt_ms": "<f4",
+    # Link state a handshake started in when replaying a trace with link_trace.py, NaN otherwise
+    "link_state": "<f4",
+    "link_rtt_ms": "<f4",
+    "link_loss_pct": "<f4",
+    # RTT of the last rtt_probe.RttMonitor probe before the handshake started, NaN where not monitored
+    "probe_rtt_ms": "<f4",
+    # Handshake type from timer_worker.HANDSHAKE_TYPES; rows from before it was recorded decode as "full"
+    "handshake_type": "<u1",
+    # CPU microseconds per handshake from cpu_account.CpuMeter, the mean over the sample's batch; NaN where not metered
+    "client_cpu_us": "<f4",
+    "server_cpu_us": "<f4",
+    # Server certificate's signature algorithm on the satellite testbed; "" where not recorded
+    "certificate": "<u2",
+    # Attempts s_timer needed for the handshake, 0 where not recorded, and the ms all of them took
+    "attempts": "<u2",
+    "time_to_success_ms": "<f8",
+}
+CATEGORICAL = ("algorithm", "handshake_type", "certificate")
+# Categories every store starts with, so that back-filled zeros decode to them
+INITIAL_CATEGORIES = {"handshake_type": ["full"], "certificate": [""]}
+
+# Nominal RTTs of the emulation sweep: netem delay applied on both ends
+EMULATION_RTTS_MS = [2 * d for d in (2.684, 15.458, 39.224, 97.73, 297.73)]
+
+# File names of the wide CSV files: '<alg>_<rtt>ms.csv', e.g. 'prime256v1_6p158ms.csv'
+CSV_NAME = re.compile(r"(.+)_(\d+p\d+)ms\.csv$")
+
+
+class ResultStore:
+    """Directory of append-only column files with one row per handshake.
+
+    With fsync=True every append is flushed to disk before returning, so the
+    store can serve as the checkpoint of a resumable sweep.
+    """
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        schema_path = os.path.join(path, "schema.json")
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                self.schema = json.load(f)
+        else:
+            self.schema = {
+                "version": SCHEMA_VERSION,
+                "columns": dict(COLUMNS),
+                "categories": {name: list(INITIAL_CATEGORIES.get(name, [])) for name in CATEGORICAL},
+            }
+            self._write_schema()
+        self._add_missing_columns()
+        self._repair()
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _write_schema(self):
+        tmp_path = os.path.join(self.path, "schema.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.schema, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, "schema.json"))
+
+    def _column_rows(self, name):
+        column_path = self._column_path(name)
+        if not os.path.exists(column_path):
+            return 0
+        return os.path.getsize(column_path) // np.dtype(self.schema["columns"][name]).itemsize
+
+    def _add_missing_columns(self):
+        """Back-fill columns added to COLUMNS after the store was created."""
+        missing = [name for name in COLUMNS if name not in self.schema["columns"]]
+        if not missing:
+            return
+        rows = self.rows
+        for name in missing:
+            dtype = np.dtype(COLUMNS[name])
+            fill = np.nan if dtype.kind == "f" else 0
+            with open(self._column_path(name), "wb") as f:
+                f.write(np.full(rows, fill, dtype=dtype).tobytes())
+            self.schema["columns"][name] = COLUMNS[name]
+            if name in CATEGORICAL:
+                self.schema["categories"][name] = list(INITIAL_CATEGORIES.get(name, []))
+        self._write_schema()
+
+    def _repair(self):
+        """Truncate every column to the shortest one after an interrupted append."""
+        rows = self.rows
+        for name, dtype in self.schema["columns"].items():
+            if self._column_rows(name) > rows:
+                with open(self._column_path(name), "r+b") as f:
+                    f.truncate(rows * np.dtype(dtype).itemsize)
+
+    @property
+    def rows(self):
+        return min(self._column_rows(name) for name in self.schema["columns"])
+
+    def _encode(self, name, value):
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return [self._encode(name, v) for v in value]
+        categories = self.schema["categories"][name]
+        if value not in categories:
+            categories.append(value)
+            self._write_schema()
+        return categories.index(value)
+
+    def append(self, handshake_ms, **columns):
+        """Append one row per element of handshake_ms.
+
+        Every other column is given either as a scalar, broadcast to all new
+        rows, or as a sequence of the same length. Missing columns are filled
+        with NaN (or 0 for integer columns).
+        """
+        handshake_ms = np.asarray(handshake_ms, dtype=self.schema["columns"]["handshake_ms"])
+        n = len(handshake_ms)
+        if n == 0:
+            return
+        unknown = set(columns) - set(self.schema["columns"])
+        if unknown:
+            raise KeyError(f"Unknown result store columns: {sorted(unknown)}")
+
+        with self._lock:
+            arrays = {"handshake_ms": handshake_ms}
+            for name, dtype in self.schema["columns"].items():
+                if name == "handshake_ms":
+                    continue
+                value = columns.get(name)
+                if name in CATEGORICAL and value is not None:
+                    value = self._encode(name, value)
+                if value is None:
+                    value = np.nan if np.dtype(dtype).kind == "f" else 0
+                arrays[name] = np.broadcast_to(np.asarray(value, dtype=dtype), (n,))
+
+            for name, array in arrays.items():
+                with open(self._column_path(name), "ab") as f:
+                    f.write(np.ascontiguousarray(array).tobytes())
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+
+    def load(self, columns=None, **where):
+        """Return a dict of NumPy arrays for the rows matching where.
+
+        Each filter is a scalar, a list of accepted values or a slice giving
+        a half-open [start, stop) range, e.g. loss_pct=slice(0, 5).
+        """
+        rows = self.rows
+        names = list(columns or self.schema["columns"])
+        mapped = {}
+        for name in set(names) | set(where):
+            dtype = self.schema["columns"][name]
+            if rows == 0:
+                mapped[name] = np.empty(0, dtype=dtype)
+            else:
+                mapped[name] = np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(rows,))
+
+        mask = np.ones(rows, dtype=bool)
+        for name, condition in where.items():
+            column = mapped[name]
+            if isinstance(condition, slice):
+                if condition.start is not None:
+                    mask &= column >= condition.start
+                if condition.stop is not None:
+                    mask &= column < condition.stop
+                continue
+            values = condition if isinstance(condition, (list, tuple, set)) else [condition]
+            if name in CATEGORICAL:
+                categories = self.schema["categories"][name]
+                values = [categories.index(v) for v in values if v in categories]
+            mask &= np.isin(column, np.asarray(list(values), dtype=column.dtype))
+
+        result = {}
+        for name in names:
+            data = np.asarray(mapped[name][mask])
+            if name in CATEGORICAL:
+                data = np.asarray(self.schema["categories"][name], dtype=object)[data] if len(data) else data.astype(object)
+            result[name] = data
+        return result
+
+
+def parse_rtt_str(rtt_str):
+    """Turn a file name RTT such as '6p158ms' or '6p158' into 6.158."""
+    return float(rtt_str.replace("ms", "").replace("p", "."))
+
+
+def convert_csv(store, csv_path, nominal_rtts=EMULATION_RTTS_MS, samples_per_timer=100, has_loss=True, **columns):
+    """Import one '<alg>_<rtt>ms.csv' file written by the experiment runners.
+
+    The nominal RTT is the entry of nominal_rtts closest to the measured one.
+    Files from the satellite client have no leading loss column. Extra
+    keyword arguments (e.g. client_mbps) are stored with every sample.
+    Returns the number of imported samples.
+    """
+    match = CSV_NAME.match(os.path.basename(csv_path))
+    if not match:
+        raise ValueError(f"Cannot parse algorithm and RTT from {csv_path}")
+    algorithm = match.group(1)
+    rtt_measured_ms = parse_rtt_str(match.group(2))
+    rtt_nominal_ms = np.nan
+    if nominal_rtts:
+        rtt_nominal_ms = min(nominal_rtts, key=lambda rtt: abs(rtt - rtt_measured_ms))
+
+    imported = 0
+    with open(csv_path) as f:
+        for line in f:
+            values = [v for v in line.strip().split(",") if v != ""]
+            if not values:
+                continue
+            loss_pct = float(values.pop(0)) if has_loss else None
+            samples = np.asarray(values, dtype=float)
+            index = np.arange(len(samples))
+            store.append(
+                samples,
+                algorithm=algorithm,
+                rtt_nominal_ms=rtt_nominal_ms,
+                rtt_measured_ms=rtt_measured_ms,
+                loss_pct=loss_pct,
+                timer=index // samples_per_timer,
+                sample=index % samples_per_timer,
+                **columns,
+            )
+            imported += len(samples)
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Handshake result store tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="import wide CSV files into a store")
+    convert_parser.add_argument("store")
+    convert_parser.add_argument("csv_files", nargs="+")
+    convert_parser.add_argument("--samples-per-timer", type=int, default=100)
+    convert_parser.add_argument("--satellite", action="store_true",
+                                help="CSV rows have no loss column and no nominal RTT")
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    link = {} if args.satellite else {"client_mbps": 100, "server_mbps": 20}
+    for csv_path in args.csv_files:
+        count = convert_csv(
+            store,
+            csv_path,
+            nominal_rtts=None if args.satellite else EMULATION_RTTS_MS,
+            samples_per_timer=args.samples_per_timer,
+            has_loss=not args.satellite,
+            **link,
+        )
+        print(f"✅ Imported {count} samples from {csv_path}")
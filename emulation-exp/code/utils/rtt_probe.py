@@ -0,0 +1,230 @@
+"""Fast RTT probing and background RTT monitoring.
+
+probe_rtt() replaces `ping -c 30` at one packet per second. It sends
+probes in rounds of ten, 10 ms apart, and stops as soon as the 95%
+confidence interval of the median is within tolerance of it. It returns
+the min, average, median, p95 and jitter (the mean difference between
+consecutive RTTs). Probes are ICMP echoes from ping, or TCP connects to
+the TLS port for paths that filter ICMP. Either way they run through a
+run(command) -> output callable, such as a Mininet host's cmd, so they
+leave from the client's namespace.
+
+RttMonitor keeps probing at a low rate in the background while batches
+run. It tags every sample with the RTT of the last probe before its
+handshake started, and hands out the raw series for logging:
+
+    with RttMonitor("10.0.0.1", popen=client.popen) as monitor:
+        records = list(worker.measure(alg, 100))
+        columns = monitor.columns(records)
+        series = monitor.drain()
+
+ping needs root for intervals below 200 ms, as the experiments already do.
+Run as a script, this module is the TCP-connect prober and prints
+ping-style lines:
+
+    python3 rtt_probe.py 10.0.0.1 --port 4433 --count 20 --interval 0.01
+"""
+import argparse
+import bisect
+import math
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from adaptive import quantile_ci
+from link_control import shell
+
+TLS_PORT = 4433
+# A monitored RTT older than this many probe intervals is too stale to tag a sample with
+STALE_INTERVALS = 5
+
+# "64 bytes from 10.0.0.1: icmp_seq=1 ttl=64 time=5.37 ms", optionally
+# prefixed by "[1700000000.123456] " with -D
+PING_LINE = re.compile(r"^(?:\[(?P<timestamp>[\d.]+)\] )?.*\btime[=<](?P<ms>[\d.]+) ?ms")
+
+
+def parse_ping(output):
+    """(timestamp or None, RTT ms) of every reply line in ping or prober output."""
+    samples = []
+    for line in output.splitlines():
+        match = PING_LINE.match(line)
+        if match:
+            timestamp = match.group("timestamp")
+            samples.append((float(timestamp) if timestamp else None, float(match.group("ms"))))
+    return samples
+
+
+def rtt_stats(rtts, sent=None):
+    """Summary of a list of RTTs in ms; loss_pct needs the number of probes sent."""
+    rtts = np.asarray(rtts, dtype=float)
+    if len(rtts) == 0:
+        return {"count": 0, "min": math.nan, "avg": math.nan, "median": math.nan, "p95": math.nan,
+                "jitter": math.nan, "loss_pct": 100.0 if sent else math.nan}
+    return {
+        "count": len(rtts),
+        "min": float(rtts.min()),
+        "avg": float(rtts.mean()),
+        "median": float(np.median(rtts)),
+        "p95": float(np.percentile(rtts, 95)),
+        "jitter": float(np.abs(np.diff(rtts)).mean()) if len(rtts) > 1 else 0.0,
+        "loss_pct": 100 * (1 - len(rtts) / sent) if sent else math.nan,
+    }
+
+
+def probe_command(target, count, interval, method="icmp", port=TLS_PORT, timestamps=False):
+    """Command sending count probes (0 = until killed) every interval seconds."""
+    if method == "icmp":
+        command = ["ping", "-n", "-i", f"{interval:g}", "-W", "5"]
+        if count:
+            command += ["-c", str(count)]
+        if timestamps:
+            command.append("-D")
+        return command + [target]
+    command = [sys.executable, __file__, target, "--port", str(port), "--count", str(count), "--interval", f"{interval:g}"]
+    if timestamps:
+        command.append("-D")
+    return command
+
+
+def command_count(command):
+    return int(command[command.index("-c" if "-c" in command else "--count") + 1])
+
+
+def probe_rtt(target, run=shell, method="icmp", port=TLS_PORT, round_size=10, interval=0.01,
+              min_samples=20, max_samples=200, tolerance=0.05):
+    """Probe until the median RTT is known to within tolerance, or max_samples were sent.
+
+    Returns rtt_stats() of all replies plus the number of probes sent.
+    """
+    rtts, sent = [], 0
+    while sent < max_samples:
+        command = probe_command(target, min(round_size, max_samples - sent), interval, method, port)
+        rtts += [ms for _, ms in parse_ping(run(" ".join(command)))]
+        sent += command_count(command)
+        if len(rtts) >= min_samples:
+            median, low, high = quantile_ci(np.sort(rtts), 0.5)
+            if high - low <= tolerance * median:
+                break
+    stats = rtt_stats(rtts, sent)
+    stats["sent"] = sent
+    return stats
+
+
+def rtt_label(stats):
+    """Average RTT in the '6p158' form used in CSV file names."""
+    return f"{stats['avg']:.3f}".replace(".", "p")
+
+
+class RttMonitor:
+    """Background prober recording (unix time, RTT ms) pairs.
+
+    popen is any callable with the subprocess.Popen signature, e.g. a
+    Mininet host's popen to probe from the client's namespace. The series
+    is kept as parallel timestamp and RTT lists, and drain() drops the
+    probes that later batches can no longer be tagged with, so a monitor
+    can run for a whole campaign.
+    """
+    def __init__(self, target, popen=subprocess.Popen, interval=0.5, method="icmp", port=TLS_PORT):
+        self.command = probe_command(target, 0, interval, method, port, timestamps=True)
+        self.popen = popen
+        self.interval = interval
+        self._times = []
+        self._rtts = []
+        self._drained = 0
+        self._lock = threading.Lock()
+        self.proc = None
+        self._thread = None
+
+    def start(self):
+        self.proc = self.popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               universal_newlines=True, bufsize=1)
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+        return self
+
+    def _read(self):
+        for line in self.proc.stdout:
+            for timestamp, ms in parse_ping(line):
+                with self._lock:
+                    self._times.append(timestamp if timestamp is not None else time.time())
+                    self._rtts.append(ms)
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            self.proc.wait()
+        if self._thread is not None:
+            self._thread.join()
+        self.proc = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def columns(self, records):
+        """Result store column with the monitored RTT when each record's handshake started.
+
+        That is the RTT of the last probe answered before the start, NaN if
+        it is older than STALE_INTERVALS probe intervals.
+        """
+        starts = np.array([record.timestamp - record.ms / 1000 for record in records], dtype=float)
+        with self._lock:
+            times = np.array(self._times, dtype=float)
+            rtts = np.array(self._rtts, dtype=float)
+        if len(times) == 0:
+            return {"probe_rtt_ms": [math.nan] * len(starts)}
+        i = np.searchsorted(times, starts, side="right") - 1
+        fresh = (i >= 0) & (starts - times[np.maximum(i, 0)] <= STALE_INTERVALS * self.interval)
+        return {"probe_rtt_ms": np.where(fresh, rtts[i], math.nan).tolist()}
+
+    def drain(self):
+        """Probes recorded since the last drain, for writing out the time series.
+
+        Only the probes recent enough to tag the next batch are kept.
+        """
+        with self._lock:
+            new = list(zip(self._times[self._drained:], self._rtts[self._drained:]))
+            if self._times:
+                stale = bisect.bisect_left(self._times, self._times[-1] - STALE_INTERVALS * self.interval)
+                del self._times[:stale]
+                del self._rtts[:stale]
+            self._drained = len(self._times)
+        return new
+
+
+def tcp_probe(target, port, count, interval, timestamps=False, timeout=5.0):
+    """Time TCP connects to target:port and print them like ping does."""
+    seq = 0
+    while count == 0 or seq < count:
+        seq += 1
+        start = time.perf_counter()
+        try:
+            with socket.create_connection((target, port), timeout=timeout):
+                ms = (time.perf_counter() - start) * 1000
+        except OSError as e:
+            print(f"From {target}: tcp_seq={seq} {e}", flush=True)
+        else:
+            prefix = f"[{time.time():.6f}] " if timestamps else ""
+            print(f"{prefix}connected to {target}:{port}: tcp_seq={seq} time={ms:.3f} ms", flush=True)
+        time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TCP connect RTT prober with ping-style output")
+    parser.add_argument("target")
+    parser.add_argument("--port", type=int, default=TLS_PORT)
+    parser.add_argument("--count", type=int, default=10, help="probes to send, 0 to run until killed")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between probes")
+    parser.add_argument("-D", dest="timestamps", action="store_true", help="prefix replies with the unix time")
+    args = parser.parse_args()
+    try:
+        tcp_probe(args.target, args.port, args.count, args.interval, args.timestamps)
+    except KeyboardInterrupt:
+        pass
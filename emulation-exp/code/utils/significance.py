@@ -0,0 +1,392 @@
+"""Bootstrap confidence intervals and permutation tests for PQ vs classical latency.
+
+plot.py prints how much the median and p95 of every PQ algorithm differ
+from the classical baseline at each loss level, but at high loss the
+samples are heavy tailed and many of those differences are noise. For every
+(algorithm, nominal RTT, loss) cell this module computes
+
+  - the relative median and p95 difference to the baseline's cell, in %,
+    as plot.diff_percent does,
+  - its percentile bootstrap confidence interval, resampling both cells
+    independently,
+  - a two-sided permutation p-value for the difference in ms, and a
+    Benjamini-Hochberg q-value over all cells of the table.
+
+Resampling is done in chunks of index matrices, one row per resample.
+Every cell's samples are sorted once, so the k-th smallest resampled index
+is the k-th smallest resampled value and only the order statistics behind
+the quantiles are partitioned out; a permutation is a row of group labels
+over the pooled sorted samples. Cells are spread over a process pool:
+
+    python3 significance.py kex --resamples 10000 --jobs 8
+
+writes mn_data/kex/significance.csv with one row per cell.
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from catalog import RunCatalog, import_directory
+from result_store import ResultStore
+
+QUANTILES = (0.5, 0.95)
+# Classical algorithm every other one is compared against
+BASELINES = {"kex": "prime256v1", "sig": "ecdsap256"}
+# Entries of one index matrix chunk, bounds the memory of a worker to a few tens of MB
+CHUNK_ELEMENTS = 1 << 22
+# Pooled positions per block of a relabeling, see permutation_ranks
+PERMUTATION_BLOCK = 64
+
+DATA_DIR = "../../mn_data"
+
+
+def quantile_ranks(n, quantiles=QUANTILES):
+    """Order statistics and weights of NumPy's default (linear) quantile of n samples.
+
+    The q quantile of sorted x is x[low] * (1 - frac) + x[high] * frac.
+    """
+    position = (n - 1) * np.asarray(quantiles, dtype=float)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, n - 1)
+    return low, high, position - low
+
+
+def _chunks(count, width):
+    """Row counts of the index matrices that make up count resamples of width entries."""
+    rows = max(1, CHUNK_ELEMENTS // width)
+    for start in range(0, count, rows):
+        yield min(rows, count - start)
+
+
+def bootstrap_quantiles(samples, resamples, rng, quantiles=QUANTILES):
+    """Quantiles of bootstrap resamples of samples, shape (resamples, len(quantiles)).
+
+    A resample is a row of n uniform indices into the sorted samples, and
+    the quantiles only depend on a few of its order statistics. The k-th
+    smallest of n uniforms is Beta(k, n - k + 1) distributed, and given it
+    the next wanted one is a Beta step into the rest of [0, 1), so each
+    resample costs a handful of draws instead of an n-wide row.
+    """
+    ordered = np.sort(samples)
+    n = len(ordered)
+    low, high, frac = quantile_ranks(n, quantiles)
+    uniform = np.zeros(resamples)
+    previous = 0
+    index = {}
+    for k in np.unique(np.concatenate([low, high])):
+        uniform += (1 - uniform) * rng.beta(k + 1 - previous, n - k, size=resamples)
+        index[k] = np.minimum((uniform * n).astype(np.int64), n - 1)
+        previous = k + 1
+    lows = ordered[np.stack([index[k] for k in low], axis=1)]
+    highs = ordered[np.stack([index[k] for k in high], axis=1)]
+    return lows * (1 - frac) + highs * frac
+
+
+def bootstrap_quantiles_matrix(samples, resamples, rng, quantiles=QUANTILES):
+    """bootstrap_quantiles with every resample drawn as a full row of an index matrix, for checking."""
+    ordered = np.sort(samples)
+    n = len(ordered)
+    low, high, frac = quantile_ranks(n, quantiles)
+    kth = np.unique(np.concatenate([low, high]))
+    result = np.empty((resamples, len(frac)))
+    start = 0
+    for rows in _chunks(resamples, n):
+        index = rng.integers(0, n, size=(rows, n), dtype=np.int32)
+        index.partition(kth, axis=1)
+        result[start:start + rows] = ordered[index[:, low]] * (1 - frac) + ordered[index[:, high]] * frac
+        start += rows
+    return result
+
+
+def permutation_ranks(n_a, n_b, ranks_a, ranks_b, permutations, rng, block=PERMUTATION_BLOCK):
+    """Pooled positions of order statistics of both groups under random relabelings.
+
+    A relabeling is a row of n_a + n_b labels over the pooled sorted
+    samples. Instead of shuffling whole rows, the number of a labels in
+    every block of the row is drawn as a chain of hypergeometric draws, and
+    only the blocks holding a wanted order statistic are laid out, by
+    ranking random keys. Blocks wanted by several order statistics share
+    their keys. Returns two arrays of shape (permutations, len(ranks)).
+    """
+    n = n_a + n_b
+    edges = np.append(np.arange(0, n, block), n)
+    counts_a = np.zeros((permutations, len(edges)), dtype=np.int64)
+    left_a = np.full(permutations, n_a, dtype=np.int64)
+    for i in range(1, len(edges)):
+        drawn = rng.hypergeometric(left_a, n - edges[i - 1] - left_a, edges[i] - edges[i - 1])
+        counts_a[:, i] = counts_a[:, i - 1] + drawn
+        left_a -= drawn
+    counts = {True: counts_a, False: edges - counts_a}
+
+    targets = [(True, k) for k in ranks_a] + [(False, k) for k in ranks_b]
+    rows = np.arange(permutations)
+    offsets = np.arange(block)
+    keys = rng.random((len(targets), permutations, block))
+    blocks = []
+    positions = np.empty((permutations, len(targets)), dtype=np.int64)
+    for t, (label, k) in enumerate(targets):
+        # First block whose end has more than k members of the group
+        b = np.argmax(counts[label] > k, axis=1) - 1
+        for u, other in enumerate(blocks):
+            same = other == b
+            keys[t, same] = keys[u, same]
+        blocks.append(b)
+        size = (edges[b + 1] - edges[b])[:, None]
+        inside = offsets < size
+        # The a labels of the block go to the positions with the smallest keys
+        key_ranks = np.where(inside, keys[t], np.inf).argsort(axis=1).argsort(axis=1)
+        in_a = key_ranks < (counts_a[rows, b + 1] - counts_a[rows, b])[:, None]
+        members = in_a if label else ~in_a & inside
+        wanted = k - counts[label][rows, b]
+        positions[:, t] = edges[b] + np.argmax(np.cumsum(members, axis=1) > wanted[:, None], axis=1)
+    return positions[:, :len(ranks_a)], positions[:, len(ranks_a):]
+
+
+def permutation_differences(a, b, permutations, rng, quantiles=QUANTILES):
+    """Quantile differences a - b after randomly relabeling the pooled samples.
+
+    Returns an array of shape (permutations, len(quantiles)).
+    """
+    pooled = np.sort(np.concatenate([a, b]))
+    low_a, high_a, frac_a = quantile_ranks(len(a), quantiles)
+    low_b, high_b, frac_b = quantile_ranks(len(b), quantiles)
+    m = len(frac_a)
+    result = np.empty((permutations, m))
+    start = 0
+    for rows in _chunks(permutations, 4 * m * PERMUTATION_BLOCK):
+        rank_a, rank_b = permutation_ranks(len(a), len(b), np.concatenate([low_a, high_a]),
+                                           np.concatenate([low_b, high_b]), rows, rng)
+        quantiles_a = pooled[rank_a[:, :m]] * (1 - frac_a) + pooled[rank_a[:, m:]] * frac_a
+        quantiles_b = pooled[rank_b[:, :m]] * (1 - frac_b) + pooled[rank_b[:, m:]] * frac_b
+        result[start:start + rows] = quantiles_a - quantiles_b
+        start += rows
+    return result
+
+
+def permutation_differences_matrix(a, b, permutations, rng, quantiles=QUANTILES):
+    """permutation_differences with every relabeling drawn as a full row of a label matrix, for checking."""
+    pooled = np.sort(np.concatenate([a, b]))
+    labels = np.zeros(len(pooled), dtype=bool)
+    labels[:len(a)] = True
+    low_a, high_a, frac_a = quantile_ranks(len(a), quantiles)
+    low_b, high_b, frac_b = quantile_ranks(len(b), quantiles)
+    result = np.empty((permutations, len(frac_a)))
+    start = 0
+    for rows in _chunks(permutations, len(pooled)):
+        mask = rng.permuted(np.broadcast_to(labels, (rows, len(pooled))), axis=1)
+        # Every row holds exactly len(a) labels, so the column indices of each group come out sorted per row
+        rank_a = np.nonzero(mask)[1].reshape(rows, len(a))
+        rank_b = np.nonzero(~mask)[1].reshape(rows, len(b))
+        quantiles_a = pooled[rank_a[:, low_a]] * (1 - frac_a) + pooled[rank_a[:, high_a]] * frac_a
+        quantiles_b = pooled[rank_b[:, low_b]] * (1 - frac_b) + pooled[rank_b[:, high_b]] * frac_b
+        result[start:start + rows] = quantiles_a - quantiles_b
+        start += rows
+    return result
+
+
+# Resampling implementations by name: order statistics drawn directly, or full index matrices
+METHODS = {
+    "ranks": (bootstrap_quantiles, permutation_differences),
+    "matrix": (bootstrap_quantiles_matrix, permutation_differences_matrix),
+}
+
+
+def compare_cell(samples, baseline, resamples, permutations, confidence, seed, method="ranks", quantiles=QUANTILES):
+    """Bootstrap CI and permutation p-value of the quantile differences of one cell to its baseline."""
+    rng = np.random.default_rng(seed)
+    bootstrap, permutation = METHODS[method]
+    estimate = np.quantile(samples, quantiles)
+    estimate_baseline = np.quantile(baseline, quantiles)
+    with np.errstate(all='ignore'):
+        delta_pct = (estimate - estimate_baseline) / estimate_baseline * 100
+        boot = bootstrap(samples, resamples, rng, quantiles)
+        boot_baseline = bootstrap(baseline, resamples, rng, quantiles)
+        boot_pct = (boot - boot_baseline) / boot_baseline * 100
+    alpha = 1 - confidence
+    ci_low, ci_high = np.nanquantile(boot_pct, [alpha / 2, 1 - alpha / 2], axis=0)
+
+    observed = estimate - estimate_baseline
+    null = permutation(samples, baseline, permutations, rng, quantiles)
+    # The observed labeling counts as one permutation, so p is never 0
+    exceed = (np.abs(null) >= np.abs(observed) - 1e-9).sum(axis=0)
+    p_value = (exceed + 1) / (permutations + 1)
+
+    row = {"samples": len(samples), "baseline_samples": len(baseline)}
+    for i, q in enumerate(quantiles):
+        name = f"p{q * 100:g}"
+        row.update({
+            f"{name}_ms": estimate[i],
+            f"{name}_baseline_ms": estimate_baseline[i],
+            f"{name}_delta_pct": delta_pct[i],
+            f"{name}_ci_low_pct": ci_low[i],
+            f"{name}_ci_high_pct": ci_high[i],
+            f"{name}_p_value": p_value[i],
+        })
+    return row
+
+
+def _compare(task):
+    key, samples, baseline, resamples, permutations, confidence, seed, method = task
+    return key, compare_cell(samples, baseline, resamples, permutations, confidence, seed, method)
+
+
+def bh_qvalues(p_values):
+    """Benjamini-Hochberg adjusted p-values, NaN stays NaN."""
+    p_values = np.asarray(p_values, dtype=float)
+    q_values = np.full(len(p_values), np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    if len(valid) == 0:
+        return q_values
+    order = valid[np.argsort(p_values[valid])]
+    ranked = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    q_values[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return q_values
+
+
+def csv_rows(path):
+    """{loss: samples} of a wide '<alg>_<rtt>ms.csv' file."""
+    rows = {}
+    with open(path) as f:
+        for line in f:
+            values = [v for v in line.strip().split(",") if v != ""]
+            if len(values) > 1:
+                rows[float(values[0])] = np.asarray(values[1:], dtype=float)
+    return rows
+
+
+def csv_cells(type, data_dir=DATA_DIR):
+    """{(algorithm, nominal RTT, loss): samples} from the latest CSV file of every cell in the run catalog."""
+    catalog = RunCatalog(os.path.join(data_dir, "catalog.sqlite"))
+    import_directory(catalog, type, os.path.join(data_dir, type))
+    files, cells = {}, {}
+    for cell in catalog.cells(experiment=type, rtt_nominal_ms=slice(0, None)):
+        if cell["path"] not in files:
+            files[cell["path"]] = csv_rows(cell["path"]) if os.path.exists(cell["path"]) else {}
+        samples = files[cell["path"]].get(cell["loss_pct"])
+        if samples is not None:
+            cells[(cell["algorithm"], cell["rtt_nominal_ms"], cell["loss_pct"])] = samples
+    catalog.close()
+    return cells
+
+
+def store_cells(store_dir):
+    """{(algorithm, nominal RTT, loss): samples} of a result store, one sort instead of a mask per cell.
+
+    Like csv_cells, a cell holds the sequential full handshakes of its latest
+    run only: resumptions, load generator batches and trace replays are left
+    out.
+    """
+    data = ResultStore(store_dir).load(["run", "algorithm", "rtt_nominal_ms", "loss_pct", "handshake_ms", "link_state"],
+                                       handshake_type="full", concurrency=[0, 1])
+    keep = np.isnan(data["link_state"]) & ~np.isnan(data["handshake_ms"])
+    data = {name: column[keep] for name, column in data.items()}
+    keys = [np.unique(data[name], return_inverse=True) for name in ("algorithm", "rtt_nominal_ms", "loss_pct")]
+    code = np.zeros(len(data["handshake_ms"]), dtype=np.int64)
+    for values, inverse in keys:
+        code = code * len(values) + inverse
+    order = np.argsort(code, kind="stable")
+    codes, starts = np.unique(code[order], return_index=True)
+    cells = {}
+    for cell_code, samples, runs in zip(codes, np.split(data["handshake_ms"][order], starts[1:]),
+                                        np.split(data["run"][order], starts[1:])):
+        key = []
+        for values, _ in reversed(keys):
+            cell_code, i = divmod(cell_code, len(values))
+            key.append(values[i])
+        algorithm, rtt, loss = reversed(key)
+        if not np.isnan(loss) and not np.isnan(rtt):
+            cells[(algorithm, float(rtt), float(loss))] = samples[runs == runs.max()]
+    return cells
+
+
+def load_cells(type, source="auto", data_dir=DATA_DIR):
+    """Cells of the result store, or of the CSV files when there is no store (source='auto')."""
+    store_dir = os.path.join(data_dir, type, "store")
+    if source == "store" or (source == "auto" and os.path.exists(os.path.join(store_dir, "schema.json"))):
+        return store_cells(store_dir)
+    return csv_cells(type, data_dir)
+
+
+def significance_table(cells, baseline, resamples=10_000, permutations=10_000, confidence=0.95, seed=0,
+                       jobs=None, method="ranks"):
+    """Compare every non-baseline cell with the baseline's cell of the same RTT and loss.
+
+    Returns one dict per cell, sorted by algorithm, RTT and loss. Every cell
+    gets its own random stream spawned from seed, so the table does not
+    depend on how the cells were spread over the workers.
+    """
+    keys = sorted(key for key in cells if key[0] != baseline and (baseline, *key[1:]) in cells)
+    seeds = np.random.SeedSequence(seed).spawn(len(keys))
+    tasks = [(key, cells[key], cells[(baseline, *key[1:])], resamples, permutations, confidence, cell_seed, method)
+             for key, cell_seed in zip(keys, seeds)]
+    workers = jobs or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = dict(pool.map(_compare, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+    rows = [{"algorithm": key[0], "baseline": baseline, "rtt_nominal_ms": round(key[1], 3), "loss_pct": key[2],
+             **results[key]} for key in keys]
+    for q in QUANTILES:
+        name = f"p{q * 100:g}"
+        for row, q_value in zip(rows, bh_qvalues([row[f"{name}_p_value"] for row in rows])):
+            row[f"{name}_q_value"] = q_value
+    return rows
+
+
+def write_table(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_table(rows, alpha):
+    """Deltas with their CIs; '*' marks q-values below alpha."""
+    lines = [f"{'Algorithm':24} | {'RTT ms':>8} | {'Loss %':>6} | {'Median diff % [CI]':>26} | {'p95 diff % [CI]':>26}",
+             "-" * 102]
+    for row in rows:
+        cells = []
+        for name in ("p50", "p95"):
+            mark = "*" if row[f"{name}_q_value"] < alpha else " "
+            cells.append(f"{row[f'{name}_delta_pct']:7.1f} [{row[f'{name}_ci_low_pct']:7.1f}, "
+                         f"{row[f'{name}_ci_high_pct']:7.1f}]{mark}")
+        lines.append(f"{row['algorithm']:24} | {row['rtt_nominal_ms']:8.3f} | {row['loss_pct']:6.1f} | "
+                     f"{cells[0]:>26} | {cells[1]:>26}")
+    print("\n".join(lines), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap CIs and permutation p-values of PQ vs classical deltas")
+    parser.add_argument("types", nargs="+", choices=sorted(BASELINES))
+    parser.add_argument("--data", default=DATA_DIR, help="directory holding kex/ and sig/")
+    parser.add_argument("--source", choices=["auto", "store", "csv"], default="auto",
+                        help="read the result store or the CSV files of the run catalog (default: the store if there is one)")
+    parser.add_argument("--baseline", default=None, help="algorithm to compare against (default: the classical one)")
+    parser.add_argument("--resamples", type=int, default=10_000, help="bootstrap resamples per cell")
+    parser.add_argument("--permutations", type=int, default=10_000, help="permutations per cell")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--method", choices=sorted(METHODS), default="ranks",
+                        help="draw only the order statistics behind the quantiles, or full index matrices (slow, "
+                             "for checking)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--out", default=None, help="CSV table (default: <data>/<type>/significance.csv)")
+    parser.add_argument("--quiet", action="store_true", help="only write the table")
+    args = parser.parse_args()
+
+    for type in args.types:
+        baseline = args.baseline or BASELINES[type]
+        cells = load_cells(type, args.source, args.data)
+        rows = significance_table(cells, baseline, args.resamples, args.permutations, args.confidence, args.seed,
+                                  args.jobs, args.method)
+        if not rows:
+            print(f"⚠️ No {type} cells to compare with {baseline}")
+            continue
+        out = args.out or os.path.join(args.data, type, "significance.csv")
+        write_table(rows, out)
+        if not args.quiet:
+            print(f"\n=== {type}: difference to {baseline}, {args.confidence:.0%} bootstrap CI ===")
+            print_table(rows, 1 - args.confidence)
+        print(f"✅ {len(rows)} {type} cells compared with {baseline} in {out}")
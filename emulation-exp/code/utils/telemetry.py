@@ -0,0 +1,168 @@
+"""Server-side telemetry sampled while a client measures.
+
+On the satellite testbed nginx runs on a machine the client cannot see, so
+a slow batch could be the link, retransmissions or a saturated server.
+TelemetryCollector samples the server at a fixed interval and tags every
+sample with the run ID the client announced:
+
+    with TelemetryCollector("telemetry.jsonl", nginx_pid, interface="eth0", port=4433) as collector:
+        collector.run_id = run_id
+        ...
+        collector.record()
+        samples = collector.samples(run_id)
+
+Each sample holds
+  - nginx: CPU microseconds used by the master and its workers since the
+    collector started (as cpu_account.ProcessCpu counts them, with workers
+    that exited, e.g. on a reload, counted until their last sample), their
+    total RSS and the number of processes,
+  - TCP: established connections on the TLS port with their mean cwnd and
+    smoothed RTT and summed retransmissions from `ss -tin`, plus the host's
+    cumulative InSegs, OutSegs and RetransSegs from /proc/net/snmp,
+  - the interface's cumulative byte, packet and drop counters.
+
+ss only sees connections that are open at that instant, which handshake
+connections rarely are, so retransmissions over an interval are best read as
+the difference of tcp_retrans_segs between samples. The cpu_us series is
+what `cpu_account.py join` attributes to the client's batches.
+"""
+import json
+import re
+import subprocess
+import threading
+import time
+
+from cpu_account import ProcessCpu, process_tree
+
+INTERFACE_COUNTERS = ("rx_bytes", "tx_bytes", "rx_packets", "tx_packets", "rx_dropped", "tx_dropped")
+SNMP_COUNTERS = {"InSegs": "tcp_in_segs", "OutSegs": "tcp_out_segs", "RetransSegs": "tcp_retrans_segs"}
+
+
+def rss_kb(pids):
+    """Total resident set size of pids in kB."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+def tcp_counters():
+    """Cumulative host TCP segment counters from /proc/net/snmp."""
+    with open("/proc/net/snmp") as f:
+        rows = [line.split() for line in f if line.startswith("Tcp:")]
+    names, values = rows[0][1:], rows[1][1:]
+    counters = dict(zip(names, values))
+    return {column: int(counters[name]) for name, column in SNMP_COUNTERS.items()}
+
+
+def parse_ss(output):
+    """Connection count, mean cwnd, mean RTT and total retransmissions from `ss -tinH` output."""
+    connections = sum(1 for line in output.splitlines() if line and not line[0].isspace())
+    cwnds = [int(value) for value in re.findall(r"\bcwnd:(\d+)", output)]
+    rtts = [float(value) for value in re.findall(r"\brtt:([\d.]+)/", output)]
+    retransmits = [int(value) for value in re.findall(r"\bretrans:\d+/(\d+)", output)]
+    return {
+        "tcp_conns": connections,
+        "cwnd_mean": sum(cwnds) / len(cwnds) if cwnds else None,
+        "rtt_mean_ms": sum(rtts) / len(rtts) if rtts else None,
+        "tcp_retrans": sum(retransmits),
+    }
+
+
+def socket_stats(port):
+    """TCP stats of the established connections on a local port."""
+    output = subprocess.run(["ss", "-tinH", "state", "established", f"( sport = :{port} )"],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    return parse_ss(output)
+
+
+def interface_counters(interface):
+    """Cumulative byte, packet and drop counters of a network interface."""
+    counters = {}
+    for name in INTERFACE_COUNTERS:
+        try:
+            with open(f"/sys/class/net/{interface}/statistics/{name}") as f:
+                counters[name] = int(f.read())
+        except FileNotFoundError:
+            counters[name] = None
+    return counters
+
+
+class TelemetryCollector:
+    """Background thread sampling nginx, TCP and interface stats into a JSON lines file.
+
+    run_id can be set at any time; samples taken before a run was announced
+    carry None. samples(run_id) returns those of one run for sending back.
+    """
+    def __init__(self, path, nginx_pid, interface="eth0", port=4433, interval=1.0):
+        self.path = path
+        self.nginx_pid = nginx_pid
+        self.interface = interface
+        self.port = port
+        self.interval = interval
+        self.run_id = None
+        self._cpu = ProcessCpu(nginx_pid)
+        self._cpu_start = None
+        # Last usage of every process seen, so that workers retired by a reload keep counting
+        self._cpu_seen = {}
+        self._samples = []
+        self._file = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        """Take one sample now."""
+        usage = self._cpu.snapshot()
+        if self._cpu_start is None:
+            self._cpu_start = usage
+        self._cpu_seen.update(usage)
+        pids = process_tree(self.nginx_pid)
+        sample = {
+            "run_id": self.run_id,
+            "timestamp": time.time(),
+            "cpu_us": self._cpu.delta(self._cpu_start, self._cpu_seen),
+            "rss_kb": rss_kb(pids),
+            "nginx_procs": len(pids),
+        }
+        sample.update(socket_stats(self.port))
+        sample.update(tcp_counters())
+        sample.update(interface_counters(self.interface))
+        return sample
+
+    def record(self):
+        """Take one sample now, keep it and append it to the file."""
+        with self._lock:
+            sample = self.sample()
+            self._samples.append(sample)
+            self._file.write(json.dumps(sample) + "\n")
+            self._file.flush()
+        return sample
+
+    def _run(self):
+        while True:
+            self.record()
+            if self._stop.wait(self.interval):
+                return
+
+    def samples(self, run_id=None):
+        """Samples taken so far, only those of run_id if given."""
+        with self._lock:
+            return [sample for sample in self._samples if run_id is None or sample["run_id"] == run_id]
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._file.close()
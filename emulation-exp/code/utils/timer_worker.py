@@ -0,0 +1,266 @@
+"""Persistent s_timer measurement worker.
+
+Instead of spawning a fresh ./s_timer.o per batch, a single process is
+started in worker mode (`./s_timer.o --worker`). It keeps its SSL_CTX and CA
+loaded, reads "<alg> <count>" commands from stdin and streams one
+"<index>,<ms>" line per handshake, so results can be consumed (and written
+out) while a batch is still running. Workers that report failed attempts
+instead of retrying them silently (e.g. load_gen.py) send
+"FAIL <index>,<ms>,<error class>" lines, which are collected in
+last_batch["failed_attempts"].
+
+s_timer appends the handshake milestones of PHASES to every line, in ms
+since the start of the handshake (-1 when a message was not seen). They end
+up in HandshakeRecord.phases, with NaN for missing milestones. The last
+field is the handshake type the server agreed to (see HANDSHAKE_TYPES).
+s_timer commands may end in "mix=<full>,<resumed>,<early>" to weigh full,
+resumed and 0-RTT handshakes within a batch.
+
+A batch ends with "END", optionally followed by key=value counters such as
+s_timer's "END retries=3 budget_exhausted=0 gave_up=0" (attempts it retried
+after a connection failed, whether the batch's time budget ran out and
+whether a handshake ran out of attempts). They are added to last_batch as
+integers.
+
+s_timer reports every failed attempt as "FAIL <index>,<ms>,<error class>,<attempt>"
+and retries it as handshake <index>. Its HandshakeRecord then counts the
+attempts, and time_to_success_ms adds up the time of all of them, so a cell's
+tail includes the retries instead of only the attempt that got through.
+"timeout=<ms>" bounds every attempt and "budget=<ms>" the whole batch, and
+"attempts=<n>" the tries per handshake (s_timer gives up after 10 by default,
+0 for no limit). Either ends the batch early, with the handshake that was
+being retried counted as abandoned.
+"""
+import json
+import math
+import subprocess
+import threading
+import time
+from collections import Counter, namedtuple
+
+WORKER_COMMAND = ["./s_timer.o", "--worker"]
+
+# Order of the milestones after "<index>,<ms>", matching enum phase in s_timer.c
+PHASES = (
+    "tcp_connect_ms",         # TCP connection established
+    "client_hello_ms",        # ClientHello sent
+    "server_hello_ms",        # ServerHello received
+    "certificate_ms",         # server Certificate received
+    "certificate_verify_ms",  # server CertificateVerify received
+    "finished_ms",            # client Finished sent
+)
+
+# Handshake types reported by s_timer, matching type_names in s_timer.c. A
+# batch asks for a mix of MIX_TYPES; early_rejected is a resumption whose
+# early data the server refused, fallback a ticket the server did not take.
+HANDSHAKE_TYPES = ("full", "resumed", "early", "early_rejected", "fallback")
+MIX_TYPES = HANDSHAKE_TYPES[:3]
+
+HandshakeRecord = namedtuple("HandshakeRecord", ["index", "ms", "timestamp", "phases", "handshake_type", "attempts",
+                                                 "time_to_success_ms"], defaults=(None, None, None, None))
+HandshakeFailure = namedtuple("HandshakeFailure", ["index", "ms", "error", "timestamp", "attempt"], defaults=(1,))
+
+
+class TimerWorkerError(RuntimeError):
+    """Raised when the worker reports a batch it could not complete."""
+
+
+class TimerWorker:
+    """Wrapper around one long-running `s_timer.o --worker` process.
+
+    popen is any callable with the subprocess.Popen signature, e.g. a
+    Mininet host's popen so that the worker runs inside the client's
+    network namespace.
+    """
+    def __init__(self, popen=subprocess.Popen, command=WORKER_COMMAND):
+        self.proc = popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,
+            universal_newlines=True,
+            bufsize=1,
+        )
+        self.last_batch = None
+
+    def measure(self, alg, count, rate=None, schedule="fixed", mix=None, timeout=None, budget=None,
+                attempts=None):
+        """Run count handshakes with alg, yielding one HandshakeRecord each.
+
+        A rate (handshakes per second) asks for an open-loop batch on a fixed
+        or Poisson schedule, which only load_gen.py workers support. A mix of
+        (full, resumed, early) weights, see parse_mix, only s_timer does, as
+        well as a timeout in seconds per attempt, a budget in seconds for
+        the batch, which then ends with fewer handshakes, and a maximum of
+        attempts per handshake, beyond which the batch fails. If the caller stops
+        iterating early, the rest of the batch is read and discarded so the
+        next command starts from a clean stream.
+        """
+        command = f"{alg} {count}"
+        if rate is not None:
+            command += f" {rate} {schedule}"
+        if mix is not None:
+            command += " mix=" + ",".join(str(weight) for weight in mix)
+        if timeout:
+            command += f" timeout={timeout * 1000:g}"
+        if budget:
+            command += f" budget={budget * 1000:g}"
+        if attempts is not None:
+            command += f" attempts={attempts}"
+        self.proc.stdin.write(command + "\n")
+        self.proc.stdin.flush()
+        start = time.perf_counter()
+        handshakes = 0
+        errors = Counter()
+        types = Counter()
+        failures = []
+        # Failed attempts and their ms of every handshake s_timer is retrying
+        retrying = {}
+        given_up = 0
+        finished = False
+        try:
+            for line in self.proc.stdout:
+                line = line.strip()
+                if line == "END" or line.startswith("END "):
+                    finished = True
+                    elapsed = time.perf_counter() - start
+                    attempts = handshakes + len(failures)
+                    self.last_batch = {
+                        "handshakes": handshakes,
+                        "failures": len(failures),
+                        "retries": 0,
+                        "success_rate": handshakes / attempts if attempts else float("nan"),
+                        # Failures a worker does not retry, and the handshake s_timer was still retrying
+                        # when the batch's budget or the handshake's attempts ran out
+                        "abandoned": given_up + len(retrying),
+                        "errors": dict(errors),
+                        "elapsed_s": elapsed,
+                        "throughput": handshakes / elapsed if elapsed > 0 else float("nan"),
+                    }
+                    for counter in line.split()[1:]:
+                        key, value = counter.split("=", 1)
+                        self.last_batch[key] = int(value)
+                    if rate is not None:
+                        self.last_batch["offered_rate"] = rate
+                    if types:
+                        self.last_batch["handshake_types"] = dict(types)
+                    if failures:
+                        self.last_batch["failed_attempts"] = [failure._asdict() for failure in failures]
+                    return
+                if line.startswith("ERR"):
+                    finished = True
+                    raise TimerWorkerError(f"s_timer worker failed on {alg}: {line[4:]}")
+                if not line:
+                    continue
+                if line.startswith("FAIL "):
+                    index, ms, error, *attempt = line[5:].split(",")
+                    failure = HandshakeFailure(int(index), float(ms), error, time.time(), *map(int, attempt))
+                    failures.append(failure)
+                    errors[error] += 1
+                    # Only s_timer numbers its attempts; load_gen.py does not retry a failed handshake
+                    if attempt:
+                        tries, failed_ms = retrying.get(failure.index, (0, 0.0))
+                        retrying[failure.index] = (tries + 1, failed_ms + failure.ms)
+                    else:
+                        given_up += 1
+                    continue
+                index, ms, *phases = line.split(",")
+                handshake_type = phases.pop() if len(phases) > len(PHASES) else None
+                handshakes += 1
+                if handshake_type is not None:
+                    types[handshake_type] += 1
+                record = HandshakeRecord(int(index), float(ms), time.time(), parse_phases(phases), handshake_type)
+                if phases:
+                    tries, failed_ms = retrying.pop(record.index, (0, 0.0))
+                    record = record._replace(attempts=tries + 1, time_to_success_ms=failed_ms + record.ms)
+                yield record
+            finished = True
+            raise TimerWorkerError(f"s_timer worker exited with code {self.proc.wait()}")
+        finally:
+            if not finished:
+                self._drain()
+
+    def _drain(self):
+        for line in self.proc.stdout:
+            if line.startswith(("END", "ERR")):
+                return
+
+    def close(self):
+        """Close stdin so the worker exits, then reap it."""
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_phases(fields):
+    """Turn the milestone fields of a worker line into a tuple, or None if there are none."""
+    if not fields:
+        return None
+    values = [float(field) for field in fields]
+    return tuple(value if value >= 0 else math.nan for value in values)
+
+
+def phase_columns(records):
+    """Result store columns holding the phase milestones of a batch of records."""
+    if not any(record.phases for record in records):
+        return {}
+    rows = [record.phases or (math.nan,) * len(PHASES) for record in records]
+    return {name: [row[i] for row in rows] for i, name in enumerate(PHASES)}
+
+
+def handshake_type_columns(records):
+    """Result store column with the handshake type of every record, if the worker reports it."""
+    if not any(record.handshake_type for record in records):
+        return {}
+    return {"handshake_type": [record.handshake_type or "full" for record in records]}
+
+
+def full_handshake_ms(records):
+    """ms of the full handshakes among records, the samples the wide CSVs and stopping rules compare.
+
+    Records of workers that do not report a type are full handshakes.
+    """
+    return [record.ms for record in records if (record.handshake_type or "full") == "full"]
+
+
+def attempt_columns(records):
+    """Result store columns with the attempts and time to success of every record, if the worker reports them."""
+    if not any(record.attempts for record in records):
+        return {}
+    return {
+        "attempts": [record.attempts or 1 for record in records],
+        "time_to_success_ms": [record.ms if record.time_to_success_ms is None else record.time_to_success_ms
+                               for record in records],
+    }
+
+
+def parse_mix(value):
+    """Parse a mix such as 'full=70,resumed=20,early=10' into weights in MIX_TYPES order."""
+    weights = dict.fromkeys(MIX_TYPES, 0)
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in weights or not weight.isdigit():
+            raise ValueError(f"bad handshake mix entry {item!r}, expected <{'|'.join(MIX_TYPES)}>=<weight>")
+        weights[name] = int(weight)
+    if not any(weights.values()):
+        raise ValueError("a handshake mix needs at least one positive weight")
+    return tuple(weights.values())
+
+
+class BatchLog:
+    """Thread-safe JSON lines file with the throughput and failures of every batch."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def log(self, batch, **cell):
+        record = dict(cell)
+        record.update(batch)
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
@@ -16,7 +16,7 @@ apt install -y git \
                libcjson1 \
                libcjson-dev
 
-pip3 install tqdm
+pip3 install numpy
 
 NGINX_VERSION=1.17.5
 CMAKE_VERSION=3.18
@@ -1,20 +1,41 @@
-import csv
+import argparse
+import math
 import os
 import sys
-from tqdm import tqdm
 import subprocess
-import socket
 import json
+import socket
+import time
+
+# Shared measurement helpers live next to the emulation experiment code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "emulation-exp", "code", "utils"))
+from adaptive import StoppingLog, StoppingRule  # noqa: E402
+from algorithms import select_algorithms  # noqa: E402
+from capture import PacketCapture, flow_columns, handshake_flows  # noqa: E402
+from catalog import RunCatalog, build_versions  # noqa: E402
+from control import ControlClient, ControlError  # noqa: E402
+from cpu_account import CpuMeter, ProcessCpu, parse_cpus, pin  # noqa: E402
+from histogram import SketchBook, print_summaries  # noqa: E402
+from metrics import METRICS_PORT, CampaignMetrics, MetricsServer  # noqa: E402
+from link_control import LinkConfigError, configure_address  # noqa: E402
+from result_store import ResultStore, parse_rtt_str  # noqa: E402
+from rtt_probe import RttMonitor, probe_rtt, rtt_label  # noqa: E402
+from load_gen import LoadGenerator, LoadGenError, check_group  # noqa: E402
+from timer_worker import (BatchLog, TimerWorker, attempt_columns, full_handshake_ms,  # noqa: E402
+                          handshake_type_columns, parse_mix, phase_columns)
+
 # Network configuration constants
 SERVER_IP = None
 CLIENT_IP = None
 SERVER_PORT = None
+TLS_PORT = None
 
 # Read network configuration from config file
 with open('../config.json') as f:
     config = json.load(f)
     SERVER_IP = config['server_ip']
     CLIENT_IP = config['client_ip']
+    TLS_PORT = int(config['tls_port'])
     SERVER_PORT = int(config['socket_port'])
 
 
@@ -35,102 +56,310 @@ def run_subprocess(command, working_dir='.', expected_returncode=0):
     assert result.returncode == expected_returncode
     return result.stdout.decode('utf-8')
 
-def reset_interface():
-    """Reset the network interface to a clean state."""
-    reset_commands = [
-        ['ip', 'link', 'set', INTERFACE, 'down'],
-        ['ip', 'addr', 'flush', 'dev', INTERFACE],
-    ]
-    
-    for cmd in reset_commands:
-        try:
-            if 'qdisc' in cmd:
-                try:
-                    run_subprocess(cmd, expected_returncode=2)  # Allow error code 2 for non-existent qdisc
-                except AssertionError:
-                    print(f"No existing qdisc to delete on {INTERFACE}")
-            else:
-                run_subprocess(cmd)
-            print(f"Reset step completed: {' '.join(cmd)}")
-        except AssertionError:
-            print(f"Warning during reset: {' '.join(cmd)}")
-
 def configure_network_interface():
-    """Configure the client network interface with tc qdisc."""
-    # First reset the interface
-    reset_interface()
-    
-    commands = [
-        # Basic interface configuration
-        ['ip', 'link', 'set', INTERFACE, 'up'],
-        ['ip', 'addr', 'add', f'{CLIENT_IP}/{NETMASK}', 'dev', INTERFACE],
-    ]
-    
-    for cmd in commands:
-        try:
-            run_subprocess(cmd)
-            print(f"Successfully executed: {' '.join(cmd)}")
-        except AssertionError:
-            print(f"Error executing command: {' '.join(cmd)}")
-            sys.exit(1)
+    """Bring the client interface up with its address in one ip batch, verified by reading it back."""
+    try:
+        elapsed = configure_address(INTERFACE, f"{CLIENT_IP}/{NETMASK}")
+    except LinkConfigError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ {INTERFACE} configured with {CLIENT_IP}/{NETMASK} in {elapsed * 1000:.0f} ms")
 
 def get_rtt_ms():
-    """Ping the server and extract RTT."""
-    result = run_subprocess(['ping', SERVER_IP, '-c', '30'])
-    lines = result.splitlines()
-    rtt_line = [line for line in lines if "rtt" in line][0]
-    avg_rtt = rtt_line.split("/")[4]
-    return avg_rtt.replace(".", "p")
-
-def send_completion_message():
-    """Send a completion message to the server."""
+    """Probe the server until the median RTT converges and return the RTT statistics."""
+    stats = probe_rtt(SERVER_IP)
+    print(f"RTT min {stats['min']:.3f} avg {stats['avg']:.3f} p95 {stats['p95']:.3f} "
+          f"jitter {stats['jitter']:.3f} ms from {stats['count']}/{stats['sent']} probes")
+    return stats
+
+def use_certificate(control, sig, ca_path):
+    """Have the server serve sig's certificate and write its CA to ca_path for the worker."""
+    reply = control.call("use_cert", sig=sig)
+    with open(ca_path, "w") as f:
+        f.write(reply["ca"])
+    print(f"✅ Server switched to {sig} ({'generated' if reply['generated'] else 'cached'} chain), "
+          f"nginx ready in {reply['reload_s']:.2f} s")
+    return reply
+
+def finish_run(control, telemetry_path):
+    """Append the server's telemetry samples of the run to telemetry_path and let the server stop."""
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((SERVER_IP, SERVER_PORT))
-            sock.sendall(b"CLIENT_FINISHED")
-            print("✅ Completion message sent to server")
-    except ConnectionRefusedError:
-        print("❌ Could not connect to server - is it running?")
-    except Exception as e:
-        print(f"❌ Error sending completion message: {e}")
-
-def time_handshake(kex_alg, measurements):
-    """Run handshake timing test from a Mininet host."""
-    
-    result = run_subprocess(["./s_timer.o", kex_alg, str(measurements)])
-    result = result.replace("\r", "")
-    result = result.replace("\n", "")
+        samples = control.call("telemetry", run_id=run_id)["samples"]
+        with open(telemetry_path, "a") as f:
+            for sample in samples:
+                f.write(json.dumps(sample) + "\n")
+        print(f"✅ Received {len(samples)} server telemetry samples")
+        control.call("finish")
+        print("✅ Completion message sent to server")
+    except (ControlError, OSError) as e:
+        print(f"❌ Error finishing the run on the server: {e}")
+    finally:
+        control.close()
+
+def time_handshake(worker, kex_alg, measurements, pcap_path=None):
+    """Stream one batch of handshake records from the s_timer worker.
+
+    With a pcap_path the batch is captured on the client interface and the
+    packet metrics of every handshake are returned with the records; the
+    number of records and flows that could not be matched go in the batch log.
+    """
+    if pcap_path is None:
+        with cpu_meter:
+            records = list(worker.measure(kex_alg, measurements, mix=args.mix, **deadlines))
+        return records, {}
+    with PacketCapture(INTERFACE, pcap_path, port=TLS_PORT), cpu_meter:
+        records = list(worker.measure(kex_alg, measurements, mix=args.mix, **deadlines))
+    flows, unmatched = flow_columns(records, handshake_flows(pcap_path, port=TLS_PORT))
+    worker.last_batch.update(unmatched)
+    if not args.keep_pcap:
+        os.remove(pcap_path)
+    return records, flows
 
-    return [float(i) for i in result.split(",") if i != ""]
+
+def store_batch(store, kex_alg, rtt_str, timer, records, concurrency=1, flows=None, probe_rtts=None,
+                cpu=None, certificate=None):
+    """Append one measurement batch to the columnar result store."""
+    store.append(
+        [record.ms for record in records],
+        run=run_id,
+        algorithm=kex_alg,
+        rtt_measured_ms=parse_rtt_str(rtt_str),
+        timer=timer,
+        certificate=certificate,
+        sample=[record.index for record in records],
+        timestamp=[record.timestamp for record in records],
+        concurrency=concurrency,
+        **phase_columns(records),
+        **handshake_type_columns(records),
+        **attempt_columns(records),
+        **(flows or {}),
+        **(probe_rtts or {}),
+        **(cpu or {}),
+    )
+
+
+def record_sketches(sketches, cell, records):
+    """Add a batch to the sketches of cell, one per handshake type, and save them now and then."""
+    by_type = {}
+    for record in records:
+        by_type.setdefault(record.handshake_type or "full", []).append(record.ms)
+    for handshake_type, values in by_type.items():
+        sketches.record({**cell, "handshake_type": handshake_type}, values)
+    sketches.maybe_save()
 
 
-def run_timers(kex_alg):
-    """Run multiple timer measurements for a key exchange algorithm in parallel."""
-    results = []
-    for _ in tqdm(range(TIMERS), desc="Running timers"):
-        results.extend(time_handshake(kex_alg, MEASUREMENTS_PER_TIMER))
-    return results
+def run_timers(worker, kex_alg, csv_path, on_batch=None, stopping_rule=None, pcap_prefix=None, sketches=None,
+               cell=None):
+    """Run multiple timer measurements for a key exchange algorithm in parallel.
+
+    The full handshakes are appended to the single row of csv_path batch by
+    batch, and only an adaptive stopping_rule keeps them in memory, up to its
+    max_samples; resumed and 0-RTT handshakes of a --mix go to the store
+    only. With sketches, every batch also goes into the streaming
+    sketches of cell. Returns the number of samples and the samples the
+    stopping rule decided on (None without one).
+    """
+    measured = 0
+    samples = None if stopping_rule is None else []
+    timers = TIMERS
+    if stopping_rule is not None:
+        timers = math.ceil(stopping_rule.max_samples / MEASUREMENTS_PER_TIMER)
+    with open(csv_path, "w") as out_file:
+        for timer in range(timers):
+            measurements = MEASUREMENTS_PER_TIMER
+            if stopping_rule is not None:
+                measurements = min(measurements, stopping_rule.max_samples - measured)
+            pcap_path = None if pcap_prefix is None else f"{pcap_prefix}_{timer}.pcap"
+            records, flows = time_handshake(worker, kex_alg, measurements, pcap_path)
+            if on_batch is not None:
+                on_batch(timer, records, flows)
+            if sketches is not None:
+                record_sketches(sketches, cell, records)
+            full = full_handshake_ms(records)
+            if full:
+                out_file.write(("," if measured else "") + ",".join(str(ms) for ms in full))
+                out_file.flush()
+            measured += len(full)
+            if samples is not None:
+                samples.extend(full)
+                if stopping_rule.should_stop(samples):
+                    break
+        out_file.write("\r\n")
+    return measured, samples
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Key exchange handshake measurement over the satellite link")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="stop each algorithm once the median and p95 confidence intervals are narrow enough")
+    parser.add_argument("--ci-width", type=float, default=0.05,
+                        help="target relative confidence interval width in adaptive mode")
+    parser.add_argument("--min-samples", type=int, default=2 * MEASUREMENTS_PER_TIMER,
+                        help="minimum handshakes per algorithm in adaptive mode")
+    parser.add_argument("--max-samples", type=int, default=TIMERS * MEASUREMENTS_PER_TIMER,
+                        help="maximum handshakes per algorithm in adaptive mode")
+    parser.add_argument("--backend", choices=["s_timer", "asyncio"], default="s_timer",
+                        help="sequential s_timer handshakes, or concurrent ones from the asyncio load generator")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="handshakes kept in flight with --backend asyncio")
+    parser.add_argument("--algs", default="default", metavar="SPEC",
+                        help="key exchange groups to sweep: default, auto, auto:<regex> or a comma separated list "
+                             "(see utils/algorithms.py)")
+    parser.add_argument("--sigs", default=None, metavar="SPEC",
+                        help="server certificates to sweep every group against, switched over the control channel: "
+                             "default, auto, auto:<regex> or a comma separated list (default: the one being served)")
+    parser.add_argument("--mix", type=parse_mix, default=None, metavar="full=W,resumed=W,early=W",
+                        help="weights of full, resumed and 0-RTT handshakes within every batch (default: full only)")
+    parser.add_argument("--capture", action="store_true",
+                        help=f"tcpdump every batch on {INTERFACE} and store per-handshake bytes, segments and round trips")
+    parser.add_argument("--keep-pcap", action="store_true",
+                        help="keep the pcap files of --capture instead of deleting them once parsed")
+    parser.add_argument("--pin", type=parse_cpus, default=None, metavar="CPUS",
+                        help="pin the s_timer worker to these cores, e.g. 2-3")
+    parser.add_argument("--rtt-interval", type=float, default=0.5,
+                        help="seconds between the background RTT probes sent while measuring")
+    parser.add_argument("--sketch-interval", type=float, default=60.0,
+                        help="seconds between saves of the streaming latency sketches")
+    parser.add_argument("--handshake-timeout", type=float, default=30.0, metavar="SECONDS",
+                        help="give up on a handshake attempt after this long and retry it (0: wait forever)")
+    parser.add_argument("--batch-budget", type=float, default=0, metavar="SECONDS",
+                        help="end a batch after this long even if handshakes are missing (0: no budget)")
+    parser.add_argument("--max-attempts", type=int, default=10, metavar="N",
+                        help="give up on a handshake after N failed attempts and end its batch (0: retry forever)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, metavar="PORT",
+                        help="serve live progress in the Prometheus text format on localhost:PORT/metrics (0: off)")
+    args = parser.parse_args()
+    # Tags the store rows, the logs and the server's telemetry of this run
+    run_id = int(time.time())
+    if args.mix and args.backend != "s_timer":
+        parser.error("--mix needs --backend s_timer")
+    if args.batch_budget and args.backend != "s_timer":
+        parser.error("--batch-budget needs --backend s_timer")
+    if args.max_attempts < 0:
+        parser.error("--max-attempts must not be negative")
+    try:
+        kex_algs = select_algorithms("kex", args.algs)
+        sig_algs = None if args.sigs is None else select_algorithms("sig", args.sigs)
+    except ValueError as e:
+        parser.error(str(e))
+    # The load generator offers groups through the OpenSSL Python is linked against, which may lack them
+    if args.backend == "asyncio":
+        for kex_alg in kex_algs:
+            try:
+                check_group(kex_alg)
+            except LoadGenError as e:
+                parser.error(str(e))
+
     # Configure network interface first
     # configure_network_interface()
     
     # Measure RTT
-    rtt_str = get_rtt_ms()
+    rtt_stats = get_rtt_ms()
+    rtt_str = rtt_label(rtt_stats)
     print(f"✅ RTT measurement success! RTT: {rtt_str}")
     
-    # Send completion message
-    send_completion_message()
+    # Announce the run on the control channel; the server may still be starting
+    control = ControlClient(SERVER_IP, SERVER_PORT)
+    try:
+        serving = control.call("hello", run_id=run_id)["sig"]
+    except (ControlError, OSError) as e:
+        print(f"❌ Could not reach the server's control channel - is it running? {e}")
+        sys.exit(1)
+    print(f"✅ Server serves {serving}")
+
+    # Live progress for scrapers and curl, see utils/metrics.py
+    metrics = CampaignMetrics(total_cells=len(sig_algs or [serving]) * len(kex_algs), run=run_id)
+    metrics_server = MetricsServer(metrics, args.metrics_port).start()
 
     # Create data directory
     if not os.path.exists("../../sat_data/kex"):
         os.makedirs("../../sat_data/kex")
+    store = ResultStore("../../sat_data/kex/store")
+    # Indexed record of the run and its cells that analysis queries, see utils/catalog.py
+    catalog = RunCatalog("../../sat_data/catalog.sqlite")
+    catalog_run = catalog.start_run("satellite", "kex", run_id, argv=sys.argv, **build_versions())
+    if args.capture:
+        os.makedirs("../../sat_data/kex/pcap", exist_ok=True)
+
+    stopping_rule = None
+    if args.adaptive:
+        stopping_rule = StoppingRule(args.ci_width, args.min_samples, args.max_samples)
+        stopping_log = StoppingLog("../../sat_data/kex/stopping.jsonl")
+
+    # The load generator shares the client's network, so it runs in-process
+    batch_log = BatchLog("../../sat_data/kex/batches.jsonl")
+    # Probe statistics and the RTT time series of the background probes
+    rtt_log = BatchLog("../../sat_data/kex/rtt_monitor.jsonl")
+    rtt_log.log(rtt_stats, run=run_id, rtt=rtt_str)
+    monitor = RttMonitor(SERVER_IP, interval=args.rtt_interval)
+    # Mergeable latency sketches of this run, see histogram.py show/merge
+    os.makedirs("../../sat_data/kex/sketches", exist_ok=True)
+    host = socket.gethostname()
+    sketches = SketchBook(f"../../sat_data/kex/sketches/{host}_{run_id}.json", args.sketch_interval,
+                          runs=[run_id], hosts=[host])
+    concurrency = 1
+    # s_timer bounds every attempt and batch, the load generator only its handshakes
+    deadlines = {"timeout": args.handshake_timeout, "budget": args.batch_budget, "attempts": args.max_attempts}
+    if args.backend == "asyncio":
+        concurrency = args.concurrency
+        deadlines = {}
+
+    def start_worker():
+        """A new worker, so that it verifies against the CA of the certificate being served."""
+        if args.backend == "asyncio":
+            return LoadGenerator(SERVER_IP, TLS_PORT, cafile="./CA.crt", concurrency=concurrency,
+                                 timeout=args.handshake_timeout), CpuMeter()
+        worker = TimerWorker()
+        if args.pin:
+            pin(worker.proc.pid, args.pin)
+        # CPU time of the s_timer worker per batch; the server meters nginx itself (see cpu_account.py join)
+        return worker, CpuMeter(client=ProcessCpu(worker.proc.pid))
+
+    def on_batch(timer, records, flows):
+        metrics.record_batch(0, records, worker.last_batch)
+        store_batch(store, kex_alg, rtt_str, timer, records, concurrency, flows, monitor.columns(records),
+                    cpu_meter.columns(records), certificate=sig)
+        rtt_log.log({"probes": monitor.drain()}, run=run_id, algorithm=kex_alg, rtt=rtt_str, timer=timer)
+        batch_log.log({**worker.last_batch, **cpu_meter.last}, run=run_id, algorithm=kex_alg, certificate=sig,
+                      rtt=rtt_str, timer=timer, backend=args.backend, concurrency=concurrency)
+
+    # Without --sigs every group is measured against the certificate the server already serves
+    with monitor:
+        for sig in sig_algs or [serving]:
+            if sig_algs is not None:
+                try:
+                    use_certificate(control, sig, "./CA.crt")
+                except ControlError as e:
+                    print(f"❌ {e}, skipping {sig}")
+                    metrics.total_cells -= len(kex_algs)
+                    continue
+            worker, cpu_meter = start_worker()
+            with worker:
+                for kex_alg in kex_algs:
+                    # Cells of a kex x sig matrix are named after both algorithms
+                    cell = kex_alg if sig_algs is None else f"{kex_alg}_{sig}"
+                    metrics.start_cell(0, algorithm=kex_alg, certificate=sig)
+                    csv_path = f"../../sat_data/kex/{cell}_{rtt_str}ms.csv"
+                    measured, samples = run_timers(
+                        worker, kex_alg, csv_path,
+                        on_batch=on_batch,
+                        stopping_rule=stopping_rule,
+                        sketches=sketches,
+                        cell={"algorithm": kex_alg, "certificate": sig},
+                        pcap_prefix=f"../../sat_data/kex/pcap/{cell}_{rtt_str}ms" if args.capture else None,
+                    )
+                    if stopping_rule is not None:
+                        stopping_log.log(stopping_rule.summary(samples), run=run_id, algorithm=kex_alg,
+                                         certificate=sig, rtt=rtt_str)
+                    metrics.finish_cell(0)
+                    catalog.record_cell(catalog_run, kex_alg, measured, certificate=sig,
+                                        rtt_measured_ms=parse_rtt_str(rtt_str), loss_measured_pct=rtt_stats["loss_pct"],
+                                        path=csv_path, store=store.path)
 
-    for kex_alg in ["prime256v1", "p256_kyber512_90s", "p256_kyber768_90s", "p256_kyber1024_90s"]:
-        results = run_timers(kex_alg)
-        with open(f"../../sat_data/kex/{kex_alg}_{rtt_str}ms.csv", "w") as out_file:
-            csv_writer = csv.writer(out_file)
-            csv_writer.writerow(results)
+    sketches.save()
+    print(f"✅ Latency sketches saved to {sketches.path}")
+    print_summaries(sketches)
 
-    # Send completion message
-    send_completion_message()
\ No newline at end of file
+    # Collect the server's telemetry and stop it
+    finish_run(control, "../../sat_data/kex/server_telemetry.jsonl")
+    catalog.finish_run(catalog_run)
+    metrics_server.stop()
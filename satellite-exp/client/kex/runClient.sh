@@ -5,4 +5,4 @@ echo "Running key exchange experiment on client... ⚡"
 
 ROOT="$(dirname $(pwd))"
 
-sudo python3 ${ROOT}/kex/client.py
\ No newline at end of file
+sudo python3 ${ROOT}/kex/client.py "$@"
\ No newline at end of file
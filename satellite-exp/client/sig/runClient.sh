@@ -5,11 +5,6 @@ echo "Running signature experiment... ⚡"
 
 ROOT="$(dirname $(pwd))"
 
-for SIG in "ecdsap256" "dilithium2" "dilithium3";
-do
-    # Run experiment
-    sudo python3 ${ROOT}/sig/client.py ${SIG}
-
-    # Wait a bit longer then server
-    sleep 10
-done
\ No newline at end of file
+# Signature algorithms: default, auto, auto:<regex> or a comma separated list (see utils/algorithms.py).
+# The client switches the server's certificate for each of them over the control channel.
+sudo python3 ${ROOT}/sig/client.py "${SIG_ALGS:-default}" "$@"
@@ -8,7 +8,7 @@ ROOT="$(dirname $(pwd))"
 NGINX_APP=${ROOT}/tmp/nginx/sbin/nginx
 NGINX_CONF_DIR=${ROOT}/tmp/nginx/conf
 
-cp ${ROOT}/kex/nginx.conf ${NGINX_CONF_DIR}/nginx.conf
+cp ${ROOT}/kex/nginx.conf ${NGINX_CONF_DIR}/nginx.conf "$@"
 
-sudo python3 ${ROOT}/kex/server.py ${NGINX_APP} ${NGINX_CONF_DIR}/nginx.conf
+sudo python3 ${ROOT}/kex/server.py ${NGINX_APP} ${NGINX_CONF_DIR}/nginx.conf "$@"
 
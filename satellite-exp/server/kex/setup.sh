@@ -8,21 +8,18 @@ OPENSSL_CNF=${ROOT}/tmp/openssl/apps/openssl.cnf
 
 NGINX_APP=${ROOT}/tmp/nginx/sbin/nginx
 NGINX_CONF_DIR=${ROOT}/tmp/nginx/conf
+CERT_CACHE=${ROOT}/tmp/cert_cache
 
 ##########################
 # Generate ECDSA P-256 cert
 ##########################
-# generate curve parameters
+# generate curve parameters, synced to the client by syncParam.sh
 ${OPENSSL} ecparam -out prime256v1.pem -name prime256v1
 
-# generate CA key and cert
-${OPENSSL} req -x509 -new -newkey ec:prime256v1.pem -keyout ${NGINX_CONF_DIR}/CA.key -out ${NGINX_CONF_DIR}/CA.crt -nodes -subj "/CN=OQS test ecdsap256 CA" -days 365 -config ${OPENSSL_CNF}
-
-# generate server CSR
-${OPENSSL} req -new -newkey ec:prime256v1.pem -keyout ${NGINX_CONF_DIR}/server.key -out ${NGINX_CONF_DIR}/server.csr -nodes -subj "/CN=oqstest CA ecdsap256" -config ${OPENSSL_CNF}
-
-# generate server cert
-${OPENSSL} x509 -req -in ${NGINX_CONF_DIR}/server.csr -out ${NGINX_CONF_DIR}/server.crt -CA ${NGINX_CONF_DIR}/CA.crt -CAkey ${NGINX_CONF_DIR}/CA.key -CAcreateserial -days 365
+# discover algorithms and install the cert, both cached in ${CERT_CACHE} until the OpenSSL build changes
+ALGORITHMS="python3 ${ROOT}/../../emulation-exp/code/utils/algorithms.py --openssl ${OPENSSL} --config ${OPENSSL_CNF} --cache ${CERT_CACHE}"
+${ALGORITHMS} discover
+${ALGORITHMS} certs kex --out ${NGINX_CONF_DIR} ecdsap256
 
 
 chmod 755 ./syncParam.sh
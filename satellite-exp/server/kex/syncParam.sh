@@ -17,6 +17,7 @@ sudo scp "${ROOT}/kex/prime256v1.pem" "client@${CLIENT_IP}:${CLIENT_DIR}" || {
     exit 1
 }
 
+# Only needed without client.py --sigs, which fetches the CA of every certificate it switches to
 sudo scp "${ROOT}/tmp/nginx/conf/CA.crt" "client@${CLIENT_IP}:${CLIENT_DIR}" || {
     echo "Error: Failed to copy CA.crt"
     exit 1
@@ -7,17 +7,13 @@ ROOT="$(dirname $(pwd))"
 
 NGINX_APP=${ROOT}/tmp/nginx/sbin/nginx
 NGINX_CONF_DIR=${ROOT}/tmp/nginx/conf
+ALGORITHMS="python3 ${ROOT}/../../emulation-exp/code/utils/algorithms.py --openssl ${ROOT}/tmp/openssl/apps/openssl --config ${ROOT}/tmp/openssl/apps/openssl.cnf --cache ${ROOT}/tmp/cert_cache"
 
-cp ${ROOT}/kex/nginx.conf ${NGINX_CONF_DIR}/nginx.conf
+# Signature algorithms: default, auto, auto:<regex> or a comma separated list (see utils/algorithms.py)
+SIGS=$(${ALGORITHMS} select sig "${SIG_ALGS:-default}") || exit 1
+# Certificates of algorithms setup.sh did not generate come from the cache, or are made once
+${ALGORITHMS} certs sig --out ${NGINX_CONF_DIR} ${SIGS} || exit 1
 
-for SIG in "ecdsap256" "dilithium2" "dilithium3";
-do
-    # Ask nginx to use ${SIG} cert and key
-    sed "s/??SERVER_CERT??/${SIG}_server.crt/g; s/??SERVER_KEY??/${SIG}_server.key/g" nginx.conf > ${NGINX_CONF_DIR}/nginx.conf
-
-    # Run experiment
-    sudo python3 ${ROOT}/sig/server.py ${NGINX_APP} ${NGINX_CONF_DIR}/nginx.conf
-
-    # Wait a bit before restarting
-    sleep 5
-done
+# server.py renders nginx.conf for each certificate the client asks for over the control channel
+FIRST_SIG=$(echo ${SIGS} | cut -d' ' -f1)
+sudo python3 ${ROOT}/sig/server.py ${NGINX_APP} ${NGINX_CONF_DIR}/nginx.conf --sig ${FIRST_SIG} "$@"
@@ -1,9 +1,17 @@
+import argparse
 import csv
 import os
 import sys
 import subprocess
-import socket
 import json
+
+# Shared measurement helpers live next to the emulation experiment code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "emulation-exp", "code", "utils"))
+from algorithms import CertCache, OpenSSL, install, install_names  # noqa: E402
+from control import ControlServer, Finished, reload_nginx, render_conf  # noqa: E402
+from cpu_account import nginx_master_pid, parse_cpus, pin  # noqa: E402
+from link_control import LinkConfigError, configure_address  # noqa: E402
+from telemetry import TelemetryCollector  # noqa: E402
 # Network configuration constants
 SERVER_IP = None
 
@@ -11,11 +19,15 @@ SERVER_IP = None
 with open('../config.json') as f:
     config = json.load(f)
     SERVER_IP = config['server_ip']
+    TLS_PORT = int(config['tls_port'])
 
 NETMASK = "24"
 INTERFACE = "eth0"
 SERVER_PORT = 8000
 
+# nginx.conf with ??SERVER_CERT??/??SERVER_KEY?? placeholders, rendered for the algorithm being measured
+NGINX_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nginx.conf")
+
 def run_subprocess(command, working_dir='.', expected_returncode=0):
     result = subprocess.run(
         command,
@@ -28,45 +40,14 @@ def run_subprocess(command, working_dir='.', expected_returncode=0):
     assert result.returncode == expected_returncode
     return result.stdout.decode('utf-8')
 
-def reset_interface():
-    """Reset the network interface to a clean state."""
-    reset_commands = [
-        ['ip', 'link', 'set', INTERFACE, 'down'],
-        ['ip', 'addr', 'flush', 'dev', INTERFACE],
-    ]
-    
-    for cmd in reset_commands:
-        try:
-            if 'qdisc' in cmd:
-                # Ignore errors for tc qdisc del command
-                try:
-                    run_subprocess(cmd, expected_returncode=0)
-                except AssertionError:
-                    print(f"No existing qdisc to delete on {INTERFACE}")
-            else:
-                run_subprocess(cmd)
-            print(f"Reset step completed: {' '.join(cmd)}")
-        except AssertionError:
-            print(f"Warning during reset: {' '.join(cmd)}")
-
 def configure_network_interface():
-    """Configure the server network interface without tc qdisc."""
-    # First reset the interface
-    reset_interface()
-    
-    commands = [
-        # Basic interface configuration only
-        ['ip', 'link', 'set', INTERFACE, 'up'],
-        ['ip', 'addr', 'add', f'{SERVER_IP}/{NETMASK}', 'dev', INTERFACE],
-    ]
-    
-    for cmd in commands:
-        try:
-            run_subprocess(cmd)
-            print(f"Successfully executed: {' '.join(cmd)}")
-        except AssertionError:
-            print(f"Error executing command: {' '.join(cmd)}")
-            sys.exit(1)
+    """Bring the server interface up with its address in one ip batch, verified by reading it back."""
+    try:
+        elapsed = configure_address(INTERFACE, f"{SERVER_IP}/{NETMASK}")
+    except LinkConfigError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ {INTERFACE} configured with {SERVER_IP}/{NETMASK} in {elapsed * 1000:.0f} ms")
 
 def stop_nginx():
     """Stop any running nginx processes."""
@@ -76,30 +57,29 @@ def stop_nginx():
     except AssertionError:
         print("No existing nginx processes found")
 
-def listen_for_client_completion(message_count=2):
-    """Listen for multiple completion messages from client"""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_socket.bind((SERVER_IP, SERVER_PORT))
-        server_socket.listen()
-        
-        for i in range(message_count):
-            conn, addr = server_socket.accept()
-            with conn:
-                data = conn.recv(1024)
-                if data == b"CLIENT_FINISHED":
-                    print(f"Client has finished message {i+1}!")
-
-        server_socket.close()
-
+def install_certificate(certs, nginx_conf, sig):
+    """Install the cached chain of sig next to nginx_conf and render the config for it; returns (CA cert, generated)."""
+    chain_path, generated = certs.chain(sig)
+    names = install_names("sig", sig)
+    install(chain_path, os.path.dirname(nginx_conf), names)
+    render_conf(NGINX_TEMPLATE, nginx_conf, sig)
+    with open(os.path.join(os.path.dirname(nginx_conf), names["CA.crt"])) as f:
+        return f.read(), generated
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python server.py <nginx_path> <nginx_conf_dir>")
-        sys.exit(1)
-
-    nginx_path = sys.argv[1]
-    nginx_conf_dir = sys.argv[2]
+    parser = argparse.ArgumentParser(description="nginx side of the signature satellite measurement")
+    parser.add_argument("nginx_path")
+    parser.add_argument("nginx_conf")
+    parser.add_argument("--sig", default="ecdsap256",
+                        help="certificate to serve until the client asks for another one")
+    parser.add_argument("--pin", type=parse_cpus, default=None, metavar="CPUS",
+                        help="pin nginx and its workers to these cores, e.g. 2-5")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between telemetry samples of nginx, TCP and the interface")
+    args = parser.parse_args()
+
+    nginx_path = args.nginx_path
+    nginx_conf = args.nginx_conf
 
     # Stop any existing nginx processes
     stop_nginx()
@@ -107,13 +87,50 @@ if __name__ == "__main__":
     # Configure network before starting nginx
     # configure_network_interface()
 
-    # Start nginx
-    subprocess.run([nginx_path, "-c", nginx_conf_dir])
-
-    # Listen for both completion messages with a single socket
-    listen_for_client_completion(2)
+    # Start nginx with the initial certificate
+    certs = CertCache(OpenSSL())
+    install_certificate(certs, nginx_conf, args.sig)
+    subprocess.run([nginx_path, "-c", nginx_conf])
+    serving = args.sig
+
+    # Sample nginx CPU and memory, TCP and interface stats while the client measures
+    nginx_pid = nginx_master_pid(nginx_path)
+    if args.pin:
+        pin(nginx_pid, args.pin)
+    os.makedirs("../../sat_data/sig", exist_ok=True)
+    collector = TelemetryCollector("../../sat_data/sig/server_telemetry.jsonl", nginx_pid, interface=INTERFACE,
+                                   port=TLS_PORT, interval=args.interval)
+
+    # Control channel commands, see utils/control.py
+    def hello(run_id):
+        """Start tagging telemetry with the client's run ID."""
+        collector.run_id = run_id
+        print(f"Client started run {run_id}")
+        return {"kind": "sig", "sig": serving}
+
+    def use_cert(sig):
+        """Serve sig's certificate after a graceful reload and hand out its CA."""
+        global serving
+        ca, generated = install_certificate(certs, nginx_conf, sig)
+        reload_s = reload_nginx(nginx_path, nginx_conf, nginx_pid, SERVER_IP, TLS_PORT)
+        serving = sig
+        print(f"✅ Serving {sig} ({'generated' if generated else 'cached'} chain), nginx ready in {reload_s:.2f} s")
+        return {"sig": sig, "ca": ca, "generated": generated, "reload_s": reload_s}
+
+    def telemetry(run_id):
+        """The telemetry samples of a run, up to now."""
+        collector.record()
+        samples = collector.samples(run_id)
+        print(f"Sent {len(samples)} telemetry samples of run {run_id}")
+        return {"samples": samples}
+
+    def finish():
+        raise Finished()
+
+    with collector:
+        ControlServer(SERVER_IP, SERVER_PORT).serve(
+            {"hello": hello, "use_cert": use_cert, "telemetry": telemetry, "finish": finish})
 
-    # Stop nginx
     stop_nginx()
 
 
@@ -15,17 +15,4 @@ sudo scp "${ROOT}/kex/prime256v1.pem" "client@${CLIENT_IP}:${CLIENT_DIR}" || {
     exit 1
 }
 
-sudo scp "${ROOT}/tmp/nginx/conf/ecdsap256_CA.crt" "client@${CLIENT_IP}:${CLIENT_DIR}" || {
-    echo "Error: Failed to copy ecdsap256_CA.crt"
-    exit 1
-}
-
-sudo scp "${ROOT}/tmp/nginx/conf/dilithium2_CA.crt" "client@${CLIENT_IP}:${CLIENT_DIR}" || {
-    echo "Error: Failed to copy dilithium2_CA.key"
-    exit 1
-}
-
-sudo scp "${ROOT}/tmp/nginx/conf/dilithium3_CA.crt" "client@${CLIENT_IP}:${CLIENT_DIR}" || {
-    echo "Error: Failed to copy dilithium3_CA.key"
-    exit 1
-}
\ No newline at end of file
+# CA certs reach the client over the control channel when it switches the server's certificate (see server.py)
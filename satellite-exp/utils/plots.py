@@ -1,7 +1,13 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+import glob
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "emulation-exp", "code", "utils"))
+from catalog import RunCatalog, import_directory  # noqa: E402
+from histogram import merge_files, print_summaries  # noqa: E402
 
 def compare_handshake_times(kyber_file, traditional_file):
     # Read the CSV files with no header
@@ -89,13 +95,33 @@ def compare_handshake_times(kyber_file, traditional_file):
     
     return plt.gcf()
 
+def sketch_statistics(sketch_paths, by=("algorithm",)):
+    """p50/p95/p99 per algorithm from the clients' latency sketches, merged across runs and hosts.
+
+    Unlike compare_handshake_times this needs no raw samples, but sketches
+    keep no outliers to drop, so the tails include retransmission stalls.
+    """
+    book = merge_files(sketch_paths).grouped(list(by))
+    print_summaries(book)
+    return {tuple(cell.values()): summary for cell, summary in book.summaries()}
+
 # Example usage:
 if __name__ == "__main__":
-    kyber_file = "../sat_data/kex/p256_kyber512_90s_696p944ms.csv"
-    traditional_file = "../sat_data/kex/prime256v1_696p944ms.csv"
-    fig = compare_handshake_times(kyber_file, traditional_file)
+    # The latest run of each algorithm, whatever RTT it measured
+    with RunCatalog("../sat_data/catalog.sqlite") as catalog:
+        import_directory(catalog, "kex", "../sat_data/kex", nominal_rtts=None, has_loss=False)
+        paths = catalog.paths(experiment="kex", algorithm=["p256_kyber512_90s", "prime256v1"])
+    if len(paths) < 2:
+        sys.exit("❌ The run catalog has no p256_kyber512_90s and prime256v1 runs to compare")
+    fig = compare_handshake_times(paths["p256_kyber512_90s"], paths["prime256v1"])
 
     if not os.path.exists("../sat_data/plots"):
         os.makedirs("../sat_data/plots")
 
     plt.savefig("../sat_data/plots/handshake_times_kex.png")
+
+    # Every run's sketches, also those whose CSV files are on another host
+    sketch_paths = glob.glob("../sat_data/kex/sketches/*.json")
+    if sketch_paths:
+        print("\nSketch statistics of all runs:")
+        sketch_statistics(sketch_paths)